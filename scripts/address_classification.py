@@ -0,0 +1,252 @@
+"""
+Residential / Commercial Address Classification
+Persistent on-disk cache of address hash -> verdict with TTL eviction,
+a pluggable classifier backend for cache misses, and the residential surcharge rule
+"""
+
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from address_normalize import address_fields, normalize_addresses, hash_addresses
+from audit_findings import make_findings
+from carriers import billed_charge
+
+# Verdict codes
+UNKNOWN = -1
+COMMERCIAL = 0
+RESIDENTIAL = 1
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'address_cache.db')
+DEFAULT_TTL_DAYS = 180
+
+
+# ========================================
+# PERSISTENT CACHE
+# ========================================
+
+class AddressCache:
+    """
+    SQLite-backed verdict cache keyed by 64-bit address hash
+    Live entries are held in sorted NumPy arrays so lookups are one searchsorted call
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Worker processes each open their own connection to one file; writers wait their turn
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS address_verdicts (
+                address_hash INTEGER PRIMARY KEY,
+                verdict INTEGER NOT NULL,
+                classified_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self._load()
+
+    @property
+    def ttl_days(self):
+        return self.ttl / 86400
+
+    def _load(self):
+        """Load every unexpired entry into the in-memory lookup arrays"""
+        cutoff = time.time() - self.ttl
+        rows = self.conn.execute(
+            "SELECT address_hash, verdict FROM address_verdicts WHERE classified_at >= ?",
+            (cutoff,)).fetchall()
+        data = np.array(rows, dtype='int64').reshape(-1, 2)
+        hashes = data[:, 0].view('uint64')
+        order = np.argsort(hashes)
+        self.hashes = hashes[order]
+        self.verdicts = data[order, 1]
+
+    def lookup(self, hashes):
+        """Verdict for each hash (UNKNOWN for misses and expired entries)"""
+        hashes = np.asarray(hashes, dtype='uint64')
+        result = np.full(len(hashes), UNKNOWN, dtype='int64')
+        if len(self.hashes) == 0:
+            return result
+        pos = np.searchsorted(self.hashes, hashes)
+        pos = np.minimum(pos, len(self.hashes) - 1)
+        hit = self.hashes[pos] == hashes
+        result[hit] = self.verdicts[pos[hit]]
+        return result
+
+    def fetch(self, hashes):
+        """
+        Verdicts for hashes missing from the lookup arrays, read from the
+        database (stored since loading, e.g. by another process) and merged in
+        """
+        hashes = np.asarray(hashes, dtype='uint64')
+        cutoff = time.time() - self.ttl
+        rows = []
+        # Batches stay under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500].view('int64').tolist()
+            rows += self.conn.execute(
+                f"SELECT address_hash, verdict FROM address_verdicts "
+                f"WHERE classified_at >= ? AND address_hash IN ({','.join('?' * len(batch))})",
+                [cutoff] + batch).fetchall()
+        if rows:
+            data = np.array(rows, dtype='int64').reshape(-1, 2)
+            self._merge(data[:, 0].view('uint64'), data[:, 1])
+        return self.lookup(hashes)
+
+    def store(self, hashes, verdicts):
+        """Persist new verdicts and merge them into the lookup arrays"""
+        hashes = np.asarray(hashes, dtype='uint64')
+        verdicts = np.asarray(verdicts, dtype='int64')
+        keep = verdicts != UNKNOWN
+        hashes, verdicts = hashes[keep], verdicts[keep]
+        if len(hashes) == 0:
+            return
+
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO address_verdicts VALUES (?, ?, ?)",
+            zip(hashes.view('int64').tolist(), verdicts.tolist(), [now] * len(hashes)))
+        self.conn.commit()
+        self._merge(hashes, verdicts)
+
+    def _merge(self, hashes, verdicts):
+        merged = pd.Series(np.concatenate([self.verdicts, verdicts]),
+                           index=np.concatenate([self.hashes, hashes]))
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        self.hashes = merged.index.to_numpy(dtype='uint64')
+        self.verdicts = merged.to_numpy(dtype='int64')
+
+    def evict_expired(self):
+        """Delete entries older than the TTL; returns the number removed"""
+        cutoff = time.time() - self.ttl
+        removed = self.conn.execute(
+            "DELETE FROM address_verdicts WHERE classified_at < ?", (cutoff,)).rowcount
+        self.conn.commit()
+        self._load()
+        return removed
+
+    def close(self):
+        self.conn.close()
+
+
+# ========================================
+# CLASSIFIER BACKENDS
+# ========================================
+
+class ClassifierBackend:
+    """
+    Base class for address classifiers (carrier address APIs, USPS RDI, ...)
+    classify_batch receives normalized address strings and returns verdict codes
+    """
+
+    batch_size = 500
+
+    def classify_batch(self, addresses):
+        raise NotImplementedError
+
+
+class StubClassifierBackend(ClassifierBackend):
+    """
+    Local keyword heuristic for testing: suite/floor/building style addresses
+    are commercial, everything else residential
+    """
+
+    COMMERCIAL_PATTERN = re.compile(
+        r'\b(STE|SUITE|FL|FLOOR|BLDG|BUILDING|DOCK|PLAZA|INDUSTRIAL|BUSINESS|'
+        r'OFFICE|CENTER|CTR|PARK|LLC|INC|CORP|CO)\b')
+
+    def classify_batch(self, addresses):
+        matches = pd.Series(addresses, dtype=object).str.contains(self.COMMERCIAL_PATTERN)
+        return np.where(matches.to_numpy(dtype=bool), COMMERCIAL, RESIDENTIAL)
+
+
+class AddressClassifier:
+    """
+    Classifies recipient addresses through the cache, sending only
+    distinct cache misses to the backend in batches
+    """
+
+    def __init__(self, cache=None, backend=None):
+        self.cache = cache if cache is not None else AddressCache()
+        self.backend = backend if backend is not None else StubClassifierBackend()
+        self.stats = {'rows': 0, 'distinct': 0, 'cache_hits': 0, 'classified': 0}
+
+    def spec(self):
+        """
+        Picklable recipe for this classifier (cache path, TTL, backend); worker
+        processes rebuild it with from_spec and open their own cache connection
+        """
+        return {'path': self.cache.path, 'ttl_days': self.cache.ttl_days, 'backend': self.backend}
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(AddressCache(spec['path'], spec['ttl_days']), spec['backend'])
+
+    def cache_key(self):
+        """Stable identity for rule_cache keys: backend class, cache file and TTL"""
+        backend = type(self.backend)
+        path = self.cache.path if self.cache.path == ':memory:' else os.path.abspath(self.cache.path)
+        return f'{backend.__module__}.{backend.__qualname__}:{path}:{self.cache.ttl_days:g}'
+
+    def classify(self, df, fields=None):
+        """Verdict code per row of df"""
+        normalized = normalize_addresses(df, fields)
+        hashes = hash_addresses(normalized)
+        codes, unique_hashes = pd.factorize(hashes)
+        verdicts = self.cache.lookup(unique_hashes)
+
+        misses = np.flatnonzero(verdicts == UNKNOWN)
+        if len(misses):
+            # Verdicts another process stored since this cache was loaded
+            verdicts[misses] = self.cache.fetch(unique_hashes[misses])
+            misses = misses[verdicts[misses] == UNKNOWN]
+        cache_hits = len(unique_hashes) - len(misses)
+        if len(misses):
+            # First normalized string for each distinct hash
+            first_row = np.full(len(unique_hashes), -1, dtype='int64')
+            first_row[codes[::-1]] = np.arange(len(codes))[::-1]
+            miss_addresses = normalized.to_numpy()[first_row[misses]]
+
+            step = self.backend.batch_size
+            for start in range(0, len(misses), step):
+                batch = misses[start:start + step]
+                verdicts[batch] = self.backend.classify_batch(miss_addresses[start:start + step])
+            self.cache.store(unique_hashes[misses], verdicts[misses])
+
+        self.stats['rows'] += len(df)
+        self.stats['distinct'] += len(unique_hashes)
+        self.stats['cache_hits'] += cache_hits
+        self.stats['classified'] += len(misses)
+        return verdicts[codes]
+
+
+# ========================================
+# RESIDENTIAL SURCHARGE RULE
+# ========================================
+
+def audit_residential_surcharge(df, classifier, surcharge_col=None, surcharges=None, carrier='UPS'):
+    """
+    Flag residential surcharges billed on addresses classified as commercial
+    The charge comes from the canonical surcharge table (any carrier; built
+    when omitted) unless a wide surcharge_col is named
+    Returns a findings frame (error type 'residential_incorrect')
+    """
+    billed = billed_charge(df, 'residential', surcharges, carrier, surcharge_col)
+    charged = billed > 0
+    if not charged.any() or address_fields(df) is None:
+        return make_findings(df, np.zeros(len(df), dtype=bool), 'Invalid Residential Surcharges',
+                             'residential_incorrect', 0, 0)
+
+    verdicts = np.full(len(df), UNKNOWN, dtype='int64')
+    verdicts[charged] = classifier.classify(df[charged])
+
+    mask = charged & (verdicts == COMMERCIAL)
+    return make_findings(df, mask, 'Invalid Residential Surcharges', 'residential_incorrect',
+                         billed, 0)
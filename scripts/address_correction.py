@@ -0,0 +1,136 @@
+"""
+Address Correction Fee Audit
+Normalizes original and corrected recipient addresses in bulk, deduplicated
+across the invoice and memoized across runs, and flags correction fees where
+nothing but formatting or the ZIP+4 changed
+"""
+
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from address_normalize import (ADDRESS_FIELD_SETS, ORIGINAL_ADDRESS_FIELD_SETS,
+                               NORMALIZATION_VERSION, address_fields, raw_address_keys,
+                               normalize_address_parts)
+from audit_findings import make_findings
+from carriers import billed_charge
+
+DEFAULT_MEMO_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'address_memo.db')
+
+# Fee columns in order of preference
+FEE_COLUMNS = ['Address_Correction_Fee', 'Ground Tracking ID Address Correction Gross Charge Amount']
+
+
+# ========================================
+# NORMALIZATION MEMO
+# ========================================
+
+class NormalizationMemo:
+    """
+    Persistent raw-address-hash -> normalized-address map
+    Entries written by an older NORMALIZATION_VERSION are ignored
+    """
+
+    def __init__(self, path=DEFAULT_MEMO_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS address_memo (
+                raw_hash INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL,
+                normalized TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+        rows = self.conn.execute("SELECT raw_hash, normalized FROM address_memo WHERE version = ?",
+                                 (NORMALIZATION_VERSION,)).fetchall()
+        hashes = np.array([r[0] for r in rows], dtype='int64').view('uint64')
+        self.entries = pd.Series([r[1] for r in rows], index=pd.Index(hashes), dtype=object)
+
+    def normalize(self, raw_keys):
+        """Normalized strings for distinct raw keys, normalizing only memo misses"""
+        raw_keys = np.asarray(raw_keys, dtype=object)
+        hashes = pd.util.hash_array(raw_keys, categorize=False)
+        pos = self.entries.index.get_indexer(hashes)
+
+        result = np.empty(len(raw_keys), dtype=object)
+        hit = pos >= 0
+        result[hit] = self.entries.to_numpy()[pos[hit]]
+
+        if not hit.all():
+            miss = ~hit
+            normalized = normalize_address_parts(raw_keys[miss]).to_numpy()
+            result[miss] = normalized
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO address_memo VALUES (?, ?, ?)",
+                zip(hashes[miss].view('int64').tolist(),
+                    [NORMALIZATION_VERSION] * int(miss.sum()), normalized.tolist()))
+            self.conn.commit()
+            self.entries = pd.concat([self.entries,
+                                      pd.Series(normalized, index=pd.Index(hashes[miss]))])
+        return result
+
+    def close(self):
+        self.conn.close()
+
+
+def normalize_address_pairs(df, original_fields, corrected_fields, memo=None):
+    """
+    Normalized (original, corrected) addresses per row
+    Both sides are deduplicated together so each distinct address is normalized once
+    """
+    original = raw_address_keys(df, original_fields)
+    corrected = raw_address_keys(df, corrected_fields)
+    codes, uniques = pd.factorize(pd.concat([original, corrected], ignore_index=True))
+
+    if memo is not None:
+        normalized = memo.normalize(uniques)
+    else:
+        normalized = normalize_address_parts(uniques).to_numpy()
+
+    values = normalized[codes]
+    return values[:len(df)], values[len(df):]
+
+
+# ========================================
+# ADDRESS CORRECTION RULE
+# ========================================
+
+def audit_address_correction(df, memo=None, fee_col=None, surcharges=None, carrier='UPS'):
+    """
+    Flag address correction fees where the corrected address is the original
+    address after normalization, or only the ZIP+4 changed
+    The fee comes from the canonical surcharge table (any carrier; built when
+    omitted), else from a FEE_COLUMNS column, unless fee_col is named
+    Returns a findings frame (error type 'invalid_surcharge')
+    """
+    billed = billed_charge(df, 'address_correction', surcharges, carrier, fee_col)
+    if fee_col is None and not billed.any():
+        # Fees billed outside the charge lines (FedEx Ground's gross amount column)
+        fee_col = next((c for c in FEE_COLUMNS if c in df.columns), None)
+        if fee_col is not None:
+            billed = billed_charge(df, 'address_correction', column=fee_col)
+    charged = billed > 0
+    corrected_fields = address_fields(df, ADDRESS_FIELD_SETS)
+    original_fields = address_fields(df, ORIGINAL_ADDRESS_FIELD_SETS)
+    if not charged.any() or corrected_fields is None or original_fields is None:
+        return make_findings(df, np.zeros(len(df), dtype=bool), 'Invalid Address Corrections',
+                             'invalid_surcharge', 0, 0)
+
+    has_original = df[original_fields[0]].notna().to_numpy()
+    rows = charged & has_original
+
+    mask = np.zeros(len(df), dtype=bool)
+    if rows.any():
+        original, corrected = normalize_address_pairs(df[rows], original_fields,
+                                                      corrected_fields, memo)
+        # Drop the trailing ZIP+4 so a ZIP+4-only change compares equal
+        original_base = pd.Series(original, dtype=object).str.rsplit('|', n=1).str[0]
+        corrected_base = pd.Series(corrected, dtype=object).str.rsplit('|', n=1).str[0]
+        mask[rows] = (original_base == corrected_base).to_numpy()
+
+    return make_findings(df, mask, 'Invalid Address Corrections', 'invalid_surcharge', billed, 0)
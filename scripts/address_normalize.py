@@ -0,0 +1,129 @@
+"""
+Address Normalization
+Vectorized normalization and hashing of recipient addresses
+Work is done once per distinct address string, then broadcast back to every row
+"""
+
+import numpy as np
+import pandas as pd
+
+# ========================================
+# ADDRESS FIELD LAYOUTS
+# ========================================
+
+# Recipient address fields per file layout: (line 1, line 2, city, state, postal code)
+ADDRESS_FIELD_SETS = [
+    ('Receiver_Address_1', 'Receiver_Address_2', 'Receiver_City',
+     'Receiver_State', 'Receiver_Postal_Code'),
+    ('Recipient Address Line 1', 'Recipient Address Line 2', 'Recipient City',
+     'Recipient State', 'Recipient Zip Code'),
+    ('Dest_Address', None, 'Dest_City', 'Dest_State', 'Dest_Zip'),
+]
+
+# Address as originally entered, before a carrier address correction (same order)
+ORIGINAL_ADDRESS_FIELD_SETS = [
+    ('Original_Receiver_Address_1', 'Original_Receiver_Address_2', 'Original_Receiver_City',
+     'Original_Receiver_State', 'Original_Receiver_Postal_Code'),
+    ('Original Recipient Address Line 1', 'Original Recipient Address Line 2',
+     'Original Recipient City', 'Original Recipient State', 'Original Recipient Zip Code'),
+]
+
+# USPS Publication 28 street suffix / directional abbreviations
+STREET_ABBREVIATIONS = {
+    'STREET': 'ST', 'AVENUE': 'AVE', 'BOULEVARD': 'BLVD', 'ROAD': 'RD',
+    'DRIVE': 'DR', 'LANE': 'LN', 'COURT': 'CT', 'CIRCLE': 'CIR',
+    'PLACE': 'PL', 'PARKWAY': 'PKWY', 'HIGHWAY': 'HWY', 'TERRACE': 'TER',
+    'TRAIL': 'TRL', 'SQUARE': 'SQ', 'EXPRESSWAY': 'EXPY', 'FREEWAY': 'FWY',
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+    'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW',
+}
+
+ABBREVIATION_PATTERN = r'\b(' + '|'.join(STREET_ABBREVIATIONS) + r')\b'
+
+# Secondary unit designators are collapsed to 'UNIT' so 'APT 4', 'STE 4' and '#4' match
+UNIT_PATTERN = r'(?:\b(?:APARTMENT|APT|UNIT|SUITE|STE|ROOM|RM|SPACE|SPC|LOT)\b\.?|#)\s*#?\s*([A-Z0-9-]+)'
+
+# Bump when normalization output changes so memoized results are not reused
+NORMALIZATION_VERSION = 1
+
+
+def address_fields(df, field_sets=ADDRESS_FIELD_SETS):
+    """Return the first recipient address field set present in df"""
+    for fields in field_sets:
+        if fields[0] in df.columns:
+            return tuple(f if f in df.columns else None for f in fields)
+    return None
+
+
+def raw_address_keys(df, fields):
+    """Join the raw address fields of every row into one delimited string"""
+    blank = pd.Series('', index=df.index, dtype=object)
+    parts = [df[f].fillna('').astype(str) if f else blank for f in fields]
+    joined = parts[0]
+    for part in parts[1:]:
+        joined = joined + '\x1f' + part
+    return joined
+
+
+# ========================================
+# NORMALIZATION
+# ========================================
+
+def normalize_street(values):
+    """Uppercase, strip punctuation, collapse whitespace and abbreviate suffixes"""
+    s = pd.Series(values, dtype=object).fillna('').astype(str).str.upper()
+    s = s.str.replace(r'[.,#]', ' ', regex=True)
+    s = s.str.replace(r'\s+', ' ', regex=True).str.strip()
+    return s.str.replace(ABBREVIATION_PATTERN,
+                         lambda m: STREET_ABBREVIATIONS[m.group(1)], regex=True)
+
+
+def split_zip(values):
+    """Split ZIP / ZIP+4 / delivery-point ZIP values into (zip5, zip4) digit strings"""
+    digits = pd.Series(values, dtype=object).fillna('').astype(str)
+    digits = digits.str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+    zip5 = digits.str.slice(0, 5).str.zfill(5).where(digits.str.len() > 0, '')
+    return zip5, digits.str.slice(5, 9)
+
+
+def normalize_zip5(values):
+    """First five digits of a ZIP / ZIP+4 / delivery-point ZIP"""
+    return split_zip(values)[0]
+
+
+def normalize_address_parts(raw_keys):
+    """
+    Full normalization of joined raw addresses (see raw_address_keys):
+    case, punctuation, suffix/directional abbreviations, unit designators, ZIP+4
+    Returns 'STREET|CITY|STATE|ZIP5|ZIP4' strings
+    """
+    split = pd.Series(raw_keys, dtype=object).str.split('\x1f', expand=True)
+    street = (split[0] + ' ' + split[1]).str.upper()
+    street = street.str.replace(UNIT_PATTERN, r' UNIT \1 ', regex=True)
+    street = normalize_street(street)
+    zip5, zip4 = split_zip(split[4])
+    return (street + '|' + normalize_street(split[2]) + '|' + split[3].str.upper().str.strip()
+            + '|' + zip5 + '|' + zip4)
+
+
+def normalize_addresses(df, fields=None):
+    """
+    One normalized key string per row: 'LINE1|LINE2|CITY|STATE|ZIP5'
+    Each distinct raw address is normalized only once
+    """
+    fields = fields or address_fields(df)
+    if fields is None:
+        raise ValueError("No recipient address columns found")
+
+    # Normalize the distinct address tuples only
+    codes, uniques = pd.factorize(raw_address_keys(df, fields))
+    split = pd.Series(uniques, dtype=object).str.split('\x1f', expand=True)
+    normalized = (normalize_street(split[0]) + '|' + normalize_street(split[1]) + '|'
+                  + normalize_street(split[2]) + '|' + split[3].str.upper().str.strip() + '|'
+                  + normalize_zip5(split[4]))
+    return pd.Series(normalized.to_numpy()[codes], index=df.index)
+
+
+def hash_addresses(normalized):
+    """Stable 64-bit hash per normalized address (same value across runs)"""
+    return pd.util.hash_array(np.asarray(normalized, dtype=object), categorize=True)
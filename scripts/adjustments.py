@@ -0,0 +1,235 @@
+"""
+Adjustment Reconciliation
+Matches post-ship adjustment / rebill records from later invoices back to the
+original shipment by tracking number (hash index, O(n)) and computes the
+per-shipment deltas: charge, audited vs entered weight, and dimension changes
+"""
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings, combine_findings
+from rerating import DOMESTIC_DIM_DIVISOR
+from invoice_sources import read_invoice_chunks
+
+WEIGHT_COLUMNS = ['Billed_Weight', 'Billable_Weight', 'Actual_Weight']
+DIM_COLUMNS = ['Length', 'Width', 'Height']
+
+# An adjustment this many times the entered weight / package volume is disputed
+INFLATION_RATIO = 3.0
+
+
+def _first_column(df, names):
+    return next((c for c in names if c in df.columns), None)
+
+
+def parse_dimensions(values):
+    """Split 'LxWxH' strings such as '72x54x30' into a (n, 3) float array"""
+    parts = pd.Series(values, dtype=object).astype(str).str.extract(
+        r'(\d+(?:\.\d+)?)\s*[xX*]\s*(\d+(?:\.\d+)?)\s*[xX*]\s*(\d+(?:\.\d+)?)')
+    return parts.astype('float64').to_numpy()
+
+
+def _dimensions(df, text_col=None):
+    """Package dimensions as a (n, 3) array, longest side first"""
+    if text_col and text_col in df.columns:
+        dims = parse_dimensions(df[text_col])
+    elif all(c in df.columns for c in DIM_COLUMNS):
+        dims = df[DIM_COLUMNS].to_numpy(dtype='float64')
+    else:
+        dims = np.full((len(df), 3), np.nan)
+    return -np.sort(-dims, axis=1)
+
+
+def split_adjustments(df, indicator_col='Rebill_Indicator'):
+    """Split a frame into (original shipments, adjustment records)"""
+    if indicator_col not in df.columns:
+        return df, df.iloc[0:0]
+    is_adjustment = df[indicator_col].astype(str).str.upper().str.strip().eq('Y').to_numpy()
+    return df[~is_adjustment], df[is_adjustment]
+
+
+# ========================================
+# ORIGINAL SHIPMENT INDEX
+# ========================================
+
+class ShipmentIndex:
+    """
+    Hash index of original shipments keyed by tracking number
+    Holds only the entered weight, dimensions and charge needed for deltas.
+    Batches are appended as-is and a dict maps each tracking number to its
+    latest row, so adding a batch costs O(batch) however large the index is
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self._batches = []
+        self._rows = 0
+        self._merged = None
+
+    def add(self, originals, dims_col=None):
+        """Index a batch of original shipments (later batches win on repeats)"""
+        if originals.empty:
+            return self
+        weight_col = _first_column(originals, WEIGHT_COLUMNS)
+        charge_col = _first_column(originals, ['Net_Charge', 'Original_Charge'])
+
+        tracking = originals['Tracking_Number'].astype(str).to_numpy()
+        weight = (originals[weight_col].to_numpy(dtype='float64') if weight_col
+                  else np.full(len(originals), np.nan))
+        charge = (originals[charge_col].to_numpy(dtype='float64') if charge_col
+                  else np.full(len(originals), np.nan))
+
+        # Repeats within the batch or against earlier batches repoint to the newest row
+        self._positions.update(zip(tracking, range(self._rows, self._rows + len(tracking))))
+        self._batches.append((weight, _dimensions(originals, dims_col), charge))
+        self._rows += len(tracking)
+        self._merged = None
+        return self
+
+    def _arrays(self):
+        """(tracking index, weight, dims, charge) of the live rows, merged once per lookup round"""
+        if self._merged is None:
+            rows = np.fromiter(self._positions.values(), dtype='int64', count=len(self._positions))
+            if self._batches:
+                weight, dims, charge = (np.concatenate(parts) for parts in zip(*self._batches))
+            else:
+                weight, dims, charge = np.empty(0), np.empty((0, 3)), np.empty(0)
+            self._merged = (pd.Index(list(self._positions), dtype=object),
+                            weight[rows], dims[rows], charge[rows])
+        return self._merged
+
+    @property
+    def tracking(self):
+        return self._arrays()[0]
+
+    @property
+    def weight(self):
+        return self._arrays()[1]
+
+    @property
+    def dims(self):
+        return self._arrays()[2]
+
+    @property
+    def charge(self):
+        return self._arrays()[3]
+
+    def lookup(self, tracking_numbers):
+        """Row position of each tracking number in the index (-1 if not found)"""
+        return self.tracking.get_indexer(pd.Index(np.asarray(tracking_numbers).astype(str),
+                                                  dtype=object))
+
+    def __len__(self):
+        return len(self._positions)
+
+
+# ========================================
+# RECONCILIATION
+# ========================================
+
+def reconcile_adjustments(index, adjustments, dims_col=None, divisor=DOMESTIC_DIM_DIVISOR):
+    """
+    Join one batch of adjustment records to their original shipments
+    Returns one row per adjustment with entered vs audited values and deltas
+    """
+    pos = index.lookup(adjustments['Tracking_Number'])
+    matched = pos >= 0
+    safe = np.where(matched, pos, 0)
+
+    def from_index(values):
+        out = values[safe].astype('float64')
+        out[~matched] = np.nan
+        return out
+
+    weight_col = _first_column(adjustments, WEIGHT_COLUMNS)
+    audited_weight = (adjustments[weight_col].to_numpy(dtype='float64') if weight_col
+                      else np.full(len(adjustments), np.nan))
+    entered_weight = from_index(index.weight)
+
+    audited_dims = _dimensions(adjustments, dims_col)
+    entered_dims = index.dims[safe].copy()
+    entered_dims[~matched] = np.nan
+
+    original_charge = (adjustments['Original_Charge'].to_numpy(dtype='float64')
+                       if 'Original_Charge' in adjustments.columns else from_index(index.charge))
+    original_charge = np.where(np.isnan(original_charge), from_index(index.charge), original_charge)
+    adjusted_charge = (adjustments['Adjusted_Charge'].to_numpy(dtype='float64')
+                       if 'Adjusted_Charge' in adjustments.columns
+                       else np.full(len(adjustments), np.nan))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_ratio = audited_weight / entered_weight
+        volume_ratio = audited_dims.prod(axis=1) / entered_dims.prod(axis=1)
+
+    result = pd.DataFrame({
+        'Tracking_Number': adjustments['Tracking_Number'].to_numpy(),
+        'Matched': matched,
+        'Adjustment_Reason': (adjustments['Adjustment_Reason'].to_numpy()
+                              if 'Adjustment_Reason' in adjustments.columns else None),
+        'Original_Charge': original_charge,
+        'Adjusted_Charge': adjusted_charge,
+        'Charge_Delta': adjusted_charge - original_charge,
+        'Entered_Weight': entered_weight,
+        'Audited_Weight': audited_weight,
+        'Weight_Delta': audited_weight - entered_weight,
+        'Weight_Ratio': weight_ratio,
+        'Entered_Dimensions': entered_dims.tolist(),
+        'Audited_Dimensions': audited_dims.tolist(),
+        'Dims_Changed': (~np.all(np.isclose(audited_dims, entered_dims, atol=0.5), axis=1)
+                         & ~np.isnan(audited_dims).any(axis=1)
+                         & ~np.isnan(entered_dims).any(axis=1)),
+        'Volume_Ratio': volume_ratio,
+        'Audited_Dim_Weight': np.ceil(audited_dims.prod(axis=1) / divisor),
+    }, index=adjustments.index)
+
+    result['Gross_Inflation'] = (matched & (result['Charge_Delta'].to_numpy() > 0)
+                                 & ((np.nan_to_num(weight_ratio) >= INFLATION_RATIO)
+                                    | (np.nan_to_num(volume_ratio) >= INFLATION_RATIO)))
+    return result
+
+
+def stream_reconciliation(original_frames, adjustment_frames, dims_col=None):
+    """
+    Build the index from original shipments, then stream adjustment batches
+    through it; yields one reconciliation frame per adjustment batch
+    """
+    index = ShipmentIndex()
+    for frame in original_frames:
+        originals, _ = split_adjustments(frame)
+        index.add(originals, dims_col)
+
+    for frame in adjustment_frames:
+        _, adjustments = split_adjustments(frame)
+        if not adjustments.empty:
+            yield reconcile_adjustments(index, adjustments, dims_col)
+
+
+def invoice_chunks(paths, chunksize=100000):
+    """Frames of invoice files (plain, compressed or archived), chunk by chunk"""
+    for path in paths:
+        yield from read_invoice_chunks(path, chunksize=chunksize, dtype={'Tracking_Number': str})
+
+
+def reconcile_files(original_paths, adjustment_paths, dims_col=None, chunksize=100000):
+    """stream_reconciliation over invoice files, chunk by chunk"""
+    return stream_reconciliation(invoice_chunks(original_paths, chunksize),
+                                 invoice_chunks(adjustment_paths, chunksize), dims_col)
+
+
+def adjustment_findings(reconciled):
+    """
+    Disputable adjustments as findings: grossly inflated weight/dimension
+    adjustments, priced at the charge increase
+    """
+    frames = []
+    inflated = reconciled['Gross_Inflation'].to_numpy()
+    dims = reconciled['Dims_Changed'].to_numpy()
+    billed = reconciled['Adjusted_Charge'].to_numpy()
+    expected = reconciled['Original_Charge'].to_numpy()
+
+    frames.append(make_findings(reconciled, inflated & dims, 'Inflated Dimension Adjustment',
+                                'dim_weight', billed, expected))
+    frames.append(make_findings(reconciled, inflated & ~dims, 'Inflated Weight Adjustment',
+                                'weight_mismatch', billed, expected))
+    return combine_findings(frames)
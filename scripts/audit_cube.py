@@ -0,0 +1,200 @@
+"""
+Audit Cube
+Pre-aggregated audit totals keyed by account x month x carrier x service x
+zone x error type (shipment count, billed and recovered cents), kept in one
+columnar .npz file. Cells are aggregated per invoice and tagged with the
+invoice's content hash, so re-auditing an invoice under changed rules
+replaces its cells; dashboard drill-downs and roll-ups are group-bys over the
+cube's cells and never touch shipment-level data
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one writer at a time is up to the caller
+    fcntl = None
+
+from carriers import normalize_shipments
+from rule_cache import content_hash
+
+DEFAULT_CUBE_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'audit_cube.npz')
+CUBE_VERSION = 2
+
+DIMENSIONS = ['Account', 'Month', 'Carrier', 'Service', 'Zone', 'Error_Type']
+MEASURES = ['Count', 'Billed_Cents', 'Recovered_Cents']
+# Content hash of the invoice a cell came from (not a query dimension)
+INVOICE = 'Invoice'
+KEYS = DIMENSIONS + [INVOICE]
+
+# Error_Type of the cells holding every shipment's totals (findings cells use
+# audit_findings.ERROR_TYPES); roll-ups over Error_Type must pick one or the other
+ALL_SHIPMENTS = 'all_shipments'
+
+# Month column by preference
+MONTH_COLUMNS = ['Invoice_Date', 'Ship_Date']
+
+
+def _cents(values):
+    return np.rint(np.nan_to_num(np.asarray(values, dtype='float64')) * 100).astype('int64')
+
+
+def shipment_dimensions(df, shipments=None):
+    """Account, Month, Carrier, Service and Zone per shipment row, indexed like df"""
+    shipments = normalize_shipments(df) if shipments is None else shipments
+    month_col = next((c for c in MONTH_COLUMNS if c in df.columns), None)
+    dates = (pd.to_datetime(df[month_col], errors='coerce') if month_col
+             else pd.Series(pd.NaT, index=df.index))
+
+    def text(values):
+        return pd.Series(values, index=df.index).astype(object).where(pd.notna(values), '').astype(str)
+
+    return pd.DataFrame({
+        'Account': text(shipments['Account_Number']),
+        'Month': dates.dt.strftime('%Y-%m').fillna(''),
+        'Carrier': text(shipments['Carrier']).str.upper(),
+        'Service': text(shipments['Service_Type']),
+        'Zone': text(shipments['Zone']),
+    }, index=df.index)
+
+
+def rules_digest(rule_keys):
+    """One hash of an audit's rule keys (UPSBillingAnalyzer.rule_keys())"""
+    return hashlib.sha1(json.dumps(rule_keys or {}, sort_keys=True).encode()).hexdigest()[:16]
+
+
+@contextlib.contextmanager
+def cube_lock(path=DEFAULT_CUBE_PATH):
+    """
+    Exclusive lock for a load-add-save of the cube at path (a .lock file next
+    to it), so concurrent audits do not overwrite each other's invoices
+    """
+    if os.path.dirname(os.path.abspath(path)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def invoice_cells(df, findings, shipments=None):
+    """
+    Cube cells for one audited invoice: ALL_SHIPMENTS cells (count, billed
+    net charge) plus one cell per dimension tuple and error type of findings
+    """
+    shipments = normalize_shipments(df) if shipments is None else shipments
+    dims = shipment_dimensions(df, shipments)
+
+    totals = dims.assign(Error_Type=ALL_SHIPMENTS, Count=1,
+                         Billed_Cents=shipments['Net_Cents'].to_numpy(), Recovered_Cents=0)
+    frames = [totals]
+    if findings is not None and len(findings):
+        positions = dims.index.get_indexer(findings.index)
+        found = positions >= 0
+        flagged = dims.iloc[positions[found]].reset_index(drop=True)
+        frames.append(flagged.assign(
+            Error_Type=findings['Error_Type'].to_numpy()[found], Count=1,
+            Billed_Cents=_cents(findings['Billed_Amount'].to_numpy()[found]),
+            Recovered_Cents=_cents(findings['Recovery_Amount'].to_numpy()[found])))
+
+    cells = pd.concat(frames, ignore_index=True)
+    return cells.groupby(DIMENSIONS, sort=False)[MEASURES].sum().reset_index()
+
+
+class AuditCube:
+    """
+    The cube's cells in memory; dimensions dictionary-encoded as in the file
+    add() folds in an invoice (replacing its cells when the rules changed),
+    save() rewrites the file atomically, query() answers roll-ups and
+    drill-downs. Hold cube_lock() from loading until save() when several
+    processes add to one cube
+    """
+
+    def __init__(self, path=DEFAULT_CUBE_PATH):
+        self.path = path
+        # Content hash -> rules digest of the audit its cells came from
+        self.invoices = {}
+        self.cells = pd.DataFrame({**{k: pd.Categorical([]) for k in KEYS},
+                                   **{m: np.array([], dtype='int64') for m in MEASURES}})
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] != CUBE_VERSION:
+                raise ValueError(f"{self.path} is cube version {meta['version']}, "
+                                 f"this version reads {CUBE_VERSION}; rebuild the cube")
+            self.invoices = meta['invoices']
+            columns = {k: pd.Categorical.from_codes(data[f'{k}.codes'], meta['dictionaries'][k])
+                       for k in KEYS}
+            columns.update({m: data[m] for m in MEASURES})
+        self.cells = pd.DataFrame(columns)
+
+    def save(self):
+        meta = {'version': CUBE_VERSION, 'invoices': self.invoices,
+                'dictionaries': {k: self.cells[k].cat.categories.tolist() for k in KEYS}}
+        arrays = {f'{k}.codes': self.cells[k].cat.codes.to_numpy() for k in KEYS}
+        arrays.update({m: self.cells[m].to_numpy(dtype='int64') for m in MEASURES})
+        if os.path.dirname(os.path.abspath(self.path)):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Written next to the cube and renamed, so readers never see a partial file
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, self.path)
+
+    def add(self, df, findings, shipments=None, rule_keys=None):
+        """
+        Fold an audited invoice into the cube. rule_keys (the analyzer's
+        rule_keys()) identify the rules behind findings: an invoice already
+        added under other rules has its cells replaced. Returns False if the
+        invoice was already added under the same rules
+        """
+        digest, rules = content_hash(df), rules_digest(rule_keys)
+        if self.invoices.get(digest) == rules:
+            return False
+        cells = invoice_cells(df, findings, shipments).assign(**{INVOICE: digest})
+        kept = self.cells[(self.cells[INVOICE] != digest).to_numpy()]
+        merged = pd.concat([kept.astype({k: object for k in KEYS}), cells], ignore_index=True)
+        self.cells = merged.astype({k: 'category' for k in KEYS})
+        self.invoices[digest] = rules
+        return True
+
+    def query(self, by=(), error_types=None, **where):
+        """
+        Totals grouped by the given dimensions, over cells matching where
+        (dimension=value or dimension=[values]). error_types defaults to every
+        findings type; pass [ALL_SHIPMENTS] for shipment totals. Amounts in dollars
+        """
+        unknown = (set(by) | set(where)) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown cube dimensions: {sorted(unknown)}")
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        if error_types is None:
+            mask &= (cells['Error_Type'] != ALL_SHIPMENTS).to_numpy()
+        else:
+            error_types = [error_types] if isinstance(error_types, str) else list(error_types)
+            mask &= cells['Error_Type'].isin(error_types).to_numpy()
+        for dim, value in where.items():
+            values = [value] if isinstance(value, str) else list(value)
+            mask &= cells[dim].isin([str(v) for v in values]).to_numpy()
+
+        selected = cells[mask]
+        if by:
+            result = selected.groupby(list(by), observed=True, sort=True)[MEASURES].sum()
+        else:
+            result = selected[MEASURES].sum().to_frame('Total').T
+        result['Billed'] = result.pop('Billed_Cents') / 100
+        result['Recovered'] = result.pop('Recovered_Cents') / 100
+        return result
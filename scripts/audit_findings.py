@@ -0,0 +1,100 @@
+"""
+Audit Findings
+Shared per-shipment findings format used by the audit rules
+Each finding is one shipment/charge with billed, expected and recoverable amounts
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns every findings frame carries (index is the source row index)
+FINDING_COLUMNS = [
+    'Tracking_Number',
+    'Rule',             # Human readable rule name, e.g. 'Dimensional Weight Error'
+    'Error_Type',       # audit_errors.error_type value from database-schema.sql
+    'Billed_Amount',
+    'Expected_Amount',
+    'Recovery_Amount',
+]
+
+# Error types allowed by the audit_errors table
+ERROR_TYPES = [
+    'dim_weight', 'duplicate_charge', 'wrong_rate', 'invalid_surcharge',
+    'late_delivery', 'wrong_zone', 'residential_incorrect',
+    'fuel_overcharge', 'accessorial_invalid', 'weight_mismatch'
+]
+
+
+def empty_findings():
+    """Return an empty findings frame with the standard columns"""
+    return pd.DataFrame({col: pd.Series(dtype='float64' if col.endswith('_Amount') else 'object')
+                         for col in FINDING_COLUMNS})
+
+
+def make_findings(df, mask, rule, error_type, billed, expected):
+    """
+    Build a findings frame for the rows selected by mask
+    billed/expected are arrays aligned with df; recovery is billed - expected (never negative)
+    """
+    if error_type not in ERROR_TYPES:
+        raise ValueError(f"Unknown error type: {error_type}")
+
+    mask = np.asarray(mask, dtype=bool)
+    if not mask.any():
+        return empty_findings()
+
+    billed = np.broadcast_to(np.asarray(billed, dtype='float64'), mask.shape)[mask]
+    expected = np.broadcast_to(np.asarray(expected, dtype='float64'), mask.shape)[mask]
+    if 'Tracking_Number' in df.columns:
+        tracking = df['Tracking_Number'].to_numpy()[mask]
+    else:
+        tracking = np.full(mask.sum(), None, dtype=object)
+
+    return pd.DataFrame({
+        'Tracking_Number': tracking,
+        'Rule': rule,
+        'Error_Type': error_type,
+        'Billed_Amount': np.round(billed, 2),
+        'Expected_Amount': np.round(expected, 2),
+        'Recovery_Amount': np.round(np.maximum(billed - expected, 0), 2),
+    }, index=df.index[mask])
+
+
+def combine_findings(frames):
+    """Concatenate findings frames from several rules"""
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return empty_findings()
+    return pd.concat(frames)
+
+
+def top_k_positions(values, k):
+    """Positions of the k largest values, largest first (argpartition, no full sort)"""
+    values = np.asarray(values, dtype='float64')
+    if len(values) > k:
+        candidates = np.argpartition(values, len(values) - k)[len(values) - k:]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(values[candidates], kind='stable')[::-1]]
+
+
+def summarize_findings(findings, sample_size=5):
+    """
+    Collapse per-shipment findings into the overcharge summary dicts
+    used by UPSBillingAnalyzer (type, count, potential_savings, affected_shipments)
+    """
+    summaries = []
+    if findings is None or findings.empty:
+        return summaries
+
+    for rule, group in findings.groupby('Rule', sort=False):
+        recovery = group['Recovery_Amount'].to_numpy()
+        # Largest recoveries first so the sample is the best dispute evidence
+        top = top_k_positions(recovery, sample_size)
+        summaries.append({
+            'type': rule,
+            'count': len(group),
+            'potential_savings': float(recovery.sum()),
+            'affected_shipments': group['Tracking_Number'].iloc[top].tolist()
+        })
+    return summaries
@@ -0,0 +1,266 @@
+"""
+Carrier Adapters
+Turns any carrier's invoice frame into one canonical shipment table (one row
+per shipment) and one long surcharge table (one row per billed charge) with
+canonical charge codes and integer-cent amounts. Audit rules read the
+canonical tables, so a rule is written once and every carrier gets it
+"""
+
+import numpy as np
+import pandas as pd
+
+from charge_normalizer import CODE_LIST, get_normalizer
+
+SHIPMENT_COLUMNS = ['Carrier', 'Account_Number', 'Invoice_Number', 'Tracking_Number', 'Ship_Date',
+                    'Service_Type', 'Zone', 'Actual_Weight', 'Billed_Weight', 'Length', 'Width',
+                    'Height']
+SURCHARGE_COLUMNS = ['Row', 'Carrier', 'Tracking_Number', 'Charge_Code', 'Amount_Cents', 'Source']
+
+# Ship date column by preference (canonical name first)
+SHIP_DATE_COLUMNS = ['Ship_Date', 'Pickup_Date', 'Invoice_Date']
+
+
+def to_cents(values):
+    """Dollar amounts -> int64 cents (missing/unparseable -> 0)"""
+    dollars = pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors='coerce')
+    return np.rint(dollars.fillna(0).to_numpy(dtype='float64') * 100).astype('int64')
+
+
+def _long_table(index, tracking, carrier, codes, cents, sources):
+    """codes: int8 positions in CODE_LIST"""
+    return pd.DataFrame({
+        'Row': index,
+        'Carrier': carrier,
+        'Tracking_Number': tracking,
+        'Charge_Code': pd.Categorical.from_codes(codes, CODE_LIST),
+        'Amount_Cents': cents,
+        'Source': sources,
+    }, columns=SURCHARGE_COLUMNS)
+
+
+# ========================================
+# ADAPTERS
+# ========================================
+
+class CarrierAdapter:
+    """
+    Base adapter: canonical shipment columns are taken as-is (the layout
+    registry already renamed them) and wide charge columns are melted
+    charge_columns: raw charge column -> canonical charge code
+    surcharges() takes an optional charge_normalizer.ChargeNormalizer
+    (the shared one when omitted)
+    """
+
+    carrier = None
+    charge_columns = {}
+
+    def shipments(self, df):
+        """Canonical shipment table, indexed like df, with int-cent totals"""
+        table = pd.DataFrame(index=df.index)
+        for col in SHIPMENT_COLUMNS:
+            table[col] = df[col] if col in df.columns else np.nan
+        table['Carrier'] = df['Carrier'] if 'Carrier' in df.columns else self.carrier
+        ship_date = next((c for c in SHIP_DATE_COLUMNS if c in df.columns), None)
+        table['Ship_Date'] = pd.to_datetime(df[ship_date], errors='coerce') if ship_date else pd.NaT
+        for col in ['Actual_Weight', 'Billed_Weight', 'Length', 'Width', 'Height']:
+            table[col] = pd.to_numeric(table[col], errors='coerce')
+        for col, cents in [('Published_Charge', 'Published_Cents'), ('Net_Charge', 'Net_Cents')]:
+            table[cents] = to_cents(df[col]) if col in df.columns else np.zeros(len(df), 'int64')
+        return table
+
+    def surcharges(self, df, normalizer=None):
+        """Long surcharge table: one row per non-zero charge column value"""
+        return self._wide_charges(df)
+
+    def _wide_charges(self, df):
+        columns = [c for c in self.charge_columns if c in df.columns]
+        if not columns:
+            return empty_surcharges()
+        amounts = df[columns].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype='float64')
+        rows, cols = np.nonzero(amounts)
+        codes = np.array([CODE_LIST.index(self.charge_columns[c]) for c in columns], dtype='int8')
+        tracking = self._tracking(df)
+        return _long_table(df.index[rows], tracking[rows], self.carrier, codes[cols],
+                           np.rint(amounts[rows, cols] * 100).astype('int64'),
+                           np.array(columns, dtype=object)[cols])
+
+    @staticmethod
+    def _tracking(df):
+        if 'Tracking_Number' in df.columns:
+            return df['Tracking_Number'].astype(str).to_numpy(dtype=object)
+        return np.full(len(df), '', dtype=object)
+
+
+class UPSAdapter(CarrierAdapter):
+    """UPS analyzer CSV and 250-column billing file (one column per surcharge)"""
+
+    carrier = 'UPS'
+    charge_columns = {
+        'Fuel_Surcharge': 'fuel',
+        'Residential_Surcharge': 'residential',
+        'Delivery_Area_Surcharge': 'delivery_area',
+        'Extended_Area_Surcharge': 'extended_area',
+        'Remote_Area_Surcharge': 'remote_area',
+        'Additional_Handling': 'additional_handling',
+        'Large_Package_Surcharge': 'large_package',
+        'Over_Maximum_Limits': 'over_maximum',
+        'Peak_Surcharge': 'peak',
+        'Peak_Additional_Handling': 'peak_additional_handling',
+        'Peak_Large_Package': 'peak_large_package',
+        'Peak_Over_Maximum': 'peak_over_maximum',
+        'Address_Correction_Fee': 'address_correction',
+        'Signature_Required': 'signature',
+        'Adult_Signature_Required': 'adult_signature',
+        'Delivery_Confirmation': 'delivery_confirmation',
+        'Saturday_Delivery_Fee': 'saturday_delivery',
+        'Early_AM_Delivery': 'early_am',
+    }
+    # Charge-line files: one row per charge with a UPS numeric surcharge code
+    charge_line_columns = ('Charge_Code', 'Charge_Amount')
+
+    def surcharges(self, df, normalizer=None):
+        code_col, amount_col = self.charge_line_columns
+        if code_col not in df.columns or amount_col not in df.columns:
+            return self._wide_charges(df)
+
+        cents = to_cents(df[amount_col])
+        lines = np.nonzero(cents)[0]
+        codes = (normalizer or get_normalizer()).encode_ups_codes(
+            df[code_col].to_numpy(dtype=object)[lines], cents[lines])
+        tracking = self._tracking(df)
+        lines_table = _long_table(df.index[lines], tracking[lines], self.carrier, codes,
+                                  cents[lines], df[code_col].astype(str).to_numpy(dtype=object)[lines])
+        wide = self._wide_charges(df)
+        return lines_table if not len(wide) else pd.concat([wide, lines_table], ignore_index=True)
+
+
+class FedExAdapter(CarrierAdapter):
+    """FedEx invoice export: up to ~50 description/amount column pairs per shipment"""
+
+    carrier = 'FEDEX'
+    description_prefix = 'Tracking ID Charge Description'
+    amount_prefix = 'Tracking ID Charge Amount'
+
+    def charge_pairs(self, df):
+        """(description column, amount column) pairs present in df"""
+        pairs = [(c, self.amount_prefix + c[len(self.description_prefix):])
+                 for c in df.columns if isinstance(c, str) and c.startswith(self.description_prefix)]
+        return [(d, a) for d, a in pairs if a in df.columns]
+
+    def surcharges(self, df, normalizer=None):
+        pairs = self.charge_pairs(df)
+        if not pairs:
+            return empty_surcharges()
+        descriptions = df[[d for d, _ in pairs]].to_numpy(dtype=object)
+        amounts = df[[a for _, a in pairs]].apply(pd.to_numeric, errors='coerce').fillna(0) \
+            .to_numpy(dtype='float64')
+        rows, cols = np.nonzero(amounts)
+        billed = descriptions[rows, cols]
+        cents = np.rint(amounts[rows, cols] * 100).astype('int64')
+        # Distinct descriptions are resolved once, codes broadcast back per line
+        codes = (normalizer or get_normalizer()).encode(billed, cents)
+        tracking = self._tracking(df)
+        return _long_table(df.index[rows], tracking[rows], self.carrier, codes, cents, billed)
+
+
+class DHLAdapter(CarrierAdapter):
+    """DHL Express invoice (one column per surcharge)"""
+
+    carrier = 'DHL'
+    charge_columns = {
+        'Fuel Surcharge': 'fuel',
+        'Remote Area Delivery': 'remote_area',
+        'Oversize Piece': 'large_package',
+        'Overweight Piece': 'additional_handling_weight',
+        'Demand Surcharge': 'peak',
+        'Address Correction': 'address_correction',
+        'Signature Required': 'signature',
+        'Adult Signature': 'adult_signature',
+        'Saturday Delivery': 'saturday_delivery',
+    }
+
+
+class USPSAdapter(CarrierAdapter):
+    """USPS postage export (postage only, no surcharge breakdown)"""
+
+    carrier = 'USPS'
+
+
+ADAPTERS = {adapter.carrier: adapter for adapter in
+            (UPSAdapter(), FedExAdapter(), DHLAdapter(), USPSAdapter())}
+
+
+def empty_surcharges():
+    return _long_table(pd.Index([]), np.array([], dtype=object), None,
+                       np.array([], dtype='int8'), np.array([], dtype='int64'),
+                       np.array([], dtype=object))
+
+
+def get_adapter(carrier):
+    """Adapter for a carrier name (UPS when unknown)"""
+    return ADAPTERS.get(str(carrier).upper(), ADAPTERS['UPS'])
+
+
+# ========================================
+# NORMALIZATION
+# ========================================
+
+def _carrier_groups(df, carrier):
+    if 'Carrier' not in df.columns:
+        yield get_adapter(carrier), df
+        return
+    carriers = df['Carrier'].astype(str).str.upper()
+    for name in carriers.unique():
+        yield get_adapter(name), df[(carriers == name).to_numpy()]
+
+
+def normalize_shipments(df, carrier='UPS'):
+    """Canonical shipment table for a single- or mixed-carrier invoice frame"""
+    tables = [adapter.shipments(part) for adapter, part in _carrier_groups(df, carrier)]
+    return tables[0] if len(tables) == 1 else pd.concat(tables).reindex(df.index)
+
+
+def normalize_surcharges(df, carrier='UPS', normalizer=None):
+    """Long surcharge table (Row = source row label) for an invoice frame"""
+    tables = [adapter.surcharges(part, normalizer) for adapter, part in _carrier_groups(df, carrier)]
+    tables = [t for t in tables if len(t)]
+    if not tables:
+        return empty_surcharges()
+    return tables[0] if len(tables) == 1 else pd.concat(tables, ignore_index=True)
+
+
+def normalize(df, carrier='UPS', normalizer=None):
+    """(shipments, surcharges) canonical tables for an invoice frame"""
+    return normalize_shipments(df, carrier), normalize_surcharges(df, carrier, normalizer)
+
+
+def charge_amounts(surcharges, index, codes):
+    """
+    Billed dollars per canonical charge code, aligned to index
+    Returns {code: float64 array}; codes never billed are omitted
+    """
+    present = surcharges[surcharges['Charge_Code'].isin(codes)]
+    positions = pd.Index(index).get_indexer(present['Row'])
+    result = {}
+    for code in codes:
+        mask = (present['Charge_Code'] == code).to_numpy() & (positions >= 0)
+        if mask.any():
+            cents = np.bincount(positions[mask], weights=present['Amount_Cents'].to_numpy()[mask],
+                                minlength=len(index))
+            result[code] = cents / 100
+    return result
+
+
+def billed_charge(df, code, surcharges=None, carrier='UPS', column=None):
+    """
+    Billed dollars of one canonical charge code per row of df (zeros when never
+    billed): from the canonical surcharge table (built when omitted), or from
+    the named wide column when one is given
+    """
+    if column is not None:
+        if column not in df.columns:
+            return np.zeros(len(df))
+        return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    if surcharges is None:
+        surcharges = normalize_surcharges(df, carrier)
+    return charge_amounts(surcharges, df.index, [code]).get(code, np.zeros(len(df)))
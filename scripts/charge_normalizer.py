@@ -0,0 +1,220 @@
+"""
+Charge Description Normalizer
+Maps raw carrier charge descriptions (FedEx 'AHS - Dimensions', 'DAS Remote
+Residential', ...) and UPS numeric surcharge codes to canonical charge codes.
+A column of charge lines is factorized once and only its distinct values go
+through the alias table (then a fuzzy fallback), so cost scales with the
+number of distinct descriptions, not lines. Fuzzy matches are only
+suggestions: rules see them as 'other' until the alias is curated. Fuzzy and
+unresolved descriptions are tallied for curation
+"""
+
+import difflib
+import re
+
+import numpy as np
+import pandas as pd
+
+# Canonical charge codes
+CHARGE_CODES = {
+    'fuel': 'Fuel Surcharge',
+    'residential': 'Residential Surcharge',
+    'delivery_area': 'Delivery Area Surcharge',
+    'extended_area': 'Extended Area Surcharge',
+    'remote_area': 'Remote Area Surcharge',
+    'additional_handling': 'Additional Handling',
+    'additional_handling_dims': 'Additional Handling - Dimensions',
+    'additional_handling_weight': 'Additional Handling - Weight',
+    'additional_handling_packaging': 'Additional Handling - Packaging',
+    'large_package': 'Large Package Surcharge',
+    'over_maximum': 'Over Maximum Limits',
+    'peak': 'Peak/Demand Surcharge',
+    'peak_additional_handling': 'Peak - Additional Handling',
+    'peak_large_package': 'Peak - Large Package',
+    'peak_over_maximum': 'Peak - Over Maximum',
+    'address_correction': 'Address Correction',
+    'signature': 'Signature Required',
+    'adult_signature': 'Adult Signature Required',
+    'delivery_confirmation': 'Delivery Confirmation',
+    'saturday_delivery': 'Saturday Delivery',
+    'early_am': 'Early AM Delivery',
+    'pickup': 'Pickup Charge',
+    'discount': 'Discount',
+    'other': 'Other Charge',
+}
+
+CODE_LIST = list(CHARGE_CODES)
+OTHER = CODE_LIST.index('other')
+
+# Minimum difflib ratio for a fuzzy match against a known alias
+FUZZY_CUTOFF = 0.8
+
+# Known description -> canonical charge code (matched after normalize_description)
+DEFAULT_ALIASES = {
+    # FedEx
+    'DAS Resi': 'delivery_area',
+    'DAS Comm': 'delivery_area',
+    'DAS Extended Resi': 'extended_area',
+    'DAS Extended Commercial': 'extended_area',
+    'DAS Remote Residential': 'remote_area',
+    'DAS Remote Comm': 'remote_area',
+    'Residential': 'residential',
+    'AHS - Dimensions': 'additional_handling_dims',
+    "Add'l Handling-Dimension": 'additional_handling_dims',
+    'AHS - Weight': 'additional_handling_weight',
+    "Add'l Handling-Weight": 'additional_handling_weight',
+    'AHS - Packaging': 'additional_handling_packaging',
+    'Oversize Charge': 'large_package',
+    'Unauthorized Package Charge': 'over_maximum',
+    'Demand Surcharge': 'peak',
+    'Peak Surcharge': 'peak',
+    "Demand-Add'l Handling": 'peak_additional_handling',
+    'Demand-Large Package': 'peak_large_package',
+    'Demand-Unauthorized': 'peak_over_maximum',
+    'Direct Signature Required': 'signature',
+    'Indirect Signature Required': 'signature',
+    'Weekly Service Chg': 'pickup',
+    'Regularly Scheduled Pickup Mon-Fri': 'pickup',
+    'Earned Discount': 'discount',
+    'Performance Pricing': 'discount',
+    'Grace Discount': 'discount',
+    # UPS (descriptions of UPS_SURCHARGE_CODES)
+    'Additional Handling - Length': 'additional_handling_dims',
+    'Additional Handling - Width': 'additional_handling_dims',
+    'Additional Handling - Weight': 'additional_handling_weight',
+    'Additional Handling - Packaging': 'additional_handling_packaging',
+    'Address Correction - Residential': 'address_correction',
+    'Remote Area - Commercial': 'remote_area',
+    'Remote Area - Residential': 'remote_area',
+    'Large Package - Commercial': 'large_package',
+    'Large Package - Residential': 'large_package',
+    'Over Maximum Weight': 'over_maximum',
+    'Over Maximum Size': 'over_maximum',
+    'Saturday Pickup': 'pickup',
+    'Delivery Area Surcharge - Extended': 'extended_area',
+    'Delivery Area Surcharge - Remote': 'remote_area',
+    # DHL
+    'Remote Area Delivery': 'remote_area',
+    'Oversize Piece': 'large_package',
+    'Overweight Piece': 'additional_handling_weight',
+    'Adult Signature': 'adult_signature',
+}
+
+
+def normalize_description(text):
+    """Matching key: lower case, punctuation and runs of spaces collapsed"""
+    return re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+
+
+class ChargeNormalizer:
+    """
+    Alias table + fuzzy fallback over distinct descriptions
+    Resolutions are memoized per raw value, so a normalizer shared across
+    files only ever resolves each distinct description once
+    """
+
+    def __init__(self, aliases=None, fuzzy_cutoff=FUZZY_CUTOFF):
+        table = {label: code for code, label in CHARGE_CODES.items()}
+        table.update(DEFAULT_ALIASES)
+        table.update(aliases or {})
+        self.aliases = {normalize_description(k): CODE_LIST.index(v) for k, v in table.items()}
+        self.alias_keys = list(self.aliases)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.resolved = {}
+        # raw description -> [resolution, lines, cents, code] for fuzzy/unknown values
+        self.review = {}
+        self._ups_codes = None
+
+    @classmethod
+    def from_csv(cls, filepath, **kwargs):
+        """Add curated aliases from a CSV (Alias, Charge_Code) to the defaults"""
+        frame = pd.read_csv(filepath, dtype=str)
+        unknown = set(frame['Charge_Code']) - set(CODE_LIST)
+        if unknown:
+            raise ValueError(f"Unknown charge codes in {filepath}: {sorted(unknown)}")
+        return cls(dict(zip(frame['Alias'], frame['Charge_Code'])), **kwargs)
+
+    def resolve(self, description):
+        """
+        (code index, resolution) for one raw description; for 'fuzzy' the
+        code is the closest alias's, a suggestion that encode() does not apply
+        """
+        if description in self.resolved:
+            return self.resolved[description]
+        key = normalize_description(description)
+        if key in self.aliases:
+            result = (self.aliases[key], 'alias')
+        else:
+            close = difflib.get_close_matches(key, self.alias_keys, n=1, cutoff=self.fuzzy_cutoff)
+            result = (self.aliases[close[0]], 'fuzzy') if close else (OTHER, 'unknown')
+        self.resolved[description] = result
+        return result
+
+    def encode(self, descriptions, amounts_cents=None):
+        """
+        Integer charge-code index per line (positions in CHARGE_CODES)
+        Only alias matches get their code; fuzzy and unknown descriptions are
+        'other' and tallied (lines, cents, suggested code) for unknowns()
+        """
+        codes, uniques = pd.factorize(np.asarray(descriptions, dtype=object), use_na_sentinel=True)
+        if len(uniques) == 0:
+            return np.full(len(codes), OTHER, dtype='int8')
+        resolved = [self.resolve(u) for u in uniques]
+        mapped = np.array([code if how == 'alias' else OTHER for code, how in resolved],
+                          dtype='int8')
+        result = np.where(codes >= 0, mapped[codes], OTHER).astype('int8')
+
+        review = [i for i, (_, how) in enumerate(resolved) if how != 'alias']
+        if review:
+            valid = codes >= 0
+            lines = np.bincount(codes[valid], minlength=len(uniques))
+            cents = (np.bincount(codes[valid], weights=np.asarray(amounts_cents)[valid],
+                                 minlength=len(uniques))
+                     if amounts_cents is not None else np.zeros(len(uniques)))
+            for i in review:
+                entry = self.review.setdefault(uniques[i], [resolved[i][1], 0, 0, resolved[i][0]])
+                entry[1] += int(lines[i])
+                entry[2] += int(cents[i])
+        return result
+
+    def categorical(self, descriptions, amounts_cents=None):
+        """encode() as a Categorical over the canonical charge codes"""
+        return pd.Categorical.from_codes(self.encode(descriptions, amounts_cents), CODE_LIST)
+
+    def encode_ups_codes(self, codes, amounts_cents=None):
+        """Charge-code index per line for UPS numeric surcharge codes ('270', 440, ...)"""
+        if self._ups_codes is None:
+            # Imported here: ups_csv_structure_reference imports the rule modules
+            from ups_csv_structure_reference import UPS_SURCHARGE_CODES
+            self._ups_codes = UPS_SURCHARGE_CODES
+        keys = pd.Series(np.asarray(codes, dtype=object)).astype(str).str.strip().str.zfill(3)
+        factor, uniques = pd.factorize(keys)
+        labels = np.array([self._ups_codes.get(u, f'UPS code {u}') for u in uniques], dtype=object)
+        return self.encode(labels[factor], amounts_cents)
+
+    def unknowns(self):
+        """
+        Fuzzy-matched and unresolved descriptions, most billed first, for
+        curation; Charge_Code is the fuzzy suggestion ('other' when unresolved)
+        """
+        rows = [(desc, how, lines, cents / 100, CODE_LIST[code])
+                for desc, (how, lines, cents, code) in self.review.items()]
+        frame = pd.DataFrame(rows, columns=['Description', 'Resolution', 'Lines', 'Amount',
+                                            'Charge_Code'])
+        return frame.sort_values(['Lines', 'Amount'], ascending=False, ignore_index=True)
+
+
+_normalizer = None
+
+
+def get_normalizer():
+    """Process-wide normalizer (shared memo and unknowns tally)"""
+    global _normalizer
+    if _normalizer is None:
+        _normalizer = ChargeNormalizer()
+    return _normalizer
+
+
+def set_normalizer(normalizer):
+    global _normalizer
+    _normalizer = normalizer
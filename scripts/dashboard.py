@@ -0,0 +1,208 @@
+"""
+Billing Dashboard Rendering
+Computes the six dashboard panel aggregates in one pass over the data and
+renders them headlessly (Agg canvas, no pyplot) to PNG/SVG files.
+Aggregates are small and mergeable, so rendering cost depends on bins and
+points rather than shipment count, and many accounts can render in parallel
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rule_cache import content_hash
+
+SURCHARGE_COLUMNS = ['Residential_Surcharge', 'Address_Correction_Fee',
+                     'Large_Package_Surcharge', 'Additional_Handling',
+                     'Fuel_Surcharge', 'Peak_Surcharge']
+
+# Fixed histogram edges keep weight histograms from different files mergeable;
+# one extra overflow bin (last edge inf) counts packages above the range
+WEIGHT_BINS = 30
+WEIGHT_RANGE = (0, 150)
+SCATTER_POINTS = 100
+
+
+# ========================================
+# AGGREGATES
+# ========================================
+
+def compute_dashboard_aggregates(df, bins=WEIGHT_BINS, weight_range=WEIGHT_RANGE,
+                                 points=SCATTER_POINTS, seed=None):
+    """
+    Everything the dashboard draws, computed from one pass over df
+    seed: scatter sample seed; derived from df's content by default, so
+    samples of different files are independent when merged
+    """
+    aggregates = {'rows': len(df)}
+
+    if 'Invoice_Date' in df.columns and 'Net_Charge' in df.columns:
+        days = pd.to_datetime(df['Invoice_Date']).dt.floor('D')
+        aggregates['daily_charges'] = df['Net_Charge'].groupby(days).sum()
+
+    if 'Service_Type' in df.columns:
+        aggregates['service_counts'] = df['Service_Type'].value_counts()
+
+    if 'Actual_Weight' in df.columns:
+        weights = df['Actual_Weight'].dropna().to_numpy(dtype='float64')
+        counts, edges = np.histogram(weights, bins=bins, range=weight_range)
+        aggregates['weight_hist'] = (np.append(counts, np.count_nonzero(weights > weight_range[1])),
+                                     np.append(edges, np.inf))
+
+    if 'Zone' in df.columns:
+        aggregates['zone_counts'] = df['Zone'].value_counts()
+
+    present = [c for c in SURCHARGE_COLUMNS if c in df.columns]
+    if present:
+        aggregates['surcharge_totals'] = df[present].sum()
+
+    if 'Actual_Weight' in df.columns and 'Dimensional_Weight' in df.columns:
+        # Bottom-k random keys: a uniform sample that stays uniform when merged
+        if seed is None:
+            seed = int(content_hash(df)[:16], 16)
+        keys = np.random.default_rng(seed).random(len(df))
+        keep = np.argpartition(keys, points)[:points] if len(df) > points else np.arange(len(df))
+        aggregates['scatter'] = pd.DataFrame({
+            'key': keys[keep],
+            'actual': df['Actual_Weight'].to_numpy()[keep],
+            'dimensional': df['Dimensional_Weight'].to_numpy()[keep],
+        })
+
+    return aggregates
+
+
+def merge_dashboard_aggregates(a, b, points=SCATTER_POINTS):
+    """Combine aggregates from two disjoint sets of shipments"""
+    merged = {'rows': a.get('rows', 0) + b.get('rows', 0)}
+    for key in ('daily_charges', 'service_counts', 'zone_counts', 'surcharge_totals'):
+        if key in a and key in b:
+            merged[key] = a[key].add(b[key], fill_value=0)
+        elif key in a or key in b:
+            merged[key] = a.get(key, b.get(key))
+
+    if 'weight_hist' in a and 'weight_hist' in b:
+        if not np.array_equal(a['weight_hist'][1], b['weight_hist'][1]):
+            raise ValueError("Weight histograms use different bin edges")
+        merged['weight_hist'] = (a['weight_hist'][0] + b['weight_hist'][0], a['weight_hist'][1])
+    elif 'weight_hist' in a or 'weight_hist' in b:
+        merged['weight_hist'] = a.get('weight_hist', b.get('weight_hist'))
+
+    if 'scatter' in a or 'scatter' in b:
+        scatter = pd.concat([a.get('scatter'), b.get('scatter')])
+        merged['scatter'] = scatter.nsmallest(points, 'key')
+    return merged
+
+
+# ========================================
+# RENDERING
+# ========================================
+
+def draw_dashboard(fig, aggregates, title='UPS Billing Analysis Dashboard'):
+    """Draw the six panels onto a matplotlib Figure"""
+    axes = fig.subplots(2, 3)
+    fig.suptitle(title, fontsize=16, fontweight='bold')
+
+    # 1. Charges over time
+    if 'daily_charges' in aggregates:
+        daily = aggregates['daily_charges'].sort_index()
+        axes[0, 0].plot(daily.index, daily.values)
+        axes[0, 0].set_title('Daily Shipping Charges')
+        axes[0, 0].set_xlabel('Date')
+        axes[0, 0].set_ylabel('Total Charges ($)')
+        axes[0, 0].tick_params(axis='x', rotation=45)
+
+    # 2. Service type distribution
+    if 'service_counts' in aggregates:
+        services = aggregates['service_counts'].sort_values(ascending=False)
+        axes[0, 1].bar(services.index.astype(str), services.values)
+        axes[0, 1].set_title('Shipments by Service Type')
+        axes[0, 1].set_xlabel('Service Type')
+        axes[0, 1].set_ylabel('Count')
+        axes[0, 1].tick_params(axis='x', rotation=45)
+
+    # 3. Weight distribution (pre-binned)
+    if 'weight_hist' in aggregates:
+        counts, edges = aggregates['weight_hist']
+        edges = np.asarray(edges, dtype='float64').copy()
+        if np.isinf(edges[-1]):
+            # Overflow bin drawn one bin wide past the range and labelled as open-ended
+            edges[-1] = edges[-2] + (edges[-2] - edges[-3])
+            axes[0, 2].annotate(f'>{edges[-2]:g}', ((edges[-2] + edges[-1]) / 2, counts[-1]),
+                                ha='center', va='bottom', fontsize=8)
+        axes[0, 2].stairs(counts, edges, fill=True, edgecolor='black')
+        axes[0, 2].set_title('Weight Distribution')
+        axes[0, 2].set_xlabel('Weight (lbs)')
+        axes[0, 2].set_ylabel('Frequency')
+
+    # 4. Zone distribution
+    if 'zone_counts' in aggregates:
+        zones = aggregates['zone_counts'].sort_index()
+        axes[1, 0].bar(zones.index.astype(str), zones.values)
+        axes[1, 0].set_title('Shipments by Zone')
+        axes[1, 0].set_xlabel('Zone')
+        axes[1, 0].set_ylabel('Count')
+
+    # 5. Surcharge breakdown
+    if 'surcharge_totals' in aggregates:
+        totals = aggregates['surcharge_totals']
+        totals = totals[totals > 0]
+        if not totals.empty:
+            axes[1, 1].pie(totals.values, labels=[c.replace('_', ' ') for c in totals.index],
+                           autopct='%1.1f%%')
+            axes[1, 1].set_title('Surcharge Distribution')
+
+    # 6. Actual vs Dimensional Weight
+    if 'scatter' in aggregates:
+        sample = aggregates['scatter']
+        axes[1, 2].scatter(sample['actual'], sample['dimensional'], alpha=0.5)
+        axes[1, 2].plot([0, 150], [0, 150], 'r--', label='Equal weights')
+        axes[1, 2].set_title('Actual vs Dimensional Weight')
+        axes[1, 2].set_xlabel('Actual Weight (lbs)')
+        axes[1, 2].set_ylabel('Dimensional Weight (lbs)')
+        axes[1, 2].legend()
+
+    fig.tight_layout()
+    return fig
+
+
+def render_dashboard(aggregates, path, title='UPS Billing Analysis Dashboard', dpi=100):
+    """Render aggregates to an image file; format follows the extension (.png, .svg, ...)"""
+    # Figure + Agg canvas: no pyplot state, no display, safe in worker processes
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(15, 10))
+    FigureCanvasAgg(fig)
+    draw_dashboard(fig, aggregates, title)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def _render_job(job):
+    aggregates, path, title = job
+    return render_dashboard(aggregates, path, title)
+
+
+def render_dashboards(jobs, workers=None):
+    """
+    Render many dashboards in worker processes
+    jobs: iterable of (aggregates, path, title); returns the written paths
+    """
+    jobs = list(jobs)
+    if workers == 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_job, jobs))
+
+
+def render_account_dashboards(df, output_dir, fmt='png', account_col='Account_Number', workers=None):
+    """One dashboard file per account; aggregation in-process, rendering in parallel"""
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for account, rows in df.groupby(account_col):
+        path = os.path.join(output_dir, f'dashboard_{account}.{fmt}')
+        jobs.append((compute_dashboard_aggregates(rows), path,
+                     f'Billing Analysis Dashboard - Account {account}'))
+    return render_dashboards(jobs, workers)
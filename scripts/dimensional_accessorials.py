@@ -0,0 +1,188 @@
+"""
+Dimensional Accessorial Audit
+Checks Additional Handling, Large Package and FedEx AHS charges against the
+package's own dimensions and weight (packaging-based AHS is billed for
+what the box is made of, which dimensions cannot show, so it is never
+judged). Charges come from the canonical
+surcharge table (any carrier), dims are sorted per package so L is the
+longest side, length + girth and the side/weight tests run on whole arrays,
+and thresholds come from a per-carrier, per-effective-date table
+"""
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings, combine_findings
+from carriers import ADAPTERS, normalize_surcharges, charge_amounts
+from fuel_audit import DATE_COLUMNS
+import kernels
+
+THRESHOLD_COLUMNS = ['Longest_Side', 'Second_Side', 'Length_Girth', 'Weight']
+
+# Published thresholds (inches / lbs); a charge is valid when ANY listed test
+# is exceeded, NaN means the test does not apply to that charge.
+# Each row is effective from its Effective_Date until the next row for the same key
+DEFAULT_THRESHOLDS = [
+    # Carrier, Charge, Effective_Date, Longest_Side, Second_Side, Length_Girth, Weight
+    ('UPS', 'Additional_Handling', '2020-01-01', 48, 30, np.nan, 70),
+    ('UPS', 'Additional_Handling', '2023-12-26', 48, 30, 105, 50),
+    ('UPS', 'Large_Package_Surcharge', '2020-01-01', 96, np.nan, 130, np.nan),
+    ('FEDEX', 'Additional_Handling_Dimensions', '2020-01-01', 48, 30, np.nan, np.nan),
+    ('FEDEX', 'Additional_Handling_Dimensions', '2024-01-15', 48, 30, 105, np.nan),
+    ('FEDEX', 'Additional_Handling_Weight', '2020-01-01', np.nan, np.nan, np.nan, 50),
+    ('FEDEX', 'Large_Package_Surcharge', '2020-01-01', 96, np.nan, 130, np.nan),
+]
+
+# Canonical charge code -> threshold table charge
+THRESHOLD_CHARGES = {
+    'additional_handling': 'Additional_Handling',
+    'additional_handling_dims': 'Additional_Handling_Dimensions',
+    'additional_handling_weight': 'Additional_Handling_Weight',
+    'additional_handling_packaging': 'Additional_Handling_Packaging',
+    'large_package': 'Large_Package_Surcharge',
+}
+
+# Charges whose validity does not depend on dimensions or weight; their
+# threshold tests are NaN (cannot be judged), never "threshold not met"
+UNJUDGED_CHARGES = {'Additional_Handling_Packaging'}
+
+RULE_NAMES = {
+    'Additional_Handling': 'Additional Handling Threshold Not Met',
+    'Additional_Handling_Dimensions': 'Additional Handling Threshold Not Met',
+    'Additional_Handling_Weight': 'Additional Handling Threshold Not Met',
+    'Additional_Handling_Packaging': 'Additional Handling Threshold Not Met',
+    'Large_Package_Surcharge': 'Large Package Threshold Not Met',
+}
+
+# Dimension/weight columns per file layout (first complete set wins)
+DIMENSION_FIELD_SETS = [
+    ('Length', 'Width', 'Height', 'Actual_Weight'),
+    ('Dim Length', 'Dim Width', 'Dim Height', 'Actual Weight Amount'),
+]
+
+
+# ========================================
+# THRESHOLD TABLE
+# ========================================
+
+class AccessorialThresholds:
+    """Dimensional accessorial thresholds per (carrier, charge) and effective date"""
+
+    def __init__(self, frame):
+        frame = frame[['Carrier', 'Charge', 'Effective_Date'] + THRESHOLD_COLUMNS].copy()
+        frame['Carrier'] = frame['Carrier'].astype(str).str.upper()
+        frame['Effective_Date'] = pd.to_datetime(frame['Effective_Date'])
+
+        self.keys = sorted(set(zip(frame['Carrier'], frame['Charge'])))
+        key_codes = self._key_codes(frame['Carrier'], frame['Charge'])
+        days = frame['Effective_Date'].to_numpy('datetime64[D]').astype('int64')
+
+        composite = (key_codes << 32) + days
+        order = np.argsort(composite, kind='stable')
+        self.composite = composite[order]
+        self.thresholds = frame[THRESHOLD_COLUMNS].to_numpy(dtype='float64')[order]
+
+    @classmethod
+    def from_csv(cls, filepath):
+        """Load a threshold CSV (Carrier, Charge, Effective_Date, Longest_Side, ...)"""
+        return cls(pd.read_csv(filepath))
+
+    def _key_codes(self, carriers, charges):
+        index = pd.MultiIndex.from_tuples(self.keys)
+        pairs = pd.MultiIndex.from_arrays([np.asarray(carriers, dtype=object),
+                                           np.asarray(charges, dtype=object)])
+        return index.get_indexer(pairs).astype('int64')
+
+    def lookup(self, carriers, charge, dates):
+        """(n, 4) thresholds in effect per shipment for one charge (NaN row if none)"""
+        carriers = pd.Series(np.asarray(carriers, dtype=object)).astype(str).str.upper()
+        key_codes = self._key_codes(carriers, np.full(len(carriers), charge, dtype=object))
+        dates = pd.to_datetime(pd.Series(np.asarray(dates)), errors='coerce')
+        days = dates.to_numpy('datetime64[D]').astype('int64')
+
+        pos = np.searchsorted(self.composite, (key_codes << 32) + days, side='right') - 1
+        found = (pos >= 0) & (key_codes >= 0) & dates.notna().to_numpy()
+        found[found] = (self.composite[pos[found]] >> 32) == key_codes[found]
+
+        result = np.full((len(key_codes), len(THRESHOLD_COLUMNS)), np.nan)
+        result[found] = self.thresholds[pos[found]]
+        return result
+
+
+# Built once at import and shared by every audit without a custom table
+PUBLISHED_THRESHOLDS = AccessorialThresholds(pd.DataFrame(
+    DEFAULT_THRESHOLDS, columns=['Carrier', 'Charge', 'Effective_Date'] + THRESHOLD_COLUMNS))
+
+
+def default_thresholds():
+    return PUBLISHED_THRESHOLDS
+
+
+# ========================================
+# PACKAGE MEASUREMENTS
+# ========================================
+
+def package_measurements(df):
+    """
+    (n, 4) array of longest side, second-longest side, length + girth and
+    weight; sides rounded up to the next whole inch as carriers measure them
+    """
+    fields = next((f for f in DIMENSION_FIELD_SETS if all(c in df.columns for c in f)), None)
+    if fields is None:
+        return np.full((len(df), len(THRESHOLD_COLUMNS)), np.nan)
+
+    length, width, height, weight = (pd.to_numeric(df[c], errors='coerce').to_numpy(dtype='float64')
+                                     for c in fields)
+    return kernels.measurements(length, width, height, weight)
+
+
+def billed_accessorials(df, surcharges=None, carrier='UPS'):
+    """Billed amount per audited charge from the canonical surcharge table; {charge: array}"""
+    if surcharges is None:
+        surcharges = normalize_surcharges(df, carrier)
+    amounts = charge_amounts(surcharges, df.index, list(THRESHOLD_CHARGES))
+    return {THRESHOLD_CHARGES[code]: billed for code, billed in amounts.items()}
+
+
+# ========================================
+# DIMENSIONAL ACCESSORIAL RULE
+# ========================================
+
+def thresholds_met(measurements, thresholds):
+    """1 where any applicable test is exceeded, 0 where none is; NaN where nothing can be judged"""
+    return kernels.thresholds_met(np.ascontiguousarray(measurements, dtype='float64'),
+                                  np.ascontiguousarray(thresholds, dtype='float64'))
+
+
+def audit_dimensional_accessorials(df, thresholds=None, carrier=None, surcharges=None):
+    """
+    Flag Additional Handling / Large Package / AHS charges on packages that meet
+    none of the carrier's thresholds in effect on the ship date
+    surcharges: canonical surcharge table for df (built when omitted)
+    Returns a findings frame (error type 'accessorial_invalid')
+    """
+    thresholds = thresholds or default_thresholds()
+    if carrier is None:
+        carrier = 'FEDEX' if ADAPTERS['FEDEX'].charge_pairs(df) else 'UPS'
+    billed = billed_accessorials(df, surcharges, carrier)
+    if not billed:
+        return combine_findings([])
+
+    carriers = df['Carrier'] if 'Carrier' in df.columns else np.full(len(df), carrier, dtype=object)
+    date_col = next((c for c in DATE_COLUMNS + ['Shipment Date'] if c in df.columns), None)
+    dates = df[date_col] if date_col else pd.Series(pd.NaT, index=df.index)
+    measurements = package_measurements(df)
+
+    findings = []
+    for charge, amounts in billed.items():
+        charged = amounts > 0
+        if not charged.any():
+            continue
+        if charge in UNJUDGED_CHARGES:
+            met = np.full(len(df), np.nan)
+        else:
+            met = thresholds_met(measurements, thresholds.lookup(carriers, charge, dates))
+        mask = charged & (met == 0)
+        findings.append(make_findings(df, mask, RULE_NAMES[charge], 'accessorial_invalid',
+                                      amounts, 0))
+    return combine_findings(findings)
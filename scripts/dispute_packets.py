@@ -0,0 +1,317 @@
+"""
+Dispute Packet Builder
+Groups audit findings by carrier, account and invoice and renders one dispute
+packet per group (PDF and/or CSV) in a process pool. PDF pages are written to
+disk one at a time from a reusable page template (standard Helvetica, nothing
+to embed), and packet/item rows for the dispute_packets tables are written as
+batched SQL
+"""
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+PACKET_KEYS = ['Carrier', 'Account_Number', 'Invoice_Number']
+# Packet key for findings whose carrier/account/invoice is missing
+UNKNOWN_KEY = 'UNKNOWN'
+ROWS_PER_PAGE = 40
+SQL_BATCH_SIZE = 500
+
+# Columns of the packet CSV (same headings as the web app's audit report export)
+CSV_COLUMNS = ['Tracking Number', 'Carrier', 'Error Type', 'Original Charge',
+               'Corrected Charge', 'Recovery Amount', 'Invoice Number']
+
+
+def attach_shipment_keys(findings, df, carrier='UPS'):
+    """Add Carrier/Account_Number/Invoice_Number from the audited frame (joined on row index)"""
+    findings = findings.copy()
+    for key in PACKET_KEYS:
+        if key in df.columns:
+            findings[key] = df.loc[findings.index, key].to_numpy()
+        elif key not in findings.columns:
+            findings[key] = carrier if key == 'Carrier' else UNKNOWN_KEY
+    return findings
+
+
+def packet_number(carrier, account, invoice, packet_date):
+    return f"DP-{str(carrier).upper()}-{account}-{invoice}-{packet_date:%Y%m%d}"
+
+
+# ========================================
+# STREAMING PDF WRITER
+# ========================================
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89   # A4 in points
+MARGIN = 40
+
+
+def _pdf_text(value, limit=None):
+    """Escape a value for a PDF string literal (Latin-1, standard Helvetica)"""
+    text = str(value)[:limit] if limit else str(value)
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', 'replace')
+
+
+class StreamingPdfWriter:
+    """
+    Minimal PDF 1.3 writer: each page's content stream is written to disk as
+    soon as it is added, only object offsets are kept in memory
+    Uses the built-in Helvetica fonts, so nothing is embedded
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5   # 1 catalog, 2 pages, 3 resources, 4 fonts
+        self.file.write(b'%PDF-1.3\n')
+
+    def _object(self, obj_id, body):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % obj_id + body + b'\nendobj\n')
+
+    def add_page(self, content):
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(content_id, b'<</Length %d>>\nstream\n' % len(content) + content
+                     + b'\nendstream')
+        self._object(page_id, b'<</Type /Page /Parent 2 0 R /Resources 3 0 R '
+                     b'/MediaBox [0 0 %.2f %.2f] /Contents %d 0 R>>'
+                     % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        self._object(4, b'<</F1 <</Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                     b'/Encoding /WinAnsiEncoding>> /F2 <</Type /Font /Subtype /Type1 '
+                     b'/BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding>>>>')
+        self._object(3, b'<</Font 4 0 R>>')
+        kids = b' '.join(b'%d 0 R' % i for i in self.page_ids)
+        self._object(2, b'<</Type /Pages /Kids [%s] /Count %d>>' % (kids, len(self.page_ids)))
+        self._object(1, b'<</Type /Catalog /Pages 2 0 R>>')
+
+        xref = self.file.tell()
+        count = self.next_id
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % count)
+        for obj_id in range(1, count):
+            self.file.write(b'%010d 00000 n \n' % self.offsets.get(obj_id, 0))
+        self.file.write(b'trailer\n<</Size %d /Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n'
+                        % (count, xref))
+        self.file.close()
+
+
+class PacketPageTemplate:
+    """
+    Packet page layout with the static parts (table heading, column positions)
+    encoded once and reused for every page rendered by this process
+    """
+
+    COLUMNS = [('Tracking', MARGIN), ('Error Type', 170), ('Billed', 360),
+               ('Expected', 430), ('Recovery', 500)]
+    TABLE_TOP = 640
+    ROW_HEIGHT = 14
+
+    def __init__(self):
+        heading = [b'BT /F2 10 Tf %.2f %.2f Td (%s) Tj ET' % (x, self.TABLE_TOP, _pdf_text(name))
+                   for name, x in self.COLUMNS]
+        rule_y = self.TABLE_TOP - 4
+        self.table_heading = (b'\n'.join(heading)
+                              + b'\n0.5 w %.2f %.2f m %.2f %.2f l S' % (MARGIN, rule_y,
+                                                                      PAGE_WIDTH - MARGIN, rule_y))
+        self.row_ops = [[b'BT /F1 9 Tf %.2f %.2f Td (' % (x, self.TABLE_TOP - (r + 1) * self.ROW_HEIGHT)
+                         for _, x in self.COLUMNS] for r in range(ROWS_PER_PAGE)]
+
+    def page(self, title, header_lines, rows, page, pages):
+        parts = [b'BT /F2 18 Tf %.2f 785 Td (%s) Tj ET' % (MARGIN, _pdf_text(title))]
+        for i, line in enumerate(header_lines):
+            parts.append(b'BT /F1 11 Tf %.2f %.2f Td (%s) Tj ET' % (MARGIN, 757 - i * 17,
+                                                                  _pdf_text(line)))
+        parts.append(self.table_heading)
+        for r, row in enumerate(rows):
+            for prefix, value in zip(self.row_ops[r], row):
+                parts.append(prefix + _pdf_text(value) + b') Tj ET')
+        parts.append(b'BT /F1 8 Tf %.2f 25 Td (Page %d of %d) Tj ET'
+                     % (PAGE_WIDTH - MARGIN - 50, page, pages))
+        return b'\n'.join(parts)
+
+
+_template = None
+
+
+def _get_template():
+    global _template
+    if _template is None:
+        _template = PacketPageTemplate()
+    return _template
+
+
+# ========================================
+# RENDERING
+# ========================================
+
+def _render_pdf(path, meta, items):
+    template = _get_template()
+    header = [f"Account Number: {meta['account']}",
+              f"Invoice: {meta['invoice']}",
+              f"Date: {meta['date']:%m/%d/%Y}",
+              f"Total Errors: {meta['total_errors']}",
+              f"Total Recovery: ${meta['total_recovery']:,.2f}"]
+    title = f"{str(meta['carrier']).upper()} Billing Dispute Packet"
+    pages = max(1, -(-len(items) // ROWS_PER_PAGE))
+
+    writer = StreamingPdfWriter(path)
+    for page in range(pages):
+        chunk = items[page * ROWS_PER_PAGE:(page + 1) * ROWS_PER_PAGE]
+        rows = [(t, str(rule)[:32], f'${b:,.2f}', f'${e:,.2f}', f'${r:,.2f}')
+                for t, rule, b, e, r in chunk]
+        writer.add_page(template.page(title, header, rows, page + 1, pages))
+    writer.close()
+
+
+def _render_csv(path, meta, items):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for tracking, rule, billed, expected, recovery in items:
+            writer.writerow([tracking, meta['carrier'], rule, f'{billed:.2f}',
+                             f'{expected:.2f}', f'{recovery:.2f}', meta['invoice']])
+
+
+def _render_packet(job):
+    meta, items, stem, formats = job
+    files = []
+    if 'pdf' in formats:
+        _render_pdf(stem + '.pdf', meta, items)
+        files.append(stem + '.pdf')
+    if 'csv' in formats:
+        _render_csv(stem + '.csv', meta, items)
+        files.append(stem + '.csv')
+    return files
+
+
+def build_dispute_packets(findings, output_dir, formats=('pdf', 'csv'), workers=None,
+                          packet_date=None, min_recovery=0.01):
+    """
+    Render one packet per (carrier, account, invoice) group of findings
+    findings must carry PACKET_KEYS (see attach_shipment_keys)
+    Returns packet metadata dicts including the written file paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    packet_date = packet_date or date.today()
+    findings = findings[findings['Recovery_Amount'] >= min_recovery].copy()
+    # Findings missing a key still get a packet (under UNKNOWN_KEY) instead of being dropped
+    findings[PACKET_KEYS] = findings[PACKET_KEYS].astype(object).where(
+        findings[PACKET_KEYS].notna(), UNKNOWN_KEY)
+    stems = set()
+
+    jobs = []
+    for (carrier, account, invoice), group in findings.groupby(PACKET_KEYS, sort=False,
+                                                               dropna=False):
+        group = group.sort_values('Recovery_Amount', ascending=False)
+        items = list(zip(group['Tracking_Number'], group['Rule'], group['Billed_Amount'],
+                         group['Expected_Amount'], group['Recovery_Amount']))
+        meta = {
+            'packet_number': packet_number(carrier, account, invoice, packet_date),
+            'carrier': carrier,
+            'account': account,
+            'invoice': invoice,
+            'date': packet_date,
+            'total_errors': len(group),
+            'total_recovery': round(float(group['Recovery_Amount'].sum()), 2),
+            'tracking_numbers': group['Tracking_Number'].tolist(),
+            'error_types': group['Error_Type'].tolist(),
+        }
+        # Same naming as the web app's packets; the account disambiguates shared invoice numbers
+        stem = os.path.join(output_dir, f"dispute_packet_{invoice}_{packet_date:%Y-%m-%d}")
+        if stem in stems:
+            stem += f"_{carrier}_{account}"
+        stems.add(stem)
+        jobs.append((meta, items, stem, formats))
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [_render_packet(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_render_packet, jobs, chunksize=4))
+
+    packets = []
+    for (meta, _, _, _), files in zip(jobs, results):
+        packets.append(dict(meta, files=files))
+    return packets
+
+
+# ========================================
+# DATABASE ROWS
+# ========================================
+
+def _sql(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# Shipment rows of the finding's own invoice and account ($scope is applied
+# to a shipments alias joined to invoices)
+_SCOPE = ("{s}.tracking_number = v.tracking_number "
+          "AND (v.invoice_number::text IS NULL OR {i}.invoice_number = v.invoice_number::text) "
+          "AND {i}.account_number IS NOT DISTINCT FROM v.account_number::text")
+
+ITEMS_SQL = (
+    "\n) AS v(packet_number, account_number, invoice_number, tracking_number, error_type, k)\n"
+    "JOIN dispute_packets p ON p.packet_number = v.packet_number\n"
+    "JOIN LATERAL (SELECT s.id FROM shipments s JOIN invoices i ON i.id = s.invoice_id\n"
+    f"  WHERE {_SCOPE.format(s='s', i='i')}\n"
+    "  ORDER BY s.id LIMIT 1) s ON true\n"
+    "LEFT JOIN LATERAL (SELECT e.id, e.shipment_id FROM audit_errors e\n"
+    "  JOIN shipments es ON es.id = e.shipment_id JOIN invoices ei ON ei.id = es.invoice_id\n"
+    f"  WHERE {_SCOPE.format(s='es', i='ei')} AND e.error_type = v.error_type\n"
+    "  ORDER BY e.id OFFSET v.k - 1 LIMIT 1) e ON true\n"
+    "WHERE NOT EXISTS (SELECT 1 FROM dispute_packet_items d\n"
+    "  WHERE d.packet_id = p.id AND d.shipment_id = COALESCE(e.shipment_id, s.id)\n"
+    "  AND d.error_id IS NOT DISTINCT FROM e.id);\n\n"
+)
+
+
+def write_packet_sql(packets, filename, user_id=None):
+    """
+    Batched INSERTs for dispute_packets and dispute_packet_items
+    Items resolve the shipment by (tracking number, invoice number, account)
+    and the audit error by error type; the k-th finding of a type on a
+    shipment takes the k-th audit_errors row, so duplicate tracking numbers
+    and repeated error rows never fan out. Re-running the file inserts nothing new
+    """
+    with open(filename, 'w') as sql_file:
+        sql_file.write("-- Dispute packets\n")
+        for i in range(0, len(packets), SQL_BATCH_SIZE):
+            batch = packets[i:i + SQL_BATCH_SIZE]
+            sql_file.write("INSERT INTO dispute_packets "
+                           "(user_id, carrier, packet_number, total_errors, total_recovery_amount, "
+                           "status, file_url) VALUES\n")
+            values = []
+            for p in batch:
+                pdf = next((f for f in p['files'] if f.endswith('.pdf')), None)
+                values.append(f"  ({_sql(user_id)}, {_sql(str(p['carrier']).lower())}, "
+                              f"{_sql(p['packet_number'])}, {p['total_errors']}, "
+                              f"{p['total_recovery']}, 'draft', {_sql(pdf)})")
+            sql_file.write(",\n".join(values))
+            sql_file.write("\nON CONFLICT (packet_number) DO NOTHING;\n\n")
+
+        sql_file.write("-- Dispute packet items\n")
+        items, seen = [], {}
+        for p in packets:
+            account = None if p['account'] == UNKNOWN_KEY else str(p['account'])
+            invoice = None if p['invoice'] == UNKNOWN_KEY else str(p['invoice'])
+            for t, e in zip(p['tracking_numbers'], p['error_types']):
+                key = (p['packet_number'], str(t), e)
+                seen[key] = seen.get(key, 0) + 1
+                items.append((p['packet_number'], account, invoice, str(t), e, seen[key]))
+        for i in range(0, len(items), SQL_BATCH_SIZE):
+            batch = items[i:i + SQL_BATCH_SIZE]
+            sql_file.write("INSERT INTO dispute_packet_items (packet_id, error_id, shipment_id)\n"
+                           "SELECT p.id, e.id, COALESCE(e.shipment_id, s.id) FROM (VALUES\n")
+            sql_file.write(",\n".join("  (" + ", ".join(_sql(x) for x in item) + ")"
+                                      for item in batch))
+            sql_file.write(ITEMS_SQL)
+    return filename
@@ -0,0 +1,183 @@
+"""
+Fuel Surcharge Audit
+Validates billed fuel surcharges against the carrier's weekly published
+fuel percentages using a date-indexed table and vectorized searchsorted lookups.
+Fuel and fuel-eligible accessorials come from the canonical surcharge table,
+so the rule runs on any carrier's invoice
+"""
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings
+from carriers import normalize_surcharges, charge_amounts, billed_charge
+
+# ========================================
+# SERVICE GROUPS
+# ========================================
+
+# Carriers publish separate fuel percentages for ground and air services
+SERVICE_GROUPS = {
+    'GROUND': 'ground',
+    'Ground': 'ground',
+    'Home Delivery': 'ground',
+    'Ground Economy': 'ground',
+    'SurePost': 'ground',
+    '03': 'ground',             # UPS service codes
+    '11': 'ground',
+    '93': 'ground',
+    'NEXT_DAY_AIR': 'air',
+    '2ND_DAY_AIR': 'air',
+    '3_DAY_SELECT': 'air',
+    'FedEx Priority Overnight': 'air',
+    'FedEx Standard Overnight': 'air',
+    'FedEx 2Day': 'air',
+    'FedEx Express Saver': 'air',
+}
+
+# Transportation charge the fuel percentage applies to (first column present wins)
+FUEL_TRANSPORTATION_COLUMNS = ['Discounted_Charge', 'Published_Charge']
+
+# Fuel-eligible accessorials (canonical charge codes) added to the transportation charge
+FUEL_ACCESSORIAL_CODES = [
+    'residential',
+    'delivery_area',
+    'extended_area',
+    'remote_area',
+    'additional_handling',
+    'additional_handling_dims',
+    'additional_handling_weight',
+    'additional_handling_packaging',
+    'large_package',
+    'peak',
+    'saturday_delivery',
+]
+
+# The same accessorials as UPS wide columns, for explicit base_columns lists
+FUEL_ACCESSORIAL_COLUMNS = [
+    'Residential_Surcharge',
+    'Delivery_Area_Surcharge',
+    'Extended_Area_Surcharge',
+    'Remote_Area_Surcharge',
+    'Additional_Handling',
+    'Large_Package_Surcharge',
+    'Peak_Surcharge',
+    'Saturday_Delivery_Fee',
+]
+
+# Ship date columns in order of preference
+DATE_COLUMNS = ['Ship_Date', 'Pickup_Date', 'Invoice_Date']
+
+
+def service_group(services, default='air'):
+    """Map service names to fuel service groups (mapping runs once per distinct service)"""
+    codes, uniques = pd.factorize(pd.Series(np.asarray(services, dtype=object)))
+    groups = np.array([SERVICE_GROUPS.get(s, default) for s in uniques] + [default], dtype=object)
+    return groups[codes]
+
+
+# ========================================
+# FUEL RATE TABLE
+# ========================================
+
+class FuelRateTable:
+    """
+    Weekly fuel percentages per (carrier, service group)
+    Each row is effective from its Effective_Date until the next row for the same key
+    """
+
+    def __init__(self, frame):
+        frame = frame[['Carrier', 'Service_Group', 'Effective_Date', 'Percent']].dropna().copy()
+        frame['Carrier'] = frame['Carrier'].astype(str).str.upper()
+        frame['Effective_Date'] = pd.to_datetime(frame['Effective_Date'])
+
+        self.keys = sorted(set(zip(frame['Carrier'], frame['Service_Group'])))
+        key_codes = self._key_codes(frame['Carrier'], frame['Service_Group'])
+        days = frame['Effective_Date'].to_numpy('datetime64[D]').astype('int64')
+
+        # One sorted composite array: key in the high bits, day number in the low bits
+        composite = (key_codes << 32) + days
+        order = np.argsort(composite, kind='stable')
+        self.composite = composite[order]
+        self.percents = frame['Percent'].to_numpy(dtype='float64')[order] / 100
+
+    @classmethod
+    def from_csv(cls, filepath):
+        """Load a fuel table CSV (Carrier, Service_Group, Effective_Date, Percent)"""
+        return cls(pd.read_csv(filepath))
+
+    def _key_codes(self, carriers, groups):
+        """Position of each (carrier, group) pair in self.keys (-1 if unknown)"""
+        index = pd.MultiIndex.from_tuples(self.keys)
+        pairs = pd.MultiIndex.from_arrays([np.asarray(carriers, dtype=object),
+                                           np.asarray(groups, dtype=object)])
+        return index.get_indexer(pairs).astype('int64')
+
+    def lookup(self, carriers, groups, dates):
+        """Applicable fuel fraction for every shipment (NaN if no rate was in effect)"""
+        carriers = pd.Series(np.asarray(carriers, dtype=object)).astype(str).str.upper()
+        key_codes = self._key_codes(carriers, groups)
+        dates = pd.to_datetime(pd.Series(np.asarray(dates)), errors='coerce')
+        days = dates.to_numpy('datetime64[D]').astype('int64')
+
+        composite = (key_codes << 32) + days
+        pos = np.searchsorted(self.composite, composite, side='right') - 1
+
+        # The entry found must belong to the same carrier/group
+        found = (pos >= 0) & (key_codes >= 0) & dates.notna().to_numpy()
+        found[found] = (self.composite[pos[found]] >> 32) == key_codes[found]
+
+        result = np.full(len(key_codes), np.nan)
+        result[found] = self.percents[pos[found]]
+        return result
+
+
+# ========================================
+# FUEL AUDIT RULE
+# ========================================
+
+def fuel_base(df, base_columns=None, surcharges=None, carrier='UPS'):
+    """
+    Sum of the charges the fuel percentage applies to: the transportation
+    charge plus fuel-eligible accessorials from the canonical surcharge table,
+    or exactly the given base_columns
+    """
+    if base_columns is not None:
+        columns = [c for c in base_columns if c in df.columns]
+        return df[columns].fillna(0).to_numpy(dtype='float64').sum(axis=1)
+    if surcharges is None:
+        surcharges = normalize_surcharges(df, carrier)
+    transportation = next((c for c in FUEL_TRANSPORTATION_COLUMNS if c in df.columns), None)
+    base = (pd.to_numeric(df[transportation], errors='coerce').fillna(0).to_numpy(dtype='float64')
+            if transportation else np.zeros(len(df)))
+    for amounts in charge_amounts(surcharges, df.index, FUEL_ACCESSORIAL_CODES).values():
+        base = base + amounts
+    return base
+
+
+def audit_fuel_surcharge(df, fuel_rates, carrier='UPS', base_columns=None,
+                         fuel_discount_pct=0.0, tolerance=0.01, surcharges=None):
+    """
+    Flag fuel surcharges above the published percentage for the ship date
+    surcharges: canonical surcharge table for df (built when omitted)
+    Returns a findings frame (error type 'fuel_overcharge') with exact recovery
+    """
+    if surcharges is None:
+        surcharges = normalize_surcharges(df, carrier)
+    billed = billed_charge(df, 'fuel', surcharges)
+    if not billed.any():
+        return make_findings(df, np.zeros(len(df), dtype=bool), 'Fuel Surcharge Overcharge',
+                             'fuel_overcharge', 0, 0)
+
+    date_col = next((c for c in DATE_COLUMNS if c in df.columns), None)
+    dates = df[date_col] if date_col else pd.Series(pd.NaT, index=df.index)
+    carriers = df['Carrier'] if 'Carrier' in df.columns else np.full(len(df), carrier, dtype=object)
+    groups = service_group(df['Service_Type']) if 'Service_Type' in df.columns \
+        else np.full(len(df), 'ground', dtype=object)
+
+    fraction = fuel_rates.lookup(carriers, groups, dates) * (1 - fuel_discount_pct / 100)
+    expected = np.round(fuel_base(df, base_columns, surcharges, carrier) * fraction, 2)
+
+    mask = ~np.isnan(expected) & (billed - expected > tolerance)
+    return make_findings(df, mask, 'Fuel Surcharge Overcharge', 'fuel_overcharge',
+                         billed, expected)
@@ -0,0 +1,365 @@
+"""
+Shipment History Store
+Append-only columnar store of billed shipments on local disk, partitioned by
+account and month. Every column is a .npy file opened memory-mapped, so
+multi-year analyses read only the partitions and columns they ask for
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from rule_cache import content_hash
+
+# Layout:
+#   <root>/account=<account>/month=<YYYY-MM>/seg-<n>/_meta.json
+#   <root>/account=<account>/month=<YYYY-MM>/seg-<n>/c<i>.npy        numeric/datetime values
+#   <root>/account=<account>/month=<YYYY-MM>/seg-<n>/c<i>.codes.npy  string dictionary codes
+#   <root>/account=<account>/month=<YYYY-MM>/seg-<n>/c<i>.dict.json  string dictionary
+#
+#   <root>/account=<account>/tracking-index/idx-<n>.tracking.npy  sorted tracking hashes
+#   <root>/account=<account>/tracking-index/idx-<n>.invoice.npy   invoice hash per entry
+#   <root>/_recorded.txt                                          content hash per appended frame
+#
+# Nullable integer/boolean columns are stored as float64 (NaN = missing) and
+# tz-aware datetimes as naive UTC, so every .npy file can be memory-mapped
+#
+# The tracking index answers "billed on another invoice of this account?" with
+# a binary search per tracking number; once an account has more than
+# MAX_INDEX_SEGMENTS index segments they are merged into one
+
+UNKNOWN_ACCOUNT = '_unknown'
+INDEX_DIR = 'tracking-index'
+MAX_INDEX_SEGMENTS = 16
+
+TRACKING_HASH_KEY = 'parcelaudit-trk1'
+INVOICE_HASH_KEY = 'parcelaudit-inv1'
+
+
+def _plain(values):
+    """
+    (kind, array) with a memory-mappable dtype: tz-aware datetimes become
+    naive UTC, nullable numerics/booleans become float64 with NaN for missing
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if getattr(values.dt, 'tz', None) is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        return 'datetime', values.to_numpy(dtype='datetime64[ns]')
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        if pd.api.types.is_extension_array_dtype(values):
+            return 'numeric', values.to_numpy(dtype='float64', na_value=np.nan)
+        return 'numeric', values.to_numpy()
+    return 'string', None
+
+
+def _naive(value):
+    """Timestamp without a zone (tz-aware values as UTC, matching the stored dates)"""
+    value = pd.Timestamp(value)
+    return value.tz_convert('UTC').tz_localize(None) if value.tz is not None else value
+
+
+def _end_bound(end):
+    """
+    (bound, inclusive) for an end filter: a bare date covers the whole day
+    (everything before the next midnight), a timestamp with a time is inclusive
+    """
+    end = _naive(end)
+    if end == end.normalize():
+        return end + pd.Timedelta(days=1), False
+    return end, True
+
+
+def shipment_keys(df, invoice_col='Invoice_Number'):
+    """
+    (tracking hash, invoice hash) per row as uint64: tracking numbers stripped,
+    invoice numbers as text (a frame without invoice numbers is one invoice,
+    identified by its content hash)
+    """
+    tracking = df['Tracking_Number'].astype(str).str.strip().to_numpy(dtype=object)
+    if invoice_col in df.columns:
+        invoices = df[invoice_col].astype(str).str.strip().to_numpy(dtype=object)
+    else:
+        invoices = np.full(len(df), content_hash(df), dtype=object)
+    return (pd.util.hash_array(tracking, hash_key=TRACKING_HASH_KEY, categorize=False),
+            pd.util.hash_array(invoices, hash_key=INVOICE_HASH_KEY))
+
+
+def _safe(value):
+    """Partition directory names only keep filesystem-safe characters"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(value)) or UNKNOWN_ACCOUNT
+
+
+class HistoryStore:
+    """Partitioned, memory-mapped shipment history"""
+
+    def __init__(self, root, account_col='Account_Number', date_col='Invoice_Date',
+                 invoice_col='Invoice_Number'):
+        self.root = root
+        self.account_col = account_col
+        self.date_col = date_col
+        self.invoice_col = invoice_col
+        os.makedirs(root, exist_ok=True)
+
+    def _accounts(self, df):
+        return (df[self.account_col].astype(str) if self.account_col in df.columns
+                else pd.Series(UNKNOWN_ACCOUNT, index=df.index))
+
+    @property
+    def state_path(self):
+        """The record of appended frames; it changes with every append"""
+        return os.path.join(self.root, '_recorded.txt')
+
+    def recorded(self, df):
+        """True if a frame with this content was already appended"""
+        path = self.state_path
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            return content_hash(df) in f.read().split()
+
+    # ----------------------------------------
+    # Writing
+    # ----------------------------------------
+
+    def append(self, df):
+        """
+        Append shipments; each (account, month) group becomes a new immutable
+        segment and each account's tracking index gains the frame's entries
+        Returns the segments written ([] when this content was already appended)
+        """
+        if self.recorded(df):
+            return []
+        digest = content_hash(df)
+        if 'Tracking_Number' in df.columns:
+            tracking_hash, invoice_hash = shipment_keys(df, self.invoice_col)
+            for account, rows in pd.Series(np.arange(len(df))).groupby(
+                    self._accounts(df).to_numpy()):
+                self._write_index(account, tracking_hash[rows.to_numpy()],
+                                  invoice_hash[rows.to_numpy()])
+
+        df = df.copy()
+        df[self.date_col] = pd.to_datetime(df[self.date_col], errors='coerce')
+        if df[self.date_col].dt.tz is not None:
+            df[self.date_col] = df[self.date_col].dt.tz_convert('UTC').dt.tz_localize(None)
+        accounts = self._accounts(df)
+        months = df[self.date_col].dt.strftime('%Y-%m').fillna('unknown')
+
+        written = []
+        for (account, month), rows in df.groupby([accounts, months], sort=False).groups.items():
+            written.append(self._write_segment(df.loc[rows], account, month))
+        with open(self.state_path, 'a') as f:
+            f.write(digest + '\n')
+        return written
+
+    def _index_dir(self, account):
+        return os.path.join(self.root, f'account={_safe(account)}', INDEX_DIR)
+
+    def _index_segments(self, directory):
+        return sorted(n[:-len('.tracking.npy')] for n in os.listdir(directory)
+                      if n.endswith('.tracking.npy')) if os.path.isdir(directory) else []
+
+    def _write_index(self, account, tracking_hash, invoice_hash):
+        """Add (tracking, invoice) entries to an account's index as one sorted segment"""
+        directory = self._index_dir(account)
+        os.makedirs(directory, exist_ok=True)
+        names = self._index_segments(directory)
+        if len(names) >= MAX_INDEX_SEGMENTS:
+            # Fold the existing segments into the new one
+            parts = [self._index_segment(directory, n) for n in names]
+            tracking_hash = np.concatenate([np.asarray(t) for t, _ in parts] + [tracking_hash])
+            invoice_hash = np.concatenate([np.asarray(i) for _, i in parts] + [invoice_hash])
+        order = np.argsort(tracking_hash, kind='stable')
+        number = int(names[-1].split('-')[1]) + 1 if names else 1
+        base = os.path.join(directory, f'idx-{number:05d}')
+        # Invoice file first: a segment is visible once its tracking file exists
+        np.save(base + '.invoice.npy', invoice_hash[order])
+        np.save(base + '.tracking.tmp.npy', tracking_hash[order])
+        os.replace(base + '.tracking.tmp.npy', base + '.tracking.npy')
+        for name in names if len(names) >= MAX_INDEX_SEGMENTS else []:
+            os.remove(os.path.join(directory, name + '.tracking.npy'))
+            os.remove(os.path.join(directory, name + '.invoice.npy'))
+
+    def _index_segment(self, directory, name):
+        return (np.load(os.path.join(directory, name + '.tracking.npy'), mmap_mode='r'),
+                np.load(os.path.join(directory, name + '.invoice.npy'), mmap_mode='r'))
+
+    def _write_segment(self, df, account, month):
+        partition = os.path.join(self.root, f'account={_safe(account)}', f'month={month}')
+        os.makedirs(partition, exist_ok=True)
+        existing = [d for d in os.listdir(partition) if d.startswith('seg-')]
+        segment = os.path.join(partition, f'seg-{len(existing) + 1:05d}')
+        tmp = segment + '.tmp'
+        os.makedirs(tmp)
+
+        columns = {}
+        for i, name in enumerate(df.columns):
+            values = df[name]
+            base = os.path.join(tmp, f'c{i}')
+            kind, array = _plain(values)
+            if array is not None:
+                np.save(base + '.npy', array)
+            else:
+                codes, uniques = pd.factorize(values.astype(object).where(values.notna(), None))
+                np.save(base + '.codes.npy', codes.astype('int32'))
+                with open(base + '.dict.json', 'w') as f:
+                    json.dump([str(u) for u in uniques], f)
+            columns[name] = {'file': f'c{i}', 'kind': kind}
+
+        dates = df[self.date_col]
+        meta = {
+            'rows': len(df),
+            'account': str(account),
+            'month': month,
+            'columns': columns,
+            'min_date': None if dates.isna().all() else dates.min().isoformat(),
+            'max_date': None if dates.isna().all() else dates.max().isoformat(),
+        }
+        with open(os.path.join(tmp, '_meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        # Rename last so readers never see a half-written segment
+        os.rename(tmp, segment)
+        return segment
+
+    # ----------------------------------------
+    # Reading
+    # ----------------------------------------
+
+    def partitions(self, accounts=None, start=None, end=None):
+        """Partition directories that can contain matching rows (pruned by path only)"""
+        wanted = {_safe(a) for a in accounts} if accounts is not None else None
+        start_month = pd.Timestamp(start).strftime('%Y-%m') if start is not None else None
+        end_month = pd.Timestamp(end).strftime('%Y-%m') if end is not None else None
+
+        for account_dir in sorted(os.listdir(self.root)):
+            if not account_dir.startswith('account='):
+                continue
+            if wanted is not None and account_dir[len('account='):] not in wanted:
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.root, account_dir))):
+                if not month_dir.startswith('month='):
+                    continue
+                month = month_dir[len('month='):]
+                if month != 'unknown':
+                    if start_month and month < start_month:
+                        continue
+                    if end_month and month > end_month:
+                        continue
+                elif start is not None or end is not None:
+                    continue
+                yield os.path.join(self.root, account_dir, month_dir)
+
+    def segments(self, accounts=None, start=None, end=None):
+        """(path, meta) for every segment whose date range overlaps [start, end]"""
+        start = _naive(start) if start is not None else None
+        bound, inclusive = _end_bound(end) if end is not None else (None, True)
+        for partition in self.partitions(accounts, start, end):
+            for name in sorted(os.listdir(partition)):
+                if not name.startswith('seg-') or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(partition, name)
+                with open(os.path.join(path, '_meta.json')) as f:
+                    meta = json.load(f)
+                if start is not None and meta['max_date'] and pd.Timestamp(meta['max_date']) < start:
+                    continue
+                if bound is not None and meta['min_date']:
+                    first = pd.Timestamp(meta['min_date'])
+                    if first > bound or (first == bound and not inclusive):
+                        continue
+                yield path, meta
+
+    def _column(self, path, meta, name, rows=None):
+        """Memory-map one column of a segment, decoding dictionary strings"""
+        info = meta['columns'].get(name)
+        if info is None:
+            return np.full(meta['rows'] if rows is None else int(rows.sum()), None, dtype=object)
+
+        base = os.path.join(path, info['file'])
+        if info['kind'] != 'string':
+            values = np.load(base + '.npy', mmap_mode='r')
+            return np.asarray(values[rows] if rows is not None else values)
+
+        codes = np.load(base + '.codes.npy', mmap_mode='r')
+        codes = np.asarray(codes[rows] if rows is not None else codes)
+        with open(base + '.dict.json') as f:
+            dictionary = np.array(json.load(f) + [None], dtype=object)
+        return dictionary[codes]  # code -1 (missing) picks the trailing None
+
+    def scan(self, columns=None, accounts=None, start=None, end=None):
+        """
+        Yield one DataFrame per matching segment with only the requested columns
+        Partition/segment pruning happens before any column data is touched
+        """
+        start_ts = _naive(start) if start is not None else None
+        end_ts, inclusive = _end_bound(end) if end is not None else (None, True)
+
+        for path, meta in self.segments(accounts, start, end):
+            wanted = list(columns) if columns is not None else list(meta['columns'])
+
+            # Row-level date predicate for segments straddling the range
+            rows = None
+            if start_ts is not None or end_ts is not None:
+                dates = pd.DatetimeIndex(self._column(path, meta, self.date_col))
+                rows = np.ones(len(dates), dtype=bool)
+                if start_ts is not None:
+                    rows &= dates >= start_ts
+                if end_ts is not None:
+                    rows &= (dates <= end_ts) if inclusive else (dates < end_ts)
+                if not rows.any():
+                    continue
+                if rows.all():
+                    rows = None
+
+            yield pd.DataFrame({name: self._column(path, meta, name, rows) for name in wanted})
+
+    def read(self, columns=None, accounts=None, start=None, end=None):
+        """Concatenate scan() results into one DataFrame"""
+        frames = list(self.scan(columns, accounts, start, end))
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        return pd.concat(frames, ignore_index=True)
+
+    def row_count(self, accounts=None, start=None, end=None):
+        """Rows in matching segments, from metadata alone"""
+        return sum(meta['rows'] for _, meta in self.segments(accounts, start, end))
+
+    def billed_elsewhere(self, account, tracking_hash, invoice_hash):
+        """
+        Per (tracking hash, invoice hash) of shipment_keys: True if the account
+        has the tracking number on a different invoice. Binary search in each
+        memory-mapped index segment; only matching entries are read
+        """
+        result = np.zeros(len(tracking_hash), dtype=bool)
+        directory = self._index_dir(account)
+        for name in self._index_segments(directory):
+            tracking, invoices = self._index_segment(directory, name)
+            lo = np.searchsorted(tracking, tracking_hash, side='left')
+            counts = np.searchsorted(tracking, tracking_hash, side='right') - lo
+            if not counts.any():
+                continue
+            owner = np.repeat(np.arange(len(tracking_hash)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            other = np.asarray(invoices[np.repeat(lo, counts) + offsets]) != invoice_hash[owner]
+            result[owner[other]] = True
+        return result
+
+
+def monthly_totals(store, value_col='Net_Charge', accounts=None, start=None, end=None):
+    """
+    Shipment count and charge total per account and month, streamed segment
+    by segment so only three columns are ever read
+    """
+    parts = []
+    columns = [store.account_col, store.date_col, value_col]
+    for frame in store.scan(columns, accounts, start, end):
+        month = pd.DatetimeIndex(frame[store.date_col]).to_period('M')
+        parts.append(frame.groupby([frame[store.account_col], month])[value_col]
+                     .agg(['count', 'sum']))
+    if not parts:
+        return pd.DataFrame(columns=['count', 'sum'])
+    totals = pd.concat(parts).groupby(level=[0, 1]).sum()
+    totals.index.names = ['Account_Number', 'Month']
+    return totals
@@ -0,0 +1,390 @@
+"""
+Watch-Folder Ingestion
+Long-running service that picks up uploaded invoices from an inbox
+directory, skips files whose content was already processed, and feeds a
+bounded priority queue drained by a pool of audit worker processes.
+Free-check previews (sample estimates) are served before full audits; when
+the queue is full the watcher stops taking files, which stay in the inbox
+until there is room, so a month-end burst costs queue slots, not memory.
+Every job's state and stage timings are recorded in SQLite
+
+Inbox layout:
+    <inbox>/            full audits (findings CSV)
+    <inbox>/preview/    free-check previews (sample-based recovery estimate)
+    <inbox>/out/        results
+    <inbox>/done/       processed and duplicate uploads
+    <inbox>/failed/     uploads whose job raised
+"""
+
+import hashlib
+import os
+import queue
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_JOB_DB = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'ingest.db')
+
+PREVIEW, AUDIT = 'preview', 'audit'
+# Lower runs first
+PRIORITIES = {PREVIEW: 0, AUDIT: 1}
+RESERVED_DIRS = ['out', 'done', 'failed']
+
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_POLL_INTERVAL = 2.0
+# A file is picked up once unmodified for this long (uploads still being written are skipped)
+DEFAULT_SETTLE_SECONDS = 2.0
+HASH_BLOCK = 1 << 20
+
+
+def file_hash(path):
+    """SHA-1 of a file's bytes, read in blocks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ========================================
+# JOB LOG
+# ========================================
+
+class JobLog:
+    """SQLite record of every job: state, result size and per-stage timings"""
+
+    def __init__(self, path=DEFAULT_JOB_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Shared by the watcher and dispatcher threads; every access holds the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                queued_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                rows INTEGER,
+                recovery REAL,
+                load_seconds REAL,
+                audit_seconds REAL,
+                write_seconds REAL,
+                output TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_content ON jobs (content_hash, kind, status);
+        """)
+        self.conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            self.conn.commit()
+            return cursor
+
+    def processed(self, content, kind):
+        """True if this content already has a queued, running or finished job of this kind"""
+        return self._execute(
+            "SELECT 1 FROM jobs WHERE content_hash = ? AND kind = ? "
+            "AND status IN ('queued', 'running', 'done')", (content, kind)).fetchone() is not None
+
+    def add(self, path, kind, content, status='queued'):
+        return self._execute(
+            "INSERT INTO jobs (path, kind, content_hash, status, queued_at) VALUES (?, ?, ?, ?, ?)",
+            (path, kind, content, status, time.time())).lastrowid
+
+    def started(self, job_id):
+        self._execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                      (time.time(), job_id))
+
+    def finished(self, job_id, result):
+        self._execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, rows = ?, recovery = ?, "
+            "load_seconds = ?, audit_seconds = ?, write_seconds = ?, output = ? WHERE id = ?",
+            (time.time(), result['rows'], result['recovery'], result['load_seconds'],
+             result['audit_seconds'], result['write_seconds'], result['output'], job_id))
+
+    def failed(self, job_id, error):
+        self._execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                      (time.time(), error, job_id))
+
+    def mark_interrupted(self):
+        """Jobs left queued/running by a stopped daemon are marked so their files are retried"""
+        self._execute("UPDATE jobs SET status = 'interrupted' WHERE status IN ('queued', 'running')")
+
+    def recent(self, limit=20):
+        """Latest jobs, newest first"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT id, kind, status, path, rows, recovery, "
+                "started_at - queued_at, finished_at - started_at, error "
+                "FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+            return cursor.fetchall()
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        self.conn.close()
+
+
+# ========================================
+# WORKER PROCESSES
+# ========================================
+
+_worker = {}
+
+
+def _init_worker(resources, settings, per_stratum):
+    import warnings
+    # Ctrl-C stops the daemon, which lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    warnings.simplefilter('ignore', FutureWarning)
+    from ups_billing_analyzer import UPSBillingAnalyzer
+    from parallel_audit import open_resources
+
+    # Each worker opens its own address cache from the classifier's spec
+    analyzer = UPSBillingAnalyzer(**open_resources(resources))
+    for name, value in settings.items():
+        setattr(analyzer, name, value)
+    _worker['analyzer'] = analyzer
+    _worker['per_stratum'] = per_stratum
+
+
+def run_job(job_id, kind, path, out_dir):
+    """
+    One job in a worker process; returns rows, recovery, output path and
+    load/audit/write seconds
+    """
+    from contextlib import redirect_stdout
+
+    analyzer = _worker['analyzer']
+    # Job id first: re-uploads of the same file name never overwrite earlier results
+    name = f'{job_id}-{os.path.basename(path)}'
+    start = time.perf_counter()
+    # Rule code prints progress; keep the daemon's log to one line per job
+    with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+        if kind == PREVIEW:
+            from sample_estimate import sample_file, estimate_recovery
+
+            reservoir = sample_file(path, per_stratum=_worker['per_stratum'])
+            loaded = time.perf_counter()
+            result = estimate_recovery(analyzer, reservoir)
+            rows, recovery = reservoir.rows_seen, float(result['Estimated_Recovery'].sum())
+            output, index = os.path.join(out_dir, name + '.preview.csv'), False
+        else:
+            from layouts import load_invoice
+
+            analyzer.df = load_invoice(path)
+            loaded = time.perf_counter()
+            analyzer.identify_overcharges()
+            result = analyzer.findings
+            rows, recovery = len(analyzer.df), float(result['Recovery_Amount'].sum())
+            output, index = os.path.join(out_dir, name + '.findings.csv'), True
+        audited = time.perf_counter()
+        result.to_csv(output, index=index, index_label='Row' if index else None)
+    analyzer.df = None
+    return {'rows': int(rows), 'recovery': round(recovery, 2), 'output': output,
+            'load_seconds': loaded - start, 'audit_seconds': audited - loaded,
+            'write_seconds': time.perf_counter() - audited}
+
+
+# ========================================
+# DAEMON
+# ========================================
+
+class IngestDaemon:
+    """
+    Watcher thread -> bounded PriorityQueue -> one dispatcher thread per
+    worker process. A dispatcher takes the next job only when its worker is
+    free, so queue order (previews first, then arrival) decides what runs
+    next and at most `workers` invoices are in memory at once
+    """
+
+    def __init__(self, inbox, resources=None, settings=None, workers=2, queue_size=DEFAULT_QUEUE_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 job_log=None, per_stratum=200, log=print):
+        self.inbox = os.path.abspath(inbox)
+        self.dirs = {d: os.path.join(self.inbox, d) for d in RESERVED_DIRS + [PREVIEW]}
+        for path in self.dirs.values():
+            os.makedirs(path, exist_ok=True)
+        self.resources = resources or {}
+        # Analyzer rule parameters (parallel_audit.WORKER_SETTINGS) set in every worker
+        self.settings = settings or {}
+        self.workers = workers
+        self.queue = queue.PriorityQueue(maxsize=queue_size)
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.jobs = job_log or JobLog()
+        self.per_stratum = per_stratum
+        self.log = log
+        self.stopping = threading.Event()
+        # Paths queued or running (they stay in the inbox until finished)
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        # Replaced when a worker dies (see _run_job)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.sequence = 0
+        self.backpressure_events = 0
+
+    # ----------------------------------------
+    # Watching
+    # ----------------------------------------
+
+    def candidates(self):
+        """(kind, path) of settled uploads not yet queued, previews first, oldest first"""
+        now = time.time()
+        found = []
+        for kind, directory in ((PREVIEW, self.dirs[PREVIEW]), (AUDIT, self.inbox)):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.startswith('.') or not os.path.isfile(path) or path in self.pending:
+                    continue
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    # Removed since listed
+                    continue
+                if now - mtime >= self.settle_seconds:
+                    found.append((PRIORITIES[kind], mtime, kind, path))
+        return [(kind, path) for _, _, kind, path in sorted(found)]
+
+    def scan(self):
+        """Queue settled uploads until the queue is full; returns the number queued"""
+        queued = 0
+        for kind, path in self.candidates():
+            if self.queue.full():
+                # Backpressure: the rest stay in the inbox and are retried next scan
+                self.backpressure_events += 1
+                break
+            try:
+                content = file_hash(path)
+            except OSError:
+                # Removed or replaced since listed; a re-upload is picked up next scan
+                continue
+            if self.jobs.processed(content, kind):
+                self.jobs.add(path, kind, content, status='duplicate')
+                self._archive(path, 'done')
+                self.log(f"duplicate {kind}: {os.path.basename(path)}")
+                continue
+            job_id = self.jobs.add(path, kind, content)
+            with self.pending_lock:
+                self.pending.add(path)
+            self.sequence += 1
+            self.queue.put_nowait((PRIORITIES[kind], self.sequence, job_id, kind, path))
+            queued += 1
+        return queued
+
+    def _archive(self, path, where):
+        target = os.path.join(self.dirs[where], os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(target)
+            target = f'{stem}.{int(time.time() * 1000)}{ext}'
+        shutil.move(path, target)
+
+    # ----------------------------------------
+    # Dispatching
+    # ----------------------------------------
+
+    def _new_pool(self, workers=None):
+        return ProcessPoolExecutor(max_workers=workers or self.workers, initializer=_init_worker,
+                                   initargs=(self.resources, self.settings, self.per_stratum))
+
+    def _run_job(self, job_id, kind, path):
+        """
+        run_job in the pool. When a worker dies (e.g. OOM-killed) the pool is
+        replaced and every job it was running is resubmitted once, each in a
+        worker of its own, so only the job that kills its worker fails
+        """
+        pool = self.pool
+        try:
+            return pool.submit(run_job, job_id, kind, path, self.dirs['out']).result()
+        except BrokenProcessPool:
+            if self.stopping.is_set():
+                raise
+            with self.pool_lock:
+                # Every dispatcher whose job was running sees the break; replace once
+                if self.pool is pool:
+                    pool.shutdown(wait=False)
+                    self.pool = self._new_pool()
+                    self.log("worker process died; restarted the worker pool")
+        self.log(f"retrying {kind}: {os.path.basename(path)}")
+        with self._new_pool(workers=1) as alone:
+            return alone.submit(run_job, job_id, kind, path, self.dirs['out']).result()
+
+    def _dispatch(self):
+        # Queued jobs left at stop keep their files in the inbox for the next start
+        while not self.stopping.is_set():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            _, _, job_id, kind, path = item
+            try:
+                self.jobs.started(job_id)
+                try:
+                    result = self._run_job(job_id, kind, path)
+                except Exception as e:
+                    self.jobs.failed(job_id, ''.join(traceback.format_exception_only(type(e), e)))
+                    self._archive(path, 'failed')
+                    self.log(f"failed {kind}: {os.path.basename(path)}: {e}")
+                else:
+                    self.jobs.finished(job_id, result)
+                    self._archive(path, 'done')
+                    self.log(f"done {kind}: {os.path.basename(path)} {result['rows']:,} rows, "
+                             f"${result['recovery']:,.2f} in "
+                             f"{result['load_seconds'] + result['audit_seconds']:.1f}s "
+                             f"(queue {self.queue.qsize()})")
+            finally:
+                with self.pending_lock:
+                    self.pending.discard(path)
+                self.queue.task_done()
+
+    def stop(self, *_):
+        self.stopping.set()
+
+    def run(self, once=False):
+        """
+        Watch until stopped (SIGINT/SIGTERM), or with once=True until the
+        inbox is empty and every job has finished
+        """
+        self.jobs.mark_interrupted()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        self.pool = self._new_pool()
+        dispatchers = [threading.Thread(target=self._dispatch, daemon=True)
+                       for _ in range(self.workers)]
+        for thread in dispatchers:
+            thread.start()
+        try:
+            while not self.stopping.is_set():
+                self.scan()
+                if once and not self.pending and not self._uploads():
+                    break
+                self.stopping.wait(self.poll_interval)
+        finally:
+            self.stopping.set()
+            for thread in dispatchers:
+                thread.join()
+            self.pool.shutdown()
+        return self.jobs.counts()
+
+    def _uploads(self):
+        """Any upload left in the inbox (queued, running or still settling)"""
+        return any(not name.startswith('.') and os.path.isfile(os.path.join(directory, name))
+                   for directory in (self.inbox, self.dirs[PREVIEW])
+                   for name in os.listdir(directory))
@@ -0,0 +1,120 @@
+"""
+Invoice Sources
+Opens plain, compressed (.gz, .bz2, .zst) and archived (.zip, multi-member)
+invoice files as decompressing streams that feed pandas' parser directly,
+with no temporary files. ZIP members can be parsed in parallel
+"""
+
+import bz2
+import gzip
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+ENCODINGS = ['utf-8', 'latin-1', 'cp1252']
+
+# Archive members that hold invoice data
+MEMBER_EXTENSIONS = ('.csv', '.txt', '.tsv')
+
+
+def _kind(path):
+    lower = str(path).lower()
+    for ext, kind in (('.zip', 'zip'), ('.gz', 'gzip'), ('.gzip', 'gzip'), ('.bz2', 'bz2'),
+                      ('.zst', 'zstd'), ('.zstd', 'zstd')):
+        if lower.endswith(ext):
+            return kind
+    return 'plain'
+
+
+def zip_members(path):
+    """Invoice members of a ZIP archive, in archive order"""
+    with zipfile.ZipFile(path) as archive:
+        return [info.filename for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(MEMBER_EXTENSIONS)
+                and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')]
+
+
+def open_stream(path, member=None):
+    """Binary, decompressing stream over one file (or one ZIP member)"""
+    kind = _kind(path)
+    if kind == 'zip':
+        # The open member keeps the archive's file handle until it is closed
+        with zipfile.ZipFile(path) as archive:
+            return archive.open(member or zip_members(path)[0])
+    if kind == 'gzip':
+        return gzip.open(path, 'rb')
+    if kind == 'bz2':
+        return bz2.open(path, 'rb')
+    if kind == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def sources(path):
+    """(name, member) pairs making up an invoice file; member is None for single files"""
+    if _kind(path) == 'zip':
+        return [(f'{os.path.basename(path)}:{m}', m) for m in zip_members(path)]
+    return [(os.path.basename(path), None)]
+
+
+def _read(path, member, encoding=None, **read_csv_kwargs):
+    """Parse one source, trying each encoding on a fresh stream"""
+    encodings = [encoding] if encoding else ENCODINGS
+    for i, candidate in enumerate(encodings):
+        with open_stream(path, member) as stream:
+            try:
+                return pd.read_csv(stream, encoding=candidate, **read_csv_kwargs)
+            except UnicodeDecodeError:
+                if i == len(encodings) - 1:
+                    raise
+
+
+def read_invoice(path, workers=None, encoding=None, **read_csv_kwargs):
+    """
+    Read a plain, compressed or archived invoice file into one DataFrame
+    Multi-member ZIP archives are parsed member by member in a thread pool
+    (decompression and the C parser release the GIL)
+    """
+    members = [m for _, m in sources(path)]
+    if len(members) == 1 or workers == 1:
+        frames = [_read(path, m, encoding, **read_csv_kwargs) for m in members]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(lambda m: _read(path, m, encoding, **read_csv_kwargs), members))
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _read_chunks(path, member, chunksize, encoding=None, **read_csv_kwargs):
+    """
+    Chunks of one source, trying each encoding in turn. A decode error can
+    surface after earlier chunks were yielded; the next encoding then resumes
+    on a fresh stream after the rows already yielded
+    """
+    encodings = [encoding] if encoding else ENCODINGS
+    done = 0
+    for i, candidate in enumerate(encodings):
+        kwargs = dict(read_csv_kwargs, skiprows=range(1, done + 1)) if done else read_csv_kwargs
+        offset = done
+        with open_stream(path, member) as stream:
+            try:
+                for chunk in pd.read_csv(stream, chunksize=chunksize, encoding=candidate, **kwargs):
+                    chunk.index += offset
+                    done += len(chunk)
+                    yield chunk
+                return
+            except UnicodeDecodeError:
+                if i == len(encodings) - 1:
+                    raise
+
+
+def read_invoice_chunks(path, chunksize=100000, encoding=None, **read_csv_kwargs):
+    """
+    Stream any supported invoice file as DataFrame chunks, one member at a
+    time; memory stays at one chunk regardless of file or archive size
+    """
+    for _, member in sources(path):
+        yield from _read_chunks(path, member, chunksize, encoding, **read_csv_kwargs)
@@ -0,0 +1,229 @@
+"""
+Rule Kernels
+Per-row checks that need many temporaries in NumPy: the per-package
+dimension sort with length + girth, multi-test surcharge eligibility and
+business-day transit counts. Each kernel is written once as a plain loop;
+when Numba is installed it is compiled to a single fused pass, otherwise
+the equivalent NumPy implementation runs. PARCELAUDIT_NO_JIT=1 forces NumPy
+"""
+
+import os
+
+import numpy as np
+
+# None until first use, then the numba module or False (not installed / disabled)
+_numba = None
+
+
+def jit_available():
+    """Numba is importable and not disabled (imported on first use only)"""
+    global _numba
+    if _numba is None:
+        _numba = False
+        if not os.environ.get('PARCELAUDIT_NO_JIT'):
+            try:
+                import numba
+                _numba = numba
+            except ImportError:
+                pass
+    return bool(_numba)
+
+
+class Kernel:
+    """A loop kernel plus its NumPy fallback; compiled lazily on the first JIT call"""
+
+    def __init__(self, loop, fallback):
+        self.loop = loop
+        self.fallback = fallback
+        self.name = loop.__name__
+        self._compiled = None
+
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = _numba.njit(cache=True, nogil=True)(self.loop)
+        return self._compiled
+
+    def __call__(self, *args, jit=None):
+        """jit=None: compiled when available; False: NumPy path; True: compiled if available"""
+        if (jit is None or jit) and jit_available():
+            return self.compiled()(*args)
+        return self.fallback(*args)
+
+
+def kernel(fallback):
+    """Decorator: the decorated loop becomes a Kernel with this NumPy fallback"""
+    def wrap(loop):
+        return Kernel(loop, fallback)
+    return wrap
+
+
+# ========================================
+# PACKAGE MEASUREMENTS
+# ========================================
+
+def _measurements_numpy(length, width, height, weight):
+    dims = np.ceil(np.column_stack([length, width, height]))
+    # Descending, NaN last
+    dims = -np.sort(-dims, axis=1)
+    length_girth = dims[:, 0] + 2 * (dims[:, 1] + dims[:, 2])
+    return np.column_stack([dims[:, 0], dims[:, 1], length_girth, weight])
+
+
+@kernel(_measurements_numpy)
+def measurements(length, width, height, weight):
+    """
+    (n, 4) longest side, second side, length + girth, weight; sides rounded
+    up to whole inches and sorted per package (NaN sides sort last)
+    """
+    n = length.shape[0]
+    out = np.empty((n, 4))
+    for i in range(n):
+        a = np.ceil(length[i])
+        b = np.ceil(width[i])
+        c = np.ceil(height[i])
+        # Three compare-swaps; a NaN never wins a comparison, so it sinks to the end
+        if b > a or (a != a and b == b):
+            a, b = b, a
+        if c > b or (b != b and c == c):
+            b, c = c, b
+        if b > a or (a != a and b == b):
+            a, b = b, a
+        out[i, 0] = a
+        out[i, 1] = b
+        out[i, 2] = a + 2 * (b + c)
+        out[i, 3] = weight[i]
+    return out
+
+
+# ========================================
+# THRESHOLD ELIGIBILITY
+# ========================================
+
+def _thresholds_met_numpy(measured, thresholds):
+    with np.errstate(invalid='ignore'):
+        exceeded = measured > thresholds
+    applicable = ~np.isnan(thresholds)
+    known = ~np.isnan(measured) | ~applicable
+    met = (exceeded & applicable).any(axis=1)
+    judged = applicable.any(axis=1) & known.all(axis=1)
+    return np.where(judged, met, np.nan)
+
+
+@kernel(_thresholds_met_numpy)
+def thresholds_met(measured, thresholds):
+    """
+    1.0 where any applicable test (non-NaN threshold) is exceeded, 0.0 where
+    none is, NaN where no test applies or an applicable measurement is missing
+    """
+    n, k = measured.shape
+    out = np.empty(n)
+    for i in range(n):
+        applicable = False
+        known = True
+        met = False
+        for j in range(k):
+            limit = thresholds[i, j]
+            if limit == limit:
+                applicable = True
+                value = measured[i, j]
+                if value != value:
+                    known = False
+                elif value > limit:
+                    met = True
+        out[i] = (1.0 if met else 0.0) if applicable and known else np.nan
+    return out
+
+
+# ========================================
+# BUSINESS-DAY TRANSIT
+# ========================================
+
+def _business_days_numpy(start, end, holidays):
+    return np.busday_count(start.astype('datetime64[D]'), end.astype('datetime64[D]'),
+                           holidays=holidays.astype('datetime64[D]')).astype('int64')
+
+
+@kernel(_business_days_numpy)
+def _business_days(start, end, holidays):
+    """Weekdays in [start, end) less holidays (negative when end < start), as np.busday_count"""
+    n = start.shape[0]
+    out = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        lo, hi, sign = start[i], end[i], 1
+        if hi < lo:
+            # Backwards ranges count (end, start], as np.busday_count does
+            lo, hi, sign = hi + 1, lo + 1, -1
+        days = hi - lo
+        # 1970-01-01 was a Thursday: (day + 3) % 7 is 0 for Monday
+        count = (days // 7) * 5
+        weekday = (lo + 3 + (days // 7) * 7) % 7
+        for _ in range(days % 7):
+            if weekday < 5:
+                count += 1
+            weekday = (weekday + 1) % 7
+        count -= np.searchsorted(holidays, hi) - np.searchsorted(holidays, lo)
+        out[i] = sign * count
+    return out
+
+
+def business_days(ship_days, delivery_days, holidays=(), jit=None):
+    """
+    Business days in transit: weekdays after the ship day up to and
+    including the delivery day, less carrier holidays
+    All inputs are int64 days since 1970-01-01
+    """
+    holidays = np.unique(np.asarray(holidays, dtype='int64'))
+    # np.busday_count ignores weekend holidays; drop them so both paths agree
+    holidays = holidays[(holidays + 3) % 7 < 5]
+    start = np.asarray(ship_days, dtype='int64') + 1
+    end = np.asarray(delivery_days, dtype='int64') + 1
+    return _business_days(start, end, holidays, jit=jit)
+
+
+KERNELS = [measurements, thresholds_met, _business_days]
+
+
+# ========================================
+# SELF-CHECK
+# ========================================
+
+def self_check(rows=1000000, seed=7):
+    """
+    Run every kernel on generated inputs through both paths
+    Returns one dict per kernel: name, numpy/jit seconds and whether the two
+    results are identical; without Numba nothing is compared, so jit and
+    equal are None (skipped)
+    """
+    import time
+
+    rng = np.random.default_rng(seed)
+    sides = rng.uniform(1, 120, (3, rows))
+    sides[:, rng.random(rows) < 0.02] = np.nan
+    weight = rng.uniform(0.1, 150, rows)
+    limits = np.tile(np.array([48.0, 30.0, 105.0, 50.0]), (rows, 1))
+    limits[rng.random(rows) < 0.3, 2] = np.nan
+    limits[rng.random(rows) < 0.05] = np.nan
+    ship = rng.integers(19000, 21000, rows)
+    delivered = ship + rng.integers(-3, 15, rows)
+    holidays = np.arange(19000, 21000, 45)
+
+    cases = [
+        ('measurements', lambda jit: measurements(sides[0], sides[1], sides[2], weight, jit=jit)),
+        ('thresholds_met', lambda jit: thresholds_met(
+            _measurements_numpy(sides[0], sides[1], sides[2], weight), limits, jit=jit)),
+        ('business_days', lambda jit: business_days(ship, delivered, holidays, jit=jit)),
+    ]
+    results = []
+    for name, run in cases:
+        start = time.perf_counter()
+        expected = run(False)
+        numpy_seconds = time.perf_counter() - start
+        jit_seconds, equal = None, None
+        if jit_available():
+            run(True)  # compile (or load from Numba's cache) outside the timing
+            start = time.perf_counter()
+            compiled = run(True)
+            jit_seconds = time.perf_counter() - start
+            equal = bool(np.array_equal(expected, compiled, equal_nan=True))
+        results.append({'name': name, 'numpy': numpy_seconds, 'jit': jit_seconds, 'equal': equal})
+    return results
@@ -0,0 +1,262 @@
+"""
+Lane Charge Baselines
+Per-lane robust baselines of billed charges, where a lane is origin ZIP3 x
+destination ZIP3 x service x weight band. Each lane keeps a mergeable
+log-bucket quantile sketch (every bucket within SKETCH_ACCURACY of its
+values) that is updated incrementally from recorded invoices, plus the
+median and MAD derived from it. Scoring a new invoice is one join of its
+lane keys against the stored lane statistics, so it costs O(rows) however
+much history the baselines summarize
+"""
+
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from rule_cache import content_hash
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'lane_baselines.db')
+
+# Relative accuracy of the sketch: every value lies within 1% of its bucket's value
+SKETCH_ACCURACY = 0.01
+GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+# Weight bands (lbs) for lane keys; finer than sample_estimate's strata since
+# charges within a lane should be directly comparable
+LANE_WEIGHT_BANDS = [0, 1, 2, 3, 5, 10, 15, 20, 30, 40, 50, 70, 100, 150, np.inf]
+
+ORIGIN_ZIP_COLUMNS = ['Origin_Zip', 'Shipper_Postal_Code', 'Shipper Zip Code']
+DEST_ZIP_COLUMNS = ['Dest_Zip', 'Receiver_Postal_Code', 'Recipient Zip Code']
+CHARGE_COLUMN = 'Net_Charge'
+
+# Modified z-score (Iglewicz & Hoaglin): 0.6745 * (x - median) / MAD, outlier above 3.5
+MAD_SCALE = 0.6745
+DEFAULT_Z_THRESHOLD = 3.5
+# Lanes with fewer charges than this are not scored
+DEFAULT_MIN_COUNT = 30
+# Contract pricing makes many lanes nearly constant (MAD ~ 0); the MAD is
+# floored at this fraction of the median so cents of noise are not outliers
+MIN_MAD_FRACTION = 0.02
+
+SCORE_COLUMNS = ['Lane', 'Charge', 'Lane_Count', 'Lane_Median', 'Lane_MAD', 'Z_Score', 'Anomaly']
+
+
+# ========================================
+# LANE KEYS
+# ========================================
+
+def _zip3(values):
+    """First three digits of each ZIP ('' when missing); each distinct value parsed once"""
+    codes, uniques = pd.factorize(values)
+    prefixes = []
+    for value in uniques:
+        digits = re.sub(r'\D', '', str(value).split('.')[0].split('-')[0])
+        prefixes.append(digits.zfill(5)[:3] if digits else '')
+    prefixes = np.array(prefixes + [''], dtype=object)
+    return prefixes[codes]
+
+
+def lane_keys(df):
+    """One string key per row: origin ZIP3 | destination ZIP3 | service | weight band"""
+    parts = []
+    for candidates in (ORIGIN_ZIP_COLUMNS, DEST_ZIP_COLUMNS):
+        col = next((c for c in candidates if c in df.columns), None)
+        parts.append(_zip3(df[col]) if col else np.full(len(df), '', dtype=object))
+    service = df['Service_Type'] if 'Service_Type' in df.columns else pd.Series('', index=df.index)
+    parts.append(service.fillna('').astype(str).to_numpy(dtype=object))
+    weight_col = next((c for c in ['Billed_Weight', 'Actual_Weight'] if c in df.columns), None)
+    if weight_col:
+        weight = pd.to_numeric(df[weight_col], errors='coerce').to_numpy(dtype='float64')
+        parts.append(np.searchsorted(LANE_WEIGHT_BANDS, weight, side='right').astype(str))
+    key = pd.Series(parts[0], index=df.index)
+    for part in parts[1:]:
+        key = key + '|' + pd.Series(part, index=df.index)
+    return key
+
+
+def charges(df):
+    """Billed charge per row (NaN when missing or not a positive amount)"""
+    if CHARGE_COLUMN not in df.columns:
+        return np.full(len(df), np.nan)
+    values = pd.to_numeric(df[CHARGE_COLUMN], errors='coerce').to_numpy(dtype='float64')
+    return np.where(values > 0, values, np.nan)
+
+
+# ========================================
+# QUANTILE SKETCH
+# ========================================
+
+def sketch_buckets(values):
+    """Log-bucket index per positive value"""
+    return np.ceil(np.log(values) / np.log(GAMMA)).astype('int64')
+
+
+def bucket_values(buckets):
+    """Representative value of each bucket (within SKETCH_ACCURACY of every member)"""
+    return 2 * np.power(GAMMA, np.asarray(buckets, dtype='float64')) / (GAMMA + 1)
+
+
+def _weighted_medians(lanes, values, counts):
+    """
+    Weighted median of values per lane (rows sorted by lane, then value)
+    Returns (lane codes, medians) for the lanes present
+    """
+    totals = np.bincount(lanes, weights=counts)
+    cumulative = pd.Series(counts).groupby(lanes).cumsum().to_numpy()
+    reached = np.flatnonzero(cumulative * 2 >= totals[lanes])
+    first = reached[np.r_[True, lanes[reached][1:] != lanes[reached][:-1]]]
+    return lanes[first], values[first]
+
+
+def lane_statistics(sketch):
+    """
+    Count, median and MAD per lane from sketch rows (Lane, Bucket, Count),
+    all lanes at once
+    """
+    if not len(sketch):
+        return pd.DataFrame(columns=['Count', 'Median', 'MAD'], index=pd.Index([], name='Lane'))
+    codes, lanes = pd.factorize(sketch['Lane'])
+    buckets = sketch['Bucket'].to_numpy(dtype='int64')
+    counts = sketch['Count'].to_numpy(dtype='float64')
+
+    order = np.lexsort((buckets, codes))
+    codes, values, counts = codes[order], bucket_values(buckets[order]), counts[order]
+    median_lanes, medians = _weighted_medians(codes, values, counts)
+    median = np.empty(len(lanes))
+    median[median_lanes] = medians
+
+    deviations = np.abs(values - median[codes])
+    order = np.lexsort((deviations, codes))
+    mad_lanes, mads = _weighted_medians(codes[order], deviations[order], counts[order])
+    mad = np.empty(len(lanes))
+    mad[mad_lanes] = mads
+
+    return pd.DataFrame({'Count': np.bincount(codes, weights=counts).astype('int64'),
+                         'Median': median, 'MAD': mad},
+                        index=pd.Index(lanes, name='Lane'))
+
+
+# ========================================
+# BASELINE STORE
+# ========================================
+
+class LaneBaselines:
+    """
+    SQLite store of per-lane sketches and the statistics derived from them
+    update() merges an invoice's charges into its lanes' sketches (each
+    invoice content once) and refreshes only those lanes' statistics
+    """
+
+    def __init__(self, path=DEFAULT_BASELINE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS lane_sketch (
+                lane TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (lane, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS lane_stats (
+                lane TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                median REAL NOT NULL,
+                mad REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS invoices (
+                content_hash TEXT PRIMARY KEY,
+                rows INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS settings (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        self.conn.execute("INSERT OR IGNORE INTO settings VALUES ('sketch_accuracy', ?)",
+                          (SKETCH_ACCURACY,))
+        stored = self.conn.execute(
+            "SELECT value FROM settings WHERE name = 'sketch_accuracy'").fetchone()[0]
+        if stored != SKETCH_ACCURACY:
+            raise ValueError(f"{path} was built with sketch accuracy {stored}, "
+                             f"this version uses {SKETCH_ACCURACY}; rebuild the baselines")
+        self.conn.commit()
+
+    def _select_lanes(self, table, columns, lanes):
+        """Rows of table for the given lanes (joined through a temp table, no IN-list limit)"""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_lanes (lane TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM wanted_lanes")
+        self.conn.executemany("INSERT OR IGNORE INTO wanted_lanes VALUES (?)",
+                              ((lane,) for lane in lanes))
+        return self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} JOIN wanted_lanes USING (lane)").fetchall()
+
+    def update(self, df):
+        """
+        Merge an invoice's positive charges into the lane sketches
+        Returns the number of charges added (0 when this content was already merged)
+        """
+        digest = content_hash(df)
+        if self.conn.execute("SELECT 1 FROM invoices WHERE content_hash = ?", (digest,)).fetchone():
+            return 0
+
+        values = charges(df)
+        known = ~np.isnan(values)
+        counts = pd.DataFrame({'Lane': lane_keys(df).to_numpy()[known],
+                               'Bucket': sketch_buckets(values[known])}) \
+            .groupby(['Lane', 'Bucket'], sort=False).size()
+        self.conn.executemany(
+            "INSERT INTO lane_sketch VALUES (?, ?, ?) "
+            "ON CONFLICT (lane, bucket) DO UPDATE SET count = count + excluded.count",
+            zip(counts.index.get_level_values(0).tolist(),
+                counts.index.get_level_values(1).tolist(), counts.tolist()))
+
+        touched = counts.index.get_level_values(0).unique()
+        sketch = pd.DataFrame(self._select_lanes('lane_sketch', ['lane', 'bucket', 'count'], touched),
+                              columns=['Lane', 'Bucket', 'Count'])
+        stats = lane_statistics(sketch)
+        self.conn.executemany("INSERT OR REPLACE INTO lane_stats VALUES (?, ?, ?, ?)",
+                              zip(stats.index.tolist(), stats['Count'].tolist(),
+                                  stats['Median'].tolist(), stats['MAD'].tolist()))
+        self.conn.execute("INSERT INTO invoices VALUES (?, ?)", (digest, int(known.sum())))
+        self.conn.commit()
+        return int(known.sum())
+
+    def statistics(self, lanes=None):
+        """Count, median and MAD per lane (all lanes when lanes is None)"""
+        columns = ['lane', 'count', 'median', 'mad']
+        rows = (self.conn.execute(f"SELECT {', '.join(columns)} FROM lane_stats").fetchall()
+                if lanes is None else self._select_lanes('lane_stats', columns, lanes))
+        return pd.DataFrame(rows, columns=['Lane', 'Count', 'Median', 'MAD']).set_index('Lane')
+
+    def score(self, df, threshold=DEFAULT_Z_THRESHOLD, min_count=DEFAULT_MIN_COUNT):
+        """
+        Robust z-score of every charge against its lane's baseline, indexed like df
+        Anomaly marks charges more than threshold above the lane median (high
+        side only: unusually cheap shipments are not overcharges) in lanes with
+        at least min_count charges of history
+        """
+        keys = lane_keys(df)
+        codes, lanes = pd.factorize(keys)
+        stats = self.statistics(lanes).reindex(lanes)
+        count = stats['Count'].fillna(0).to_numpy(dtype='int64')[codes]
+        median = stats['Median'].to_numpy(dtype='float64')[codes]
+        mad = stats['MAD'].to_numpy(dtype='float64')[codes]
+
+        values = charges(df)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = MAD_SCALE * (values - median) / np.maximum(mad, MIN_MAD_FRACTION * median)
+        anomaly = (count >= min_count) & (z > threshold)
+        return pd.DataFrame({'Lane': keys.to_numpy(), 'Charge': values, 'Lane_Count': count,
+                             'Lane_Median': np.round(median, 2), 'Lane_MAD': np.round(mad, 2),
+                             'Z_Score': np.round(z, 2), 'Anomaly': anomaly},
+                            index=df.index, columns=SCORE_COLUMNS)
+
+    def lane_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM lane_stats").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
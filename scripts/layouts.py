@@ -0,0 +1,274 @@
+"""
+Invoice Layout Detection
+Fingerprints an invoice file's header row (or first records, for headerless
+exports) against a registry of known carrier layouts and loads it with that
+layout's column map and dtype schema. Fingerprint -> layout resolutions are
+cached on disk, so a known layout costs one small read to recognise
+"""
+
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from invoice_sources import open_stream, read_invoice, read_invoice_chunks
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'layout_cache.json')
+
+# Records read to detect a layout
+PROBE_ROWS = 20
+
+UPS_TRACKING_PATTERN = r'^1Z[0-9A-Z]{16}$|^1Z\d{9}$'
+
+
+class Layout:
+    """
+    A known invoice file layout
+    signature: header names that identify the layout (header files), or
+    tracking_position + min_columns (headerless files)
+    column_map: raw column (name, or position for headerless) -> canonical name
+    """
+
+    def __init__(self, name, carrier, signature=(), column_map=None, dtypes=None,
+                 date_format=None, header=True, tracking_position=None, min_columns=0):
+        self.name = name
+        self.carrier = carrier
+        self.signature = list(signature)
+        self.column_map = dict(column_map or {})
+        self.dtypes = dict(dtypes or {})
+        self.date_format = date_format
+        self.header = header
+        self.tracking_position = tracking_position
+        self.min_columns = min_columns
+
+    def matches_header(self, names):
+        return self.header and bool(self.signature) and set(self.signature).issubset(names)
+
+    def matches_records(self, probe):
+        if self.header or probe.shape[1] < self.min_columns:
+            return False
+        tracking = probe.iloc[:, self.tracking_position].fillna('').astype(str).str.strip()
+        return tracking.str.match(UPS_TRACKING_PATTERN).mean() >= 0.5
+
+    def __repr__(self):
+        return f'Layout({self.name!r})'
+
+
+def _ups_billing_layout():
+    from ups_csv_structure_reference import UPS_KEY_COLUMNS
+
+    renames = {'Billable_Weight': 'Billed_Weight', 'Address_Correction': 'Address_Correction_Fee',
+               'Service_Code': 'Service_Type', 'Saturday_Delivery': 'Saturday_Delivery_Fee'}
+    # col_N is the Nth field of the record
+    column_map = {int(col[4:]) - 1: renames.get(name, name) for col, name in UPS_KEY_COLUMNS.items()}
+    text = ['Account_Number', 'Invoice_Number', 'Tracking_Number', 'Lead_Shipment_Number',
+            'Service_Type', 'Receiver_Postal_Code', 'Shipper_Postal_Code', 'Record_Type']
+    dtypes = {pos: str for pos, name in column_map.items() if name in text}
+    return Layout('ups_billing_250', 'UPS', column_map=column_map, dtypes=dtypes,
+                  date_format='%Y%m%d', header=False, tracking_position=11, min_columns=113)
+
+
+# ========================================
+# LAYOUT REGISTRY
+# ========================================
+
+LAYOUTS = [
+    Layout('ups_analyzer', 'UPS',
+           signature=['Tracking_Number', 'Service_Type', 'Billed_Weight', 'Net_Charge'],
+           dtypes={'Tracking_Number': str, 'Account_Number': str, 'Invoice_Number': str,
+                   'Origin_Zip': str, 'Dest_Zip': str}),
+    Layout('fedex_invoice_export', 'FEDEX',
+           signature=['Express or Ground Tracking ID', 'Bill to Account Number',
+                      'Net Charge Amount', 'Tracking ID Charge Description'],
+           column_map={
+               'Express or Ground Tracking ID': 'Tracking_Number',
+               'Bill to Account Number': 'Account_Number',
+               'Invoice Number': 'Invoice_Number',
+               'Invoice Date': 'Invoice_Date',
+               'Shipment Date': 'Ship_Date',
+               'POD Delivery Date': 'Delivery_Date',
+               'Service Type': 'Service_Type',
+               'Zone Code': 'Zone',
+               'Actual Weight Amount': 'Actual_Weight',
+               'Rated Weight Amount': 'Billed_Weight',
+               'Dim Length': 'Length',
+               'Dim Width': 'Width',
+               'Dim Height': 'Height',
+               'Transportation Charge Amount': 'Published_Charge',
+               'Net Charge Amount': 'Net_Charge',
+           },
+           dtypes={'Express or Ground Tracking ID': str, 'Bill to Account Number': str,
+                   'Invoice Number': str, 'Recipient Zip Code': str,
+                   'Original Recipient Zip Code': str, 'Shipper Zip Code': str},
+           date_format='%Y%m%d'),
+    Layout('dhl_express_invoice', 'DHL',
+           signature=['Waybill Number', 'Shipment Date', 'Product', 'Total Charge'],
+           column_map={'Waybill Number': 'Tracking_Number', 'Account Number': 'Account_Number',
+                       'Invoice Number': 'Invoice_Number', 'Invoice Date': 'Invoice_Date',
+                       'Shipment Date': 'Ship_Date', 'Product': 'Service_Type',
+                       'Weight': 'Actual_Weight', 'Billed Weight': 'Billed_Weight',
+                       'Total Charge': 'Net_Charge'},
+           dtypes={'Waybill Number': str, 'Account Number': str, 'Invoice Number': str}),
+    Layout('usps_postage_export', 'USPS',
+           signature=['Tracking Number', 'Mail Class', 'Postage'],
+           column_map={'Tracking Number': 'Tracking_Number', 'Mail Class': 'Service_Type',
+                       'Ship Date': 'Ship_Date', 'Zone': 'Zone', 'Weight': 'Actual_Weight',
+                       'Postage': 'Net_Charge'},
+           dtypes={'Tracking Number': str}),
+    _ups_billing_layout(),
+]
+
+
+# ========================================
+# DETECTION
+# ========================================
+
+def _normalize(name):
+    return re.sub(r'\s+', ' ', str(name)).strip()
+
+
+def fingerprint(probe):
+    """
+    Stable id for a file's layout: hash of the header row, or for headerless
+    files (first row is already a record) the field count plus which fields
+    hold tracking numbers
+    """
+    is_tracking = probe.fillna('').astype(str).apply(lambda c: c.str.match(UPS_TRACKING_PATTERN))
+    tracking = [i for i in range(probe.shape[1]) if is_tracking.iloc[1:, i].mean() >= 0.5]
+    if tracking and is_tracking.iloc[0, tracking].all():
+        return f'r:{probe.shape[1]}:{",".join(map(str, tracking))}'
+    first = [_normalize(v) for v in probe.iloc[0].fillna('')]
+    return 'h:' + hashlib.sha1('\x1f'.join(first).encode()).hexdigest()[:16]
+
+
+class LayoutDetector:
+    """Registry lookup with a persistent fingerprint -> layout-name cache"""
+
+    def __init__(self, layouts=None, cache_path=DEFAULT_CACHE_PATH):
+        self.layouts = {layout.name: layout for layout in (layouts or LAYOUTS)}
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def probe(self, path):
+        """First PROBE_ROWS records as strings, header row included"""
+        with open_stream(path) as stream:
+            return pd.read_csv(stream, header=None, nrows=PROBE_ROWS, dtype=str,
+                               encoding='latin-1', on_bad_lines='skip')
+
+    def match(self, probe):
+        names = {_normalize(v) for v in probe.iloc[0].dropna()}
+        candidates = [layout for layout in self.layouts.values() if layout.matches_header(names)]
+        if candidates:
+            return max(candidates, key=lambda layout: len(layout.signature))
+        return next((layout for layout in self.layouts.values() if layout.matches_records(probe)),
+                    None)
+
+    def detect(self, path):
+        """Layout of a file, or None if it matches no registered layout"""
+        probe = self.probe(path)
+        key = fingerprint(probe)
+        name = self.cache.get(key)
+        if name in self.layouts:
+            return self.layouts[name]
+
+        layout = self.match(probe)
+        if layout is not None:
+            self.cache[key] = layout.name
+            self._save()
+        return layout
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_path)
+
+
+_detector = None
+
+
+def _get_detector():
+    global _detector
+    if _detector is None:
+        _detector = LayoutDetector()
+    return _detector
+
+
+# ========================================
+# LOADING
+# ========================================
+
+def load_invoice(path, layout=None, detector=None, **read_kwargs):
+    """
+    Read an invoice file with its detected layout: dtype schema applied while
+    parsing, columns renamed to the canonical names the audit rules use,
+    dates parsed and a Carrier column added. Unknown layouts load as-is
+    """
+    if layout is None:
+        layout = (detector or _get_detector()).detect(path)
+    if layout is None:
+        return read_invoice(path, low_memory=False, **read_kwargs)
+
+    df = read_invoice(path, header=0 if layout.header else None, dtype=layout.dtypes or None,
+                      low_memory=False, **read_kwargs)
+    return _apply_layout(df, layout)
+
+
+def load_invoice_chunks(path, chunksize=100000, layout=None, detector=None):
+    """load_invoice, streamed as DataFrame chunks"""
+    if layout is None:
+        layout = (detector or _get_detector()).detect(path)
+    if layout is None:
+        yield from read_invoice_chunks(path, chunksize=chunksize, low_memory=False)
+        return
+    for chunk in read_invoice_chunks(path, chunksize=chunksize, header=0 if layout.header else None,
+                                     dtype=layout.dtypes or None, low_memory=False):
+        yield _apply_layout(chunk, layout)
+
+
+def _apply_layout(df, layout):
+    df = df.rename(columns=layout.column_map)
+    if 'Carrier' not in df.columns:
+        df['Carrier'] = layout.carrier
+
+    for col in [c for c in df.columns if isinstance(c, str) and 'date' in c.lower()]:
+        values = df[col]
+        if layout.date_format:
+            # YYYYMMDD fields parse as numbers when not in the dtype schema
+            if pd.api.types.is_numeric_dtype(values):
+                values = values.astype('Int64')
+            values = values.astype(str)
+        df[col] = pd.to_datetime(values, format=layout.date_format, errors='coerce')
+    df.attrs['layout'] = layout.name
+    return df
+
+
+def route_files(paths, detector=None):
+    """Group files by detected layout name (None for unrecognised files)"""
+    detector = detector or _get_detector()
+    routes = {}
+    for path in paths:
+        layout = detector.detect(path)
+        routes.setdefault(layout.name if layout else None, []).append(path)
+    return routes
+
+
+def load_directory(directory, detector=None):
+    """Yield (path, layout name, frame) for every invoice file in a directory"""
+    detector = detector or _get_detector()
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if not name.startswith('.') and os.path.isfile(os.path.join(directory, name)))
+    for name, files in route_files(paths, detector).items():
+        layout = detector.layouts.get(name)
+        for path in files:
+            frame = (load_invoice(path, layout=layout) if layout is not None
+                     else read_invoice(path, low_memory=False))
+            yield path, name, frame
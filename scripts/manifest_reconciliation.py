@@ -0,0 +1,280 @@
+"""
+Shipping Manifest Reconciliation
+Joins our own manifest (what we actually shipped: weight, dimensions, service,
+residential flag, validated address) to invoice shipments by tracking number
+and reports field-level mismatches. The manifest is the ground truth the
+dim-weight, address correction and residential rules check carrier data against
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings
+from carriers import billed_charge
+from rerating import billable_weight
+from invoice_sources import read_invoice_chunks
+
+# Canonical manifest columns and the header spellings accepted for each
+MANIFEST_ALIASES = {
+    'Tracking_Number': ['Tracking_Number', 'Tracking Number', 'TrackingNumber', 'Tracking ID',
+                        'Tracking', 'Package_Tracking_Number'],
+    'Manifest_Weight': ['Weight', 'Package_Weight', 'Actual_Weight', 'Ship_Weight', 'Weight_Lbs'],
+    'Manifest_Length': ['Length', 'Package_Length', 'Length_In'],
+    'Manifest_Width': ['Width', 'Package_Width', 'Width_In'],
+    'Manifest_Height': ['Height', 'Package_Height', 'Height_In'],
+    'Manifest_Service': ['Service', 'Service_Type', 'Service_Level', 'Ship_Method'],
+    'Manifest_Residential': ['Residential', 'Is_Residential', 'Residential_Flag',
+                             'Residential_Indicator', 'Address_Type'],
+    'Manifest_Address_1': ['Address_1', 'Address Line 1', 'Address1', 'Ship_To_Address_1', 'Street'],
+    'Manifest_Address_2': ['Address_2', 'Address Line 2', 'Address2', 'Ship_To_Address_2'],
+    'Manifest_City': ['City', 'Ship_To_City'],
+    'Manifest_State': ['State', 'Ship_To_State', 'Province'],
+    'Manifest_Postal_Code': ['Postal_Code', 'Zip', 'Zip_Code', 'ZIP', 'Ship_To_Zip'],
+}
+
+MANIFEST_DIM_COLUMNS = ['Manifest_Length', 'Manifest_Width', 'Manifest_Height']
+MANIFEST_ADDRESS_COLUMNS = ['Manifest_Address_1', 'Manifest_Address_2', 'Manifest_City',
+                            'Manifest_State', 'Manifest_Postal_Code']
+
+# Manifest address copied into the original-address layout used by the correction rule
+ORIGINAL_ADDRESS_COLUMNS = ['Original_Receiver_Address_1', 'Original_Receiver_Address_2',
+                            'Original_Receiver_City', 'Original_Receiver_State',
+                            'Original_Receiver_Postal_Code']
+
+RESIDENTIAL_VALUES = {'Y', 'YES', 'TRUE', '1', 'R', 'RES', 'RESIDENTIAL'}
+COMMERCIAL_VALUES = {'N', 'NO', 'FALSE', '0', 'C', 'COM', 'COMMERCIAL', 'BUSINESS'}
+
+WEIGHT_TOLERANCE = 1.0   # lbs; carriers round up to the next pound
+DIM_TOLERANCE = 1.0      # inches per side
+
+DEFAULT_CHUNKSIZE = 250000
+DEFAULT_PARTITIONS = 64
+
+
+def _key(name):
+    return ''.join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+def standardize_manifest(frame):
+    """Rename recognised manifest headers to the Manifest_* names; drop the rest"""
+    by_key = {_key(c): c for c in frame.columns}
+    renames = {}
+    for canonical, aliases in MANIFEST_ALIASES.items():
+        for alias in [canonical] + aliases:
+            source = by_key.get(_key(alias))
+            if source is not None and source not in renames:
+                renames[source] = canonical
+                break
+    if 'Tracking_Number' not in renames.values():
+        raise ValueError("Manifest has no tracking number column")
+
+    out = frame[list(renames)].rename(columns=renames)
+    out['Tracking_Number'] = out['Tracking_Number'].astype(str).str.strip()
+    return out
+
+
+def read_manifest(source, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield standardized manifest chunks from a CSV (optionally compressed or
+    zipped) or Parquet file or a DataFrame
+    Parquet is read one row-group batch at a time (requires pyarrow)
+    """
+    if isinstance(source, pd.DataFrame):
+        yield standardize_manifest(source)
+        return
+
+    if str(source).lower().endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield standardize_manifest(batch.to_pandas())
+    else:
+        for chunk in read_invoice_chunks(source, chunksize=chunksize, dtype=str):
+            yield standardize_manifest(chunk)
+
+
+def _numeric(frame, col):
+    if col not in frame.columns:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype='float64')
+
+
+# ========================================
+# JOINS
+# ========================================
+
+def join_manifest(df, manifest_chunks):
+    """
+    Manifest fields for each invoice row (NaN where the shipment is not in the manifest)
+    The invoice is the hash-join build side; manifest chunks stream past it,
+    so memory is the invoice plus its matching manifest rows
+    """
+    invoice = pd.Index(df['Tracking_Number'].astype(str).str.strip().to_numpy(), dtype=object)
+    build = invoice.unique()
+
+    matched = []
+    for chunk in manifest_chunks:
+        pos = build.get_indexer(chunk['Tracking_Number'].to_numpy())
+        if (pos >= 0).any():
+            matched.append(chunk[pos >= 0])
+
+    columns = list(MANIFEST_ALIASES)
+    if matched:
+        manifest = pd.concat(matched, ignore_index=True)
+        manifest = manifest.drop_duplicates('Tracking_Number', keep='last')
+    else:
+        manifest = pd.DataFrame(columns=columns)
+
+    pos = pd.Index(manifest['Tracking_Number'].to_numpy(), dtype=object).get_indexer(invoice)
+    found = pos >= 0
+    aligned = manifest.iloc[np.where(found, pos, 0)] if len(manifest) else manifest.reindex(range(len(df)))
+    aligned = aligned.reset_index(drop=True).set_axis(df.index)
+    aligned = aligned.reindex(columns=columns)
+    aligned[~found] = np.nan
+    aligned['Manifest_Matched'] = found
+    return aligned
+
+
+def _spill(frames, key_col, directory, side, partitions):
+    """Hash-partition frames into pickle files, one per (partition, chunk)"""
+    counts = np.zeros(partitions, dtype=int)
+    for n, frame in enumerate(frames):
+        keys = frame[key_col].astype(str).str.strip()
+        part = pd.util.hash_array(keys.to_numpy(dtype=object)) % np.uint64(partitions)
+        for p, rows in pd.Series(np.arange(len(frame))).groupby(part.astype('int64')):
+            frame.iloc[rows.to_numpy()].to_pickle(os.path.join(directory, f'{side}-p{p}-{n}.pkl'))
+            counts[p] += len(rows)
+    return counts
+
+
+def _load_partition(directory, side, p):
+    prefix = f'{side}-p{p}-'
+    frames = [pd.read_pickle(os.path.join(directory, name))
+              for name in sorted(os.listdir(directory)) if name.startswith(prefix)]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def partitioned_join(invoice_chunks, manifest_chunks, partitions=DEFAULT_PARTITIONS, workdir=None):
+    """
+    Grace hash join for inputs too large to hold in memory: both sides are
+    hash-partitioned to disk by tracking number, then joined one partition
+    at a time. Yields joined frames (invoice columns + Manifest_* columns);
+    peak memory is about one partition of each side
+    """
+    directory = tempfile.mkdtemp(prefix='manifest-join-', dir=workdir)
+    try:
+        invoice_counts = _spill(invoice_chunks, 'Tracking_Number', directory, 'invoice', partitions)
+        _spill(manifest_chunks, 'Tracking_Number', directory, 'manifest', partitions)
+
+        for p in np.flatnonzero(invoice_counts):
+            invoice = _load_partition(directory, 'invoice', p)
+            manifest = _load_partition(directory, 'manifest', p)
+            if manifest is None:
+                manifest = pd.DataFrame(columns=['Tracking_Number'])
+            aligned = join_manifest(invoice, [manifest]).drop(columns='Tracking_Number')
+            yield pd.concat([invoice, aligned], axis=1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# ========================================
+# FIELD-LEVEL MISMATCHES
+# ========================================
+
+def _service_key(values):
+    return (pd.Series(values, dtype=object).fillna('').astype(str).str.upper()
+            .str.replace(r'^(UPS|FEDEX|USPS)\s+', '', regex=True)
+            .str.replace(r'[^A-Z0-9]', '', regex=True))
+
+
+def residential_flags(values):
+    """Manifest residential flag as 1 / 0 / -1 (unknown)"""
+    text = pd.Series(values, dtype=object).fillna('').astype(str).str.strip().str.upper()
+    return np.where(text.isin(RESIDENTIAL_VALUES), 1,
+                    np.where(text.isin(COMMERCIAL_VALUES), 0, -1))
+
+
+def manifest_billable_weight(manifest):
+    """Billable weight from manifest weight and dimensions (NaN where unknown)"""
+    weight = _numeric(manifest, 'Manifest_Weight')
+    dims = [_numeric(manifest, c) for c in MANIFEST_DIM_COLUMNS]
+    has_dims = ~np.isnan(np.column_stack(dims)).any(axis=1)
+    with_dims = billable_weight(weight, *[np.nan_to_num(d) for d in dims])
+    return np.where(has_dims, with_dims, np.ceil(weight))
+
+
+def manifest_mismatches(df, manifest, surcharges=None):
+    """
+    Field-level comparison of invoice vs manifest, one row per invoice row
+    Mismatch flags are only True where both sides have a value
+    surcharges: canonical surcharge table for df (built when omitted)
+    """
+    matched = manifest['Manifest_Matched'].to_numpy()
+    result = pd.DataFrame({'Tracking_Number': df['Tracking_Number'].to_numpy(),
+                           'Matched': matched}, index=df.index)
+
+    weight_col = next((c for c in ['Actual_Weight', 'Billed_Weight'] if c in df.columns), None)
+    billed_weight = _numeric(df, weight_col) if weight_col else np.full(len(df), np.nan)
+    shipped_weight = _numeric(manifest, 'Manifest_Weight')
+    result['Weight_Delta'] = billed_weight - shipped_weight
+    result['Weight_Mismatch'] = np.nan_to_num(result['Weight_Delta'].to_numpy()) > WEIGHT_TOLERANCE
+
+    billed_dims = -np.sort(-np.column_stack([_numeric(df, c) for c in ['Length', 'Width', 'Height']]),
+                           axis=1)
+    shipped_dims = -np.sort(-np.column_stack([_numeric(manifest, c) for c in MANIFEST_DIM_COLUMNS]),
+                            axis=1)
+    with np.errstate(invalid='ignore'):
+        dims_differ = (np.abs(billed_dims - shipped_dims) > DIM_TOLERANCE).any(axis=1)
+    known_dims = ~np.isnan(billed_dims).any(axis=1) & ~np.isnan(shipped_dims).any(axis=1)
+    result['Dims_Mismatch'] = dims_differ & known_dims
+
+    if 'Service_Type' in df.columns and 'Manifest_Service' in manifest.columns:
+        billed_service = _service_key(df['Service_Type'].to_numpy())
+        shipped_service = _service_key(manifest['Manifest_Service'].to_numpy())
+        result['Service_Mismatch'] = (matched & (shipped_service != '').to_numpy()
+                                      & (billed_service != shipped_service).to_numpy())
+    else:
+        result['Service_Mismatch'] = False
+
+    flags = residential_flags(manifest['Manifest_Residential'].to_numpy())
+    billed_residential = billed_charge(df, 'residential', surcharges) > 0
+    result['Residential_Mismatch'] = (flags >= 0) & (billed_residential != (flags == 1))
+    return result
+
+
+# ========================================
+# GROUND-TRUTH RULES
+# ========================================
+
+def audit_manifest_residential(df, manifest, surcharge_col=None, surcharges=None):
+    """
+    Residential surcharges billed on shipments our manifest marks commercial
+    The charge comes from the canonical surcharge table (built when omitted)
+    unless a wide surcharge_col is named
+    Returns a findings frame (error type 'residential_incorrect')
+    """
+    billed = billed_charge(df, 'residential', surcharges, column=surcharge_col)
+    flags = residential_flags(manifest['Manifest_Residential'].to_numpy())
+    mask = (billed > 0) & (flags == 0)
+    return make_findings(df, mask, 'Residential Surcharge vs Manifest', 'residential_incorrect',
+                         billed, 0)
+
+
+def manifest_address_frame(df, manifest):
+    """
+    Invoice rows whose manifest carries an address, with that address in the
+    Original_Receiver_* columns so the address correction rule compares the
+    carrier's corrected address against what we actually shipped to
+    """
+    if not set(MANIFEST_ADDRESS_COLUMNS[:1] + MANIFEST_ADDRESS_COLUMNS[2:]).issubset(manifest.columns):
+        return None
+    rows = manifest['Manifest_Address_1'].notna().to_numpy()
+    if not rows.any():
+        return None
+    frame = df[rows].copy()
+    for source, target in zip(MANIFEST_ADDRESS_COLUMNS, ORIGINAL_ADDRESS_COLUMNS):
+        frame[target] = manifest.loc[rows, source].to_numpy()
+    return frame
@@ -0,0 +1,251 @@
+"""
+Intra-File Parallel Audit
+Splits one large invoice across worker processes. The parsed invoice is
+placed in multiprocessing.shared_memory as typed column arrays (strings as
+int32 dictionary codes), each worker gets zero-copy views of a row range,
+and only compact results travel back: per-rule findings as packed row
+bitmasks plus amount arrays, and re-rated charges written straight into a
+shared output column. No DataFrame is pickled
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import combine_findings
+from recovery_ranking import RecoveryRanking
+from rule_cache import encode_findings, decode_findings
+
+# Ranges per worker: small enough to balance uneven ranges, large enough to amortize setup
+RANGES_PER_WORKER = 4
+
+# Below this many rows process start-up costs more than the split saves
+MIN_PARALLEL_ROWS = 200000
+
+# Analyzer resources handed to workers (pickled once per worker, not per range)
+WORKER_RESOURCES = ['rate_engine', 'fuel_rates', 'address_classifier', 'accessorial_thresholds',
+                    'peak_rates']
+# Rule parameters set on the analyzer (class attributes overridden per run)
+WORKER_SETTINGS = ['DIM_WEIGHT_FACTOR', 'DIM_ERROR_PCT']
+
+
+def worker_resources(analyzer, names=WORKER_RESOURCES):
+    """
+    Analyzer resources for a worker initializer. The address classifier goes
+    as its spec: SQLite connections cannot be pickled (spawn, forkserver) and
+    must not be shared by forked processes, so each worker opens its own cache
+    """
+    resources = {name: getattr(analyzer, name) for name in names}
+    if resources.get('address_classifier') is not None:
+        resources['address_classifier'] = resources['address_classifier'].spec()
+    return resources
+
+
+def open_resources(resources):
+    """Inverse of worker_resources, in the worker process"""
+    if resources.get('address_classifier') is not None:
+        from address_classification import AddressClassifier
+        resources = dict(resources,
+                         address_classifier=AddressClassifier.from_spec(resources['address_classifier']))
+    return resources
+
+
+# ========================================
+# SHARED COLUMN BUFFERS
+# ========================================
+
+class SharedColumns:
+    """
+    A DataFrame's columns as arrays in shared memory blocks
+    spec (picklable, sent to workers once) lists per column: name, block
+    name, dtype, and for string columns the dictionary of distinct values
+    """
+
+    def __init__(self, df):
+        self.blocks = []
+        self.spec = []
+        self.rows = len(df)
+        for col in df.columns:
+            values = df[col]
+            uniques = None
+            if pd.api.types.is_bool_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+                array = values.to_numpy()
+            elif pd.api.types.is_datetime64_any_dtype(values):
+                array = values.to_numpy(dtype='datetime64[ns]')
+            elif pd.api.types.is_extension_array_dtype(values) and pd.api.types.is_numeric_dtype(values):
+                array = values.to_numpy(dtype='float64', na_value=np.nan)
+            elif pd.api.types.is_numeric_dtype(values):
+                array = values.to_numpy()
+            else:
+                codes, uniques = pd.factorize(values)
+                array = codes.astype('int32')
+                uniques = np.asarray(uniques, dtype=object)
+            self.spec.append((col, self._share(array), array.dtype.str, uniques))
+
+    def _share(self, array):
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+        self.blocks.append(block)
+        return block.name
+
+    def output(self, dtype='float64', fill=np.nan):
+        """(block name, array) of a new shared result column workers write into"""
+        array = np.full(self.rows, fill, dtype=dtype)
+        name = self._share(array)
+        return name, np.ndarray(array.shape, array.dtype, buffer=self.blocks[-1].buf)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec, rows):
+    """Column arrays backed by the shared blocks (worker side)"""
+    blocks, columns = [], {}
+    for col, name, dtype, uniques in spec:
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        columns[col] = (np.ndarray((rows,), np.dtype(dtype), buffer=block.buf), uniques)
+    return blocks, columns
+
+
+def frame_view(columns, start, stop):
+    """DataFrame over rows [start, stop); numeric columns are views, strings decoded per range"""
+    data = {}
+    for col, (array, uniques) in columns.items():
+        values = array[start:stop]
+        if uniques is not None:
+            decoded = np.empty(len(values), dtype=object)
+            known = values >= 0
+            decoded[known] = uniques[values[known]]
+            decoded[~known] = np.nan
+            values = decoded
+        data[col] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(start, stop), copy=False)
+
+
+def row_ranges(rows, parts):
+    bounds = np.linspace(0, rows, max(1, min(parts, rows)) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+# ========================================
+# WORKERS
+# ========================================
+
+_worker = {}
+
+
+def _init_worker(spec, rows, resources, settings):
+    from ups_billing_analyzer import UPSBillingAnalyzer
+
+    _worker['rows'] = rows
+    _worker['blocks'], _worker['columns'] = attach(spec, rows)
+    analyzer = UPSBillingAnalyzer(**open_resources(resources))
+    for name, value in settings.items():
+        setattr(analyzer, name, value)
+    _worker['analyzer'] = analyzer
+
+
+def _rules_range(bounds):
+    """
+    Row-local rules over one range; returns {rule_id: (groups, payload)}, the
+    range's billed amounts per charge code and its findings' ranking (rows by position)
+    """
+    start, stop = bounds
+    analyzer = _worker['analyzer']
+    analyzer.df = frame_view(_worker['columns'], start, stop)
+    analyzer.identify_overcharges(file_rules=False)
+    return bounds, {rule_id: encode_findings(findings, analyzer.df.index)
+                    for rule_id, findings in analyzer.rule_results.items()}, \
+        analyzer.billed, analyzer.ranking
+
+
+def _rerate_range(args):
+    """Re-rate one range into the shared output column"""
+    (start, stop), out_name = args
+    view = frame_view(_worker['columns'], start, stop)
+    out = shared_memory.SharedMemory(name=out_name)
+    try:
+        net = np.ndarray((_worker['rows'],), 'float64', buffer=out.buf)
+        net[start:stop] = _worker['analyzer'].rate_engine.expected_net(view)
+    finally:
+        out.close()
+    return stop - start
+
+
+def _pool(shared, analyzer, workers):
+    resources = worker_resources(analyzer)
+    settings = {name: getattr(analyzer, name) for name in WORKER_SETTINGS}
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(shared.spec, shared.rows, resources, settings))
+
+
+def default_workers():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+
+# ========================================
+# PARALLEL ENTRY POINTS
+# ========================================
+
+def parallel_identify_overcharges(analyzer, workers=None, min_rows=MIN_PARALLEL_ROWS):
+    """
+    analyzer.identify_overcharges() with the row-local rules evaluated in
+    worker processes over row ranges of the shared invoice. Rules that need
+    the whole file (duplicates, adjustments, cross-invoice history) and
+    manifest joins run in this process, which takes the workers' billed
+    amounts and rankings instead of normalizing and ranking the invoice
+    again. Returns the same overcharges
+    """
+    workers = workers or default_workers()
+    if (workers < 2 or analyzer.manifest is not None or analyzer.df is None
+            or len(analyzer.df) < min_rows):
+        return analyzer.identify_overcharges()
+
+    df = analyzer.df
+    ranges = row_ranges(len(df), workers * RANGES_PER_WORKER)
+    merged, billed, ranking = {}, {}, RecoveryRanking()
+    with SharedColumns(df) as shared, _pool(shared, analyzer, workers) as pool:
+        for (start, stop), results, range_billed, range_ranking in pool.map(_rules_range,
+                                                                            ranges):
+            part = df.iloc[start:stop]
+            for rule_id, (groups, payload) in results.items():
+                merged.setdefault(rule_id, []).append(decode_findings(groups, payload, part))
+            # A code billed in no row of a range is absent from that range's amounts
+            for code, amounts in range_billed.items():
+                billed.setdefault(code, np.zeros(len(df)))[start:stop] = amounts
+            ranking.merge(range_ranking.relabel(df.index))
+
+    analyzer.precomputed = {rule_id: combine_findings(frames) for rule_id, frames in merged.items()}
+    analyzer.precomputed_billed = billed
+    analyzer.precomputed_ranking = ranking
+    try:
+        return analyzer.identify_overcharges()
+    finally:
+        analyzer.precomputed = analyzer.precomputed_billed = analyzer.precomputed_ranking = None
+
+
+def parallel_expected_net(analyzer, df=None, workers=None, min_rows=MIN_PARALLEL_ROWS):
+    """Expected net charge per row via RatingEngine.expected_net, one row range per task"""
+    df = analyzer.df if df is None else df
+    workers = workers or default_workers()
+    if workers < 2 or len(df) < min_rows:
+        return analyzer.rate_engine.expected_net(df)
+
+    with SharedColumns(df) as shared, _pool(shared, analyzer, workers) as pool:
+        out_name, net = shared.output()
+        tasks = [(bounds, out_name) for bounds in row_ranges(len(df), workers * RANGES_PER_WORKER)]
+        list(pool.map(_rerate_range, tasks))
+        return net.copy()
@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+ParcelAudit command line
+Lightweight entry point for cron jobs and the upload path. Only argparse is
+imported at startup; pandas/NumPy load inside the subcommands that need them
+and plotting libraries only when a dashboard is rendered
+
+Usage:
+    python scripts/parcelaudit.py audit invoice.csv [--rates rates.csv] [--fuel fuel.csv]
+    python scripts/parcelaudit.py audit rebills.csv --originals invoices/2025-0*.csv
+    python scripts/parcelaudit.py summarize invoice.csv
+    python scripts/parcelaudit.py estimate invoice.csv [--background-findings findings.csv]
+    python scripts/parcelaudit.py export invoice.csv -o report.xlsx [--dashboard dash.png]
+    python scripts/parcelaudit.py charges invoice.csv [--unknowns unknowns.csv]
+    python scripts/parcelaudit.py reaudit invoices/ [--dim-factor 1.4]
+    python scripts/parcelaudit.py baselines invoices/ [--baselines lanes.db]
+    python scripts/parcelaudit.py cube --by Month Error_Type [--where Carrier=FEDEX]
+    python scripts/parcelaudit.py watch inbox/ [--workers 4] [--queue-size 32]
+    python scripts/parcelaudit.py jobs
+    python scripts/parcelaudit.py das-lookup 01002 98223
+    python scripts/parcelaudit.py benchmark [--rows 100000] [--imports]
+"""
+
+import argparse
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+DAS_ZIPS_PATH = os.path.join(REPO_ROOT, 'data', 'fedex_das_zips_2025_tagged.csv')
+DEFAULT_RULE_CACHE = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'rule_cache.db')
+DEFAULT_BASELINES = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'lane_baselines.db')
+DEFAULT_CUBE = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'audit_cube.npz')
+DEFAULT_JOB_DB = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'ingest.db')
+
+# Modules that must never be loaded just by starting the CLI
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn']
+
+
+def _analyzer(args, load=True):
+    """Build an analyzer with whichever optional rule resources were requested"""
+    import warnings
+    warnings.simplefilter('ignore', FutureWarning)
+
+    from ups_billing_analyzer import UPSBillingAnalyzer
+
+    rate_engine = fuel_rates = peak_rates = classifier = tracking_filter = history = cache = None
+    baselines = None
+    if getattr(args, 'rates', None):
+        from rerating import RateTable, DiscountSchedule, RatingEngine
+        discounts = DiscountSchedule.from_csv(args.discounts) if args.discounts else None
+        contract = RateTable.from_csv(args.contract) if args.contract else None
+        rate_engine = RatingEngine(RateTable.from_csv(args.rates), discounts, contract)
+    if getattr(args, 'fuel', None):
+        from fuel_audit import FuelRateTable
+        fuel_rates = FuelRateTable.from_csv(args.fuel)
+    if getattr(args, 'peak', None):
+        from peak_surcharges import PeakSurchargeTable
+        peak_rates = PeakSurchargeTable.from_csv(args.peak)
+    if getattr(args, 'classify', False):
+        from address_classification import AddressClassifier
+        classifier = AddressClassifier()
+    if getattr(args, 'history', None):
+        from tracking_filter import TrackingFilter
+        from history_store import HistoryStore
+        tracking_filter = TrackingFilter(os.path.join(args.history, 'tracking_filter'))
+        history = HistoryStore(os.path.join(args.history, 'shipments'))
+    if getattr(args, 'rule_cache', None):
+        from rule_cache import RuleCache
+        cache = RuleCache(args.rule_cache)
+    if getattr(args, 'baselines', None):
+        from lane_baselines import LaneBaselines
+        baselines = LaneBaselines(args.baselines)
+
+    analyzer = UPSBillingAnalyzer(rate_engine=rate_engine, fuel_rates=fuel_rates,
+                                  address_classifier=classifier,
+                                  manifest=getattr(args, 'manifest', None),
+                                  tracking_filter=tracking_filter, history_store=history,
+                                  peak_rates=peak_rates, rule_cache=cache,
+                                  lane_baselines=baselines,
+                                  originals=getattr(args, 'originals', None))
+    if getattr(args, 'dim_factor', None):
+        analyzer.DIM_WEIGHT_FACTOR = args.dim_factor
+    if getattr(args, 'dim_error_pct', None):
+        analyzer.DIM_ERROR_PCT = args.dim_error_pct
+    if load:
+        analyzer.load_data(args.file, sample_on_error=False)
+    return analyzer
+
+
+# ========================================
+# SUBCOMMANDS
+# ========================================
+
+def cmd_audit(args):
+    analyzer = _analyzer(args)
+    if args.workers:
+        from parallel_audit import parallel_identify_overcharges
+        parallel_identify_overcharges(analyzer, args.workers)
+    else:
+        analyzer.identify_overcharges()
+    analyzer.calculate_potential_savings()
+    if args.findings:
+        analyzer.findings.to_csv(args.findings, index_label='Row')
+        print(f"Findings written to {args.findings}")
+    if args.cube:
+        from audit_cube import AuditCube, cube_lock
+        with cube_lock(args.cube):
+            cube = AuditCube(args.cube)
+            added = cube.add(analyzer.df, analyzer.findings, analyzer.shipments,
+                             rule_keys=analyzer.rule_keys())
+            if added:
+                cube.save()
+        if added:
+            print(f"Added to the audit cube in {args.cube} ({len(cube.cells):,} cells)")
+        else:
+            print(f"Invoice already in the audit cube {args.cube} under these rules")
+    if analyzer.anomalies is not None:
+        from lane_baselines import DEFAULT_Z_THRESHOLD
+        flagged = analyzer.anomalies[analyzer.anomalies['Anomaly']]
+        print(f"\n{len(flagged):,} charge(s) abnormal for their lane "
+              f"(robust z > {DEFAULT_Z_THRESHOLD}, for review)")
+        if len(flagged):
+            print(flagged.sort_values('Z_Score', ascending=False).head(10).to_string())
+        if args.anomalies:
+            flagged.to_csv(args.anomalies, index_label='Row')
+            print(f"Lane anomalies written to {args.anomalies}")
+    if args.record:
+        if analyzer.tracking_filter is None and analyzer.lane_baselines is None:
+            print("--record needs --history and/or --baselines")
+            return 1
+        if analyzer.tracking_filter is not None:
+            if analyzer.history_store.recorded(analyzer.df):
+                print(f"Invoice already recorded in {args.history}")
+            else:
+                analyzer.history_store.append(analyzer.df)
+                analyzer.tracking_filter.add(analyzer.df)
+                print(f"Recorded {len(analyzer.df):,} shipments in {args.history}")
+        if analyzer.lane_baselines is not None:
+            added = analyzer.lane_baselines.update(analyzer.df)
+            print(f"Added {added:,} charges to the lane baselines in {args.baselines}")
+    if args.top:
+        print(f"\nTop {args.top} recoveries:")
+        columns = ['Tracking_Number', 'Rule', 'Account', 'Recovery_Amount']
+        print(analyzer.ranking.top(args.top)[columns].to_string(index=False))
+    if args.mismatches and analyzer.manifest_report is not None:
+        analyzer.manifest_report.to_csv(args.mismatches, index_label='Row')
+        print(f"Manifest mismatches written to {args.mismatches}")
+    return 0
+
+
+def cmd_summarize(args):
+    analyzer = _analyzer(args)
+    summary = analyzer.generate_summary_statistics()
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            print(f"\n{key}:")
+            for k, v in value.items():
+                print(f"  {k}: {v}")
+        else:
+            print(f"  {key}: {value}")
+    return 0
+
+
+def cmd_export(args):
+    analyzer = _analyzer(args)
+    analyzer.generate_summary_statistics()
+    analyzer.identify_overcharges()
+    analyzer.export_audit_report(args.output)
+    if args.dashboard:
+        analyzer.visualize_data(output=args.dashboard)
+    return 0
+
+
+def _background_audit(args):
+    """Start the full audit of the same file in a detached process"""
+    import subprocess
+
+    command = [sys.executable, os.path.abspath(__file__), 'audit', args.file,
+               '--findings', args.background_findings]
+    for flag in ('rates', 'contract', 'discounts', 'fuel', 'peak', 'manifest', 'history'):
+        if getattr(args, flag, None):
+            command += [f'--{flag}', getattr(args, flag)]
+    if args.classify:
+        command.append('--classify')
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def cmd_estimate(args):
+    """Stratified-sample recovery estimate; optionally start the full audit behind it"""
+    import time
+    from sample_estimate import sample_file, estimate_recovery
+
+    start = time.perf_counter()
+    if args.background_findings:
+        process = _background_audit(args)
+        print(f"Full audit running in background (pid {process.pid}) -> {args.background_findings}")
+
+    reservoir = sample_file(args.file, per_stratum=args.per_stratum)
+    estimate = estimate_recovery(_analyzer(args, load=False), reservoir)
+
+    print(f"\nSampled {len(reservoir.sample):,} of {reservoir.rows_seen:,} shipments "
+          f"across {len(reservoir.counts):,} strata in {time.perf_counter() - start:.1f}s")
+    for row in estimate.itertuples(index=False):
+        print(f"  {row.Error_Type:22} ${row.Estimated_Recovery:>12,.2f}  "
+              f"(95% CI ${row.CI_Low:,.2f} - ${row.CI_High:,.2f})")
+    print(f"  {'Total':22} ${estimate['Estimated_Recovery'].sum():>12,.2f}")
+    return 0
+
+
+def cmd_charges(args):
+    """Canonical charge totals for an invoice, plus descriptions needing curation"""
+    import warnings
+    warnings.simplefilter('ignore', FutureWarning)
+    from layouts import load_invoice
+    from carriers import normalize_surcharges
+    from charge_normalizer import ChargeNormalizer
+
+    normalizer = ChargeNormalizer.from_csv(args.aliases) if args.aliases else ChargeNormalizer()
+    surcharges = normalize_surcharges(load_invoice(args.file), normalizer=normalizer)
+    totals = surcharges.groupby('Charge_Code', observed=True)['Amount_Cents'].agg(['size', 'sum'])
+    for code, row in totals.iterrows():
+        print(f"  {code:28} {row['size']:>8,} lines  ${row['sum'] / 100:>12,.2f}")
+
+    unknowns = normalizer.unknowns()
+    print(f"\n{len(unknowns)} description(s) not in the alias table")
+    if len(unknowns):
+        print(unknowns.head(20).to_string(index=False))
+    if args.unknowns:
+        unknowns.to_csv(args.unknowns, index=False)
+        print(f"Unknown descriptions written to {args.unknowns}")
+    return 0
+
+
+def _invoice_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if not name.startswith('.') and os.path.isfile(os.path.join(path, name)))
+        else:
+            files.append(path)
+    return files
+
+
+def cmd_reaudit(args):
+    """
+    Re-score many invoices: unchanged files whose rule keys all match come
+    straight from the rule cache; other files re-run only their stale rules
+    """
+    import time
+    import pandas as pd
+    from layouts import load_invoice
+
+    start = time.perf_counter()
+    analyzer = _analyzer(args, load=False)
+    cache = analyzer.rule_cache
+    keys = analyzer.rule_keys()
+
+    totals, estimates, from_cache, evaluated = [], [], 0, 0
+    for path in _invoice_files(args.paths):
+        content = cache.file_hash(path)
+        if content is None or not cache.run_current(content, keys):
+            analyzer.df = load_invoice(path)
+            analyzer.identify_overcharges()
+            content = analyzer.content_hash
+            cache.remember_file(path, content)
+            evaluated += 1
+        else:
+            from_cache += 1
+        totals.append(cache.totals(content, keys))
+        estimates.append(cache.estimates(content))
+
+    totals = pd.concat(totals) if totals else pd.DataFrame(columns=['Rule', 'Count', 'Recovery'])
+    by_rule = totals.groupby('Rule', sort=False)[['Count', 'Recovery']].sum() \
+        .sort_values('Recovery', ascending=False)
+    for rule, row in by_rule.iterrows():
+        print(f"  {rule:45} {int(row['Count']):>8,}  ${row['Recovery']:>12,.2f}")
+    print(f"  {'Total':45} {int(by_rule['Count'].sum()):>8,}  ${by_rule['Recovery'].sum():>12,.2f}")
+    estimates = pd.concat(estimates) if estimates else pd.DataFrame(columns=['Estimate', 'Count', 'Savings'])
+    if len(estimates):
+        print("\nHeuristic estimates (not in the total):")
+        for estimate, row in estimates.groupby('Estimate', sort=False)[['Count', 'Savings']].sum().iterrows():
+            print(f"  {estimate:45} {int(row['Count']):>8,}  ${row['Savings']:>12,.2f}")
+    print(f"\n{from_cache + evaluated} invoice(s): {from_cache} from cache, {evaluated} re-evaluated "
+          f"({cache.misses} rule result(s) recomputed, {cache.hits} reused) "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def cmd_baselines(args):
+    """Merge invoices into the lane baselines (files already merged are skipped)"""
+    import time
+    import warnings
+    warnings.simplefilter('ignore', FutureWarning)
+    from layouts import load_invoice
+    from lane_baselines import LaneBaselines
+
+    start = time.perf_counter()
+    baselines = LaneBaselines(args.baselines)
+    added = merged = 0
+    for path in _invoice_files(args.paths):
+        charges = baselines.update(load_invoice(path))
+        added += charges
+        merged += charges > 0
+    print(f"Merged {merged} invoice(s), {added:,} charges; {baselines.lane_count():,} lanes "
+          f"in {args.baselines} ({time.perf_counter() - start:.2f}s)")
+    return 0
+
+
+def cmd_cube(args):
+    """Roll-up / drill-down over the audit cube (no shipment data is read)"""
+    import time
+    from audit_cube import AuditCube, ALL_SHIPMENTS
+
+    start = time.perf_counter()
+    cube = AuditCube(args.cube)
+    loaded = time.perf_counter()
+    where = {}
+    for condition in args.where or []:
+        dim, _, value = condition.partition('=')
+        where.setdefault(dim, []).append(value)
+    try:
+        result = cube.query(args.by or (), [ALL_SHIPMENTS] if args.shipments else None, **where)
+    except ValueError as e:
+        print(e)
+        return 1
+    done = time.perf_counter()
+
+    if args.json:
+        print(result.reset_index().to_json(orient='records'))
+    else:
+        print(result.to_string())
+        print(f"\n{len(cube.cells):,} cells, {len(cube.invoices):,} invoices; "
+              f"load {(loaded - start) * 1000:.1f} ms, query {(done - loaded) * 1000:.1f} ms")
+    return 0
+
+
+def cmd_watch(args):
+    """Run the watch-folder ingestion daemon over an inbox directory"""
+    from ingest_daemon import IngestDaemon, JobLog
+    from parallel_audit import WORKER_RESOURCES, WORKER_SETTINGS, default_workers, worker_resources
+
+    analyzer = _analyzer(args, load=False)
+    # Each worker reads the manifest itself (a path; never joined in parallel_audit's workers)
+    resources = worker_resources(analyzer, WORKER_RESOURCES + ['manifest'])
+    settings = {name: getattr(analyzer, name) for name in WORKER_SETTINGS}
+    daemon = IngestDaemon(args.inbox, resources, settings,
+                          workers=args.workers or default_workers(),
+                          queue_size=args.queue_size, poll_interval=args.interval,
+                          settle_seconds=args.settle, job_log=JobLog(args.jobs))
+    print(f"Watching {daemon.inbox} with {daemon.workers} worker(s), queue of {args.queue_size} "
+          f"(previews in {daemon.dirs['preview']})")
+    counts = daemon.run(once=args.once)
+    print(f"Stopped: {', '.join(f'{n} {s}' for s, n in sorted(counts.items())) or 'no jobs'}; "
+          f"queue was full {daemon.backpressure_events} time(s)")
+    return 0
+
+
+def cmd_jobs(args):
+    """Progress and timings of recent ingestion jobs"""
+    from ingest_daemon import JobLog
+
+    log = JobLog(args.jobs)
+    for job_id, kind, status, path, rows, recovery, waited, ran, error in log.recent(args.limit):
+        detail = error.strip().splitlines()[-1] if error else (
+            f"{rows:,} rows  ${recovery:,.2f}" if rows is not None else '')
+        timing = ' '.join(f"{label} {value:.1f}s" for label, value in (('waited', waited), ('ran', ran))
+                          if value is not None)
+        print(f"{job_id:>6} {kind:8} {status:11} {os.path.basename(path):40} {timing:22} {detail}")
+    print(', '.join(f'{n} {s}' for s, n in sorted(log.counts().items())) or 'No jobs')
+    return 0
+
+
+def cmd_das_lookup(args):
+    """DAS tier per ZIP from the tagged FedEx DAS list (csv module only, no pandas)"""
+    import csv
+
+    wanted = {z.strip()[:5].zfill(5) for z in args.zips}
+    found = {}
+    with open(args.data, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['zip'] in wanted:
+                found.setdefault(row['zip'], []).append(f"{row['service']}: {row['tier']}")
+
+    for zip_code in sorted(wanted):
+        tiers = found.get(zip_code)
+        print(f"{zip_code}  {'; '.join(tiers) if tiers else 'not a DAS ZIP'}")
+    return 0
+
+
+def import_check():
+    """
+    Start a fresh interpreter, import this module and report startup time and
+    any heavy modules that were loaded (the import-time regression check)
+    """
+    import subprocess
+    import time
+
+    code = ("import sys, parcelaudit; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=SCRIPTS_DIR,
+                         capture_output=True, text=True, check=True).stdout.strip()
+    return time.perf_counter() - start, [m for m in out.split(',') if m]
+
+
+def cmd_benchmark(args):
+    import time
+
+    elapsed, loaded = import_check()
+    print(f"CLI startup: {elapsed * 1000:.0f} ms, heavy modules loaded: {loaded or 'none'}")
+    if loaded:
+        print("FAIL: heavy modules imported at CLI startup")
+        return 1
+    if args.imports:
+        return 0
+
+    if args.kernels:
+        import kernels
+        status = 0
+        for result in kernels.self_check(args.rows):
+            jit = f"{result['jit']:.3f}s" if result['jit'] is not None else 'n/a (no Numba)'
+            check = {None: 'skipped', True: 'equal', False: 'MISMATCH'}[result['equal']]
+            print(f"Kernel {result['name']:15} numpy {result['numpy']:.3f}s  jit {jit}  {check}")
+            status |= result['equal'] is False
+        if status:
+            return 1
+
+    import warnings
+    warnings.simplefilter('ignore', FutureWarning)
+    from ups_billing_analyzer import UPSBillingAnalyzer
+    from rerating import default_rate_table, DiscountSchedule, RatingEngine
+
+    table = default_rate_table()
+    engine = RatingEngine(table, DiscountSchedule.flat(table.services, {'Incentive Credit': 15}))
+    analyzer = UPSBillingAnalyzer(rate_engine=engine)
+
+    start = time.perf_counter()
+    analyzer.df = analyzer.generate_sample_data(args.rows)
+    print(f"Generate {len(analyzer.df):,} rows: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    engine.rerate(analyzer.df)
+    print(f"Re-rate: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    analyzer.identify_overcharges()
+    print(f"identify_overcharges: {time.perf_counter() - start:.2f}s")
+
+    if args.workers:
+        from parallel_audit import parallel_identify_overcharges, parallel_expected_net
+
+        start = time.perf_counter()
+        parallel_expected_net(analyzer, workers=args.workers, min_rows=0)
+        print(f"Re-rate ({args.workers} workers): {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        parallel_identify_overcharges(analyzer, args.workers, min_rows=0)
+        print(f"identify_overcharges ({args.workers} workers): {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+# ========================================
+# ARGUMENT PARSING
+# ========================================
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='parcelaudit', description='Parcel invoice audit tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_file_args(p):
+        p.add_argument('file', help='Invoice CSV file (.gz, .bz2, .zst and .zip accepted)')
+        add_rule_args(p)
+
+    def add_rule_args(p, stores=True):
+        """stores=False leaves out the history, rule cache and baselines (opened per process)"""
+        p.add_argument('--rates', help='Published rate table CSV (Service, Zone, Weight, Rate)')
+        p.add_argument('--contract', help='Contract rate table CSV (same layout)')
+        p.add_argument('--discounts', help='Discount schedule CSV (Service, Discount, Percent)')
+        p.add_argument('--fuel', help='Fuel table CSV (Carrier, Service_Group, Effective_Date, Percent)')
+        p.add_argument('--peak',
+                       help='Peak window CSV (Carrier, Charge, Service_Group, Start, End, Amount)')
+        p.add_argument('--classify', action='store_true',
+                       help='Classify recipient addresses for the residential rule')
+        p.add_argument('--manifest', help='Our shipping manifest (CSV or Parquet) to check against')
+        p.add_argument('--dim-factor', type=float,
+                       help='Flag billed weight above this multiple of the dim weight (default 1.5)')
+        p.add_argument('--dim-error-pct', type=float,
+                       help='Flag billed dim weight this many percent off L x W x H (default 10)')
+        if not stores:
+            return
+        p.add_argument('--history', help='Shipment history directory for cross-invoice duplicates')
+        p.add_argument('--rule-cache', nargs='?', const=DEFAULT_RULE_CACHE,
+                       help=f'Reuse unchanged rule results from this cache (default {DEFAULT_RULE_CACHE})')
+        p.add_argument('--baselines', nargs='?', const=DEFAULT_BASELINES,
+                       help=f'Score charges against lane baselines (default {DEFAULT_BASELINES})')
+
+    p = sub.add_parser('audit', help='Identify overcharges in an invoice')
+    add_file_args(p)
+    p.add_argument('--findings', help='Write per-shipment findings to this CSV')
+    p.add_argument('--mismatches', help='Write invoice vs manifest field mismatches to this CSV')
+    p.add_argument('--record', action='store_true',
+                   help='Add this invoice to the --history store and --baselines after auditing')
+    p.add_argument('--anomalies', help='Write charges abnormal for their lane to this CSV')
+    p.add_argument('--cube', nargs='?', const=DEFAULT_CUBE,
+                   help=f'Fold the audit into the dashboard cube (default {DEFAULT_CUBE})')
+    p.add_argument('--originals', nargs='+', metavar='PATH',
+                   help='Earlier invoice files holding the original shipments rebilled by '
+                        'this invoice\'s adjustment records')
+    p.add_argument('--top', type=int, help='Print the N largest recoveries (up to 50)')
+    p.add_argument('--workers', type=int,
+                   help='Evaluate rules over row ranges in N processes (large invoices)')
+    p.set_defaults(func=cmd_audit)
+
+    p = sub.add_parser('summarize', help='Summary statistics for an invoice')
+    add_file_args(p)
+    p.set_defaults(func=cmd_summarize)
+
+    p = sub.add_parser('export', help='Export the Excel audit report')
+    add_file_args(p)
+    p.add_argument('-o', '--output', default='ups_audit_report.xlsx')
+    p.add_argument('--dashboard', help='Also render the dashboard to this PNG/SVG file')
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('estimate', help='Fast sample-based recovery estimate for large invoices')
+    add_file_args(p)
+    p.add_argument('--per-stratum', type=int, default=200,
+                   help='Sampled shipments per service/zone/weight-band stratum')
+    p.add_argument('--background-findings',
+                   help='Also run the full audit in the background, writing findings here')
+    p.set_defaults(func=cmd_estimate)
+
+    p = sub.add_parser('charges', help='Canonical charge totals and unmapped charge descriptions')
+    p.add_argument('file', help='Invoice CSV file (.gz, .bz2, .zst and .zip accepted)')
+    p.add_argument('--aliases', help='Curated alias CSV (Alias, Charge_Code) added to the defaults')
+    p.add_argument('--unknowns', help='Write fuzzy-matched and unknown descriptions to this CSV')
+    p.set_defaults(func=cmd_charges)
+
+    p = sub.add_parser('reaudit', help='Re-score many invoices, re-running only changed rules')
+    p.add_argument('paths', nargs='+', help='Invoice files or directories')
+    add_rule_args(p)
+    p.set_defaults(func=cmd_reaudit, rule_cache=DEFAULT_RULE_CACHE)
+
+    p = sub.add_parser('baselines', help='Build or extend per-lane charge baselines from invoices')
+    p.add_argument('paths', nargs='+', help='Invoice files or directories')
+    p.add_argument('--baselines', default=DEFAULT_BASELINES, help='Baseline database')
+    p.set_defaults(func=cmd_baselines)
+
+    p = sub.add_parser('cube', help='Query audit totals by account, month, carrier, service, zone, '
+                                     'error type')
+    p.add_argument('--cube', default=DEFAULT_CUBE, help='Audit cube file')
+    p.add_argument('--by', nargs='+', help='Dimensions to group by (Account Month Carrier Service '
+                                           'Zone Error_Type)')
+    p.add_argument('--where', nargs='+', metavar='DIM=VALUE',
+                   help='Keep cells with these values (repeat a dimension for OR)')
+    p.add_argument('--shipments', action='store_true',
+                   help='All-shipment totals instead of findings totals')
+    p.add_argument('--json', action='store_true', help='Print records as JSON')
+    p.set_defaults(func=cmd_cube)
+
+    p = sub.add_parser('watch', help='Audit invoices dropped into an inbox directory')
+    p.add_argument('inbox', help='Inbox directory (previews go in <inbox>/preview)')
+    add_rule_args(p, stores=False)
+    p.add_argument('--workers', type=int, help='Audit worker processes (default: CPUs)')
+    p.add_argument('--queue-size', type=int, default=32,
+                   help='Jobs queued ahead of the workers before new uploads wait in the inbox')
+    p.add_argument('--interval', type=float, default=2.0, help='Seconds between inbox scans')
+    p.add_argument('--settle', type=float, default=2.0,
+                   help='Seconds a file must be unmodified before it is picked up')
+    p.add_argument('--jobs', default=DEFAULT_JOB_DB, help='Job log database')
+    p.add_argument('--once', action='store_true', help='Exit once the inbox is empty')
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser('jobs', help='Progress and timings of ingestion jobs')
+    p.add_argument('--jobs', default=DEFAULT_JOB_DB, help='Job log database')
+    p.add_argument('--limit', type=int, default=20)
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser('das-lookup', help='Look up FedEx DAS tiers for ZIP codes')
+    p.add_argument('zips', nargs='+')
+    p.add_argument('--data', default=DAS_ZIPS_PATH)
+    p.set_defaults(func=cmd_das_lookup)
+
+    p = sub.add_parser('benchmark', help='Time startup, re-rating and the rule pass')
+    p.add_argument('--rows', type=int, default=100000)
+    p.add_argument('--imports', action='store_true', help='Only run the import-time check')
+    p.add_argument('--workers', type=int, help='Also time the shared-memory parallel mode')
+    p.add_argument('--kernels', action='store_true',
+                   help='Check the JIT rule kernels against their NumPy paths and time both')
+    p.set_defaults(func=cmd_benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Peak / Demand Surcharge Audit
+Validates peak surcharges against a versioned table of (carrier, charge,
+service group) date windows. Peak charges come from the canonical surcharge
+table (any carrier); each shipment's ship date is matched to its window with
+one vectorized searchsorted, and charges outside every window or above the
+window's amount are flagged with exact recovery
+"""
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings, combine_findings
+from carriers import normalize_surcharges, charge_amounts
+from fuel_audit import DATE_COLUMNS, service_group
+
+WINDOW_COLUMNS = ['Carrier', 'Charge', 'Service_Group', 'Start', 'End', 'Amount']
+
+# Window table charge names, and the canonical charge code each one audits
+PEAK_CHARGE_COLUMNS = ['Peak_Surcharge', 'Peak_Additional_Handling', 'Peak_Large_Package',
+                       'Peak_Over_Maximum']
+PEAK_CHARGE_CODES = {
+    'peak': 'Peak_Surcharge',
+    'peak_additional_handling': 'Peak_Additional_Handling',
+    'peak_large_package': 'Peak_Large_Package',
+    'peak_over_maximum': 'Peak_Over_Maximum',
+}
+
+# Typical season Nov 15 - Jan 15; amounts vary by contract, so the default
+# table only checks the window (Amount NaN = any amount inside the window).
+# Carriers start demand charges on different dates each year, so the analyzer
+# only runs the rule with a dated table; this one is for ad-hoc screening
+DEFAULT_SEASON = ('11-15', '01-15')
+DEFAULT_YEARS = range(2020, 2031)
+
+
+# ========================================
+# PEAK WINDOW TABLE
+# ========================================
+
+class PeakSurchargeTable:
+    """
+    Peak surcharge windows per (carrier, charge, service group)
+    Windows for one key must not overlap; End is inclusive. A table can hold
+    several published versions (Version column); the latest is used unless
+    another is requested
+    """
+
+    def __init__(self, frame, version=None):
+        frame = frame.copy()
+        if 'Version' in frame.columns:
+            version = frame['Version'].max() if version is None else version
+            frame = frame[frame['Version'] == version]
+        self.version = version
+
+        frame = frame[WINDOW_COLUMNS].dropna(subset=WINDOW_COLUMNS[:5]).copy()
+        frame['Carrier'] = frame['Carrier'].astype(str).str.upper()
+        self.keys = sorted(set(zip(frame['Carrier'], frame['Charge'], frame['Service_Group'])))
+        key_codes = self._key_codes(frame['Carrier'], frame['Charge'], frame['Service_Group'])
+        start = pd.to_datetime(frame['Start']).to_numpy('datetime64[D]').astype('int64')
+        end = pd.to_datetime(frame['End']).to_numpy('datetime64[D]').astype('int64')
+
+        # Sorted composite of key (high bits) and window start day (low bits)
+        composite = (key_codes << 32) + start
+        order = np.argsort(composite, kind='stable')
+        self.composite = composite[order]
+        self.end = end[order]
+        self.amounts = frame['Amount'].to_numpy(dtype='float64')[order]
+
+    @classmethod
+    def from_csv(cls, filepath, version=None):
+        """Load a window CSV (Carrier, Charge, Service_Group, Start, End, Amount[, Version])"""
+        return cls(pd.read_csv(filepath), version)
+
+    def _key_codes(self, carriers, charges, groups):
+        index = pd.MultiIndex.from_tuples(self.keys)
+        triples = pd.MultiIndex.from_arrays([np.asarray(carriers, dtype=object),
+                                             np.asarray(charges, dtype=object),
+                                             np.asarray(groups, dtype=object)])
+        return index.get_indexer(triples).astype('int64')
+
+    def lookup(self, carriers, charge, groups, dates):
+        """
+        (in_window, amount) per shipment: whether the ship date falls in a
+        window for the key, and that window's amount (NaN = not limited)
+        """
+        carriers = pd.Series(np.asarray(carriers, dtype=object)).astype(str).str.upper()
+        key_codes = self._key_codes(carriers, np.full(len(carriers), charge, dtype=object), groups)
+        dates = pd.to_datetime(pd.Series(np.asarray(dates)), errors='coerce')
+        days = dates.to_numpy('datetime64[D]').astype('int64')
+
+        pos = np.searchsorted(self.composite, (key_codes << 32) + days, side='right') - 1
+        in_window = (pos >= 0) & (key_codes >= 0) & dates.notna().to_numpy()
+        hit = pos[in_window]
+        in_window[in_window] = ((self.composite[hit] >> 32) == key_codes[in_window]) \
+            & (days[in_window] <= self.end[hit])
+
+        amounts = np.full(len(key_codes), np.nan)
+        amounts[in_window] = self.amounts[pos[in_window]]
+        return in_window, amounts
+
+
+def default_peak_table(carriers=('UPS', 'FEDEX'), groups=('ground', 'air')):
+    """Nov 15 - Jan 15 windows for every year, charge and service group"""
+    start, end = DEFAULT_SEASON
+    rows = [(carrier, charge, group, f'{year}-{start}', f'{year + 1}-{end}', np.nan)
+            for carrier in carriers for charge in PEAK_CHARGE_COLUMNS for group in groups
+            for year in DEFAULT_YEARS]
+    return PeakSurchargeTable(pd.DataFrame(rows, columns=WINDOW_COLUMNS))
+
+
+# ========================================
+# PEAK SURCHARGE RULE
+# ========================================
+
+def audit_peak_surcharges(df, peak_table=None, carrier='UPS', tolerance=0.01, surcharges=None):
+    """
+    Flag peak charges billed outside every window, or above the window's amount
+    surcharges: canonical surcharge table for df (built when omitted)
+    Without a peak_table the default season is only a guess, so charges outside
+    it are reported as low-confidence ('Default Window' rule) at no recovery
+    Returns a findings frame (error type 'invalid_surcharge')
+    """
+    if surcharges is None:
+        surcharges = normalize_surcharges(df, carrier)
+    billed_by_code = charge_amounts(surcharges, df.index, list(PEAK_CHARGE_CODES))
+    if not billed_by_code:
+        return combine_findings([])
+    guessed = peak_table is None
+    peak_table = peak_table or default_peak_table()
+
+    date_col = next((c for c in DATE_COLUMNS if c in df.columns), None)
+    dates = df[date_col] if date_col else pd.Series(pd.NaT, index=df.index)
+    carriers = df['Carrier'] if 'Carrier' in df.columns else np.full(len(df), carrier, dtype=object)
+    groups = service_group(df['Service_Type']) if 'Service_Type' in df.columns \
+        else np.full(len(df), 'ground', dtype=object)
+
+    findings = []
+    for code, billed in billed_by_code.items():
+        charge = PEAK_CHARGE_CODES[code]
+        charged = billed > 0
+        if not charged.any():
+            continue
+        in_window, amounts = peak_table.lookup(carriers, charge, groups, dates)
+        outside = charged & ~in_window
+        over = charged & in_window & ~np.isnan(amounts) & (billed - amounts > tolerance)
+
+        if guessed:
+            findings.append(make_findings(df, outside, 'Peak Surcharge Outside Default Window',
+                                          'invalid_surcharge', billed, billed))
+        else:
+            findings.append(make_findings(df, outside, 'Peak Surcharge Outside Window',
+                                          'invalid_surcharge', billed, 0))
+        findings.append(make_findings(df, over, 'Peak Surcharge Above Window Amount',
+                                      'invalid_surcharge', billed, amounts))
+    return combine_findings(findings)
@@ -0,0 +1,108 @@
+"""
+Recovery Ranking
+Top-K findings by recovery amount, overall, per error type and per account,
+kept with argpartition so ranking costs O(n + K log K) per batch instead of
+a full sort. Rankings update batch by batch and merge across files
+"""
+
+import pandas as pd
+
+from audit_findings import FINDING_COLUMNS, top_k_positions
+
+DEFAULT_TOP_K = 50
+
+
+def top_k(frame, k, column='Recovery_Amount'):
+    """The k rows of frame with the largest column values, largest first"""
+    if frame.empty:
+        return frame
+    return frame.iloc[top_k_positions(frame[column].to_numpy(), k)]
+
+
+def _top_k_per_group(frame, group_col, k):
+    """Largest k rows within each group (rank inside groups, no global sort)"""
+    if frame.empty:
+        return frame
+    parts = [top_k(group, k) for _, group in frame.groupby(group_col, sort=False)]
+    return pd.concat(parts)
+
+
+class RecoveryRanking:
+    """
+    Running top-K of findings: global, per Error_Type and per account
+    Only K rows per key are ever retained, so memory does not grow with input
+    """
+
+    def __init__(self, k=DEFAULT_TOP_K, account_col='Account_Number'):
+        self.k = k
+        self.account_col = account_col
+        self.columns = FINDING_COLUMNS + ['Account', 'Source', 'Row']
+        self._global = pd.DataFrame(columns=self.columns)
+        self._by_type = pd.DataFrame(columns=self.columns)
+        self._by_account = pd.DataFrame(columns=self.columns)
+
+    def add(self, findings, df=None, source=None):
+        """
+        Rank one batch of findings (one rule, one chunk or one file)
+        df: the source frame, used to look up each finding's account
+        """
+        if findings is None or findings.empty:
+            return self
+        batch = findings[FINDING_COLUMNS].copy()
+        batch['Row'] = findings.index
+        batch['Source'] = source
+        if df is not None and self.account_col in df.columns:
+            batch['Account'] = df[self.account_col].reindex(findings.index).to_numpy()
+        else:
+            batch['Account'] = None
+        batch = batch.reset_index(drop=True)
+
+        self._global = top_k(self._concat(self._global, top_k(batch, self.k)), self.k)
+        self._by_type = _top_k_per_group(self._concat(self._by_type, batch), 'Error_Type', self.k)
+        if batch['Account'].notna().any():
+            self._by_account = _top_k_per_group(
+                self._concat(self._by_account, batch[batch['Account'].notna()]), 'Account', self.k)
+        return self
+
+    def merge(self, other):
+        """Combine with a ranking built over other files or workers"""
+        self._global = top_k(self._concat(self._global, other._global), self.k)
+        self._by_type = _top_k_per_group(self._concat(self._by_type, other._by_type),
+                                         'Error_Type', self.k)
+        self._by_account = _top_k_per_group(self._concat(self._by_account, other._by_account),
+                                            'Account', self.k)
+        return self
+
+    def relabel(self, index):
+        """Replace Row positions (e.g. ranked in a worker's row range) with index's labels"""
+        for frame in (self._global, self._by_type, self._by_account):
+            if not frame.empty:
+                frame['Row'] = pd.Index(index)[frame['Row'].to_numpy(dtype='int64')]
+        return self
+
+    @staticmethod
+    def _concat(a, b):
+        frames = [f for f in (a, b) if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else a
+
+    # ----------------------------------------
+    # Results
+    # ----------------------------------------
+
+    def top(self, n=None):
+        """Largest recoveries overall"""
+        return self._global.head(n or self.k).reset_index(drop=True)
+
+    def by_error_type(self, error_type=None, n=None):
+        """Largest recoveries per error type (or for one error type)"""
+        ranked = self._by_type
+        if error_type is not None:
+            ranked = ranked[ranked['Error_Type'] == error_type]
+        return ranked.groupby('Error_Type', sort=False).head(n or self.k).reset_index(drop=True)
+
+    def by_account(self, account=None, n=None):
+        """Largest recoveries per account (or for one account)"""
+        ranked = self._by_account
+        if account is not None:
+            ranked = ranked[ranked['Account'].astype(str) == str(account)]
+        return ranked.groupby('Account', sort=False).head(n or self.k).reset_index(drop=True)
@@ -0,0 +1,234 @@
+"""
+Contract Re-Rating Engine
+Loads published/contract rate tables (service x zone x billable weight) and the
+incentive structure (Earned Discount, Performance Pricing, ...) into NumPy
+lookup arrays, then re-prices whole invoices in one vectorized pass
+"""
+
+import numpy as np
+import pandas as pd
+
+# ========================================
+# BILLABLE WEIGHT
+# ========================================
+
+DOMESTIC_DIM_DIVISOR = 139
+INTERNATIONAL_DIM_DIVISOR = 166
+
+
+def billable_weight(actual_weight, length, width, height, divisor=DOMESTIC_DIM_DIVISOR):
+    """
+    Billable weight for every package: the greater of actual and dimensional
+    weight, rounded up to the next whole pound
+    """
+    actual = np.asarray(actual_weight, dtype='float64')
+    dim = (np.asarray(length, dtype='float64') * np.asarray(width, dtype='float64')
+           * np.asarray(height, dtype='float64')) / divisor
+    return np.ceil(np.fmax(actual, dim))
+
+
+# ========================================
+# RATE TABLES
+# ========================================
+
+class RateTable:
+    """
+    Dense rate lookup array indexed by [service, zone, weight - 1]
+    Missing cells are NaN (shipment cannot be rated from this table)
+    """
+
+    def __init__(self, services, zones, rates):
+        self.services = list(services)
+        self.zones = np.asarray(zones, dtype='int64')
+        self.rates = np.asarray(rates, dtype='float64')
+        self.max_weight = self.rates.shape[2]
+
+        if self.rates.shape[:2] != (len(self.services), len(self.zones)):
+            raise ValueError("Rate array shape does not match services x zones")
+
+        # Zone number -> position in the zone axis (-1 for unknown zones)
+        self.zone_index = np.full(int(self.zones.max()) + 1, -1, dtype='int64')
+        self.zone_index[self.zones] = np.arange(len(self.zones))
+
+    @classmethod
+    def from_frame(cls, frame, service_col='Service', zone_col='Zone',
+                   weight_col='Weight', rate_col='Rate'):
+        """
+        Build a table from long-format rows (one row per service/zone/weight break)
+        A weight break applies to every weight above the previous break
+        """
+        frame = frame[[service_col, zone_col, weight_col, rate_col]].dropna()
+        services = list(pd.unique(frame[service_col].astype(str)))
+        zones = np.sort(pd.unique(frame[zone_col].astype('int64')))
+        max_weight = int(np.ceil(frame[weight_col].max()))
+
+        s = pd.Categorical(frame[service_col].astype(str), categories=services).codes
+        z = np.searchsorted(zones, frame[zone_col].astype('int64').to_numpy())
+        w = np.ceil(frame[weight_col].to_numpy(dtype='float64')).astype('int64') - 1
+
+        rates = np.full((len(services), len(zones), max_weight), np.nan)
+        rates[s, z, w] = frame[rate_col].to_numpy(dtype='float64')
+
+        # Back-fill gaps so each weight takes the rate of the next break up
+        flat = pd.DataFrame(rates.reshape(-1, max_weight)).bfill(axis=1).to_numpy()
+        return cls(services, zones, flat.reshape(rates.shape))
+
+    @classmethod
+    def from_csv(cls, filepath, **columns):
+        """Load a long-format rate table CSV (Service, Zone, Weight, Rate)"""
+        return cls.from_frame(pd.read_csv(filepath), **columns)
+
+    def service_codes(self, services):
+        """Map service names to positions on the service axis (-1 if unknown)"""
+        return pd.Categorical(np.asarray(services, dtype=object).astype(str),
+                              categories=self.services).codes.astype('int64')
+
+    def zone_codes(self, zones):
+        """Map zone numbers to positions on the zone axis (-1 if unknown)"""
+        zones = pd.to_numeric(pd.Series(np.asarray(zones)), errors='coerce').to_numpy()
+        valid = np.isfinite(zones) & (zones >= 0) & (zones < len(self.zone_index))
+        codes = np.full(len(zones), -1, dtype='int64')
+        codes[valid] = self.zone_index[zones[valid].astype('int64')]
+        return codes
+
+    def lookup_codes(self, s, z, weights):
+        """Rate lookup from precomputed service/zone codes"""
+        w = np.ceil(np.asarray(weights, dtype='float64'))
+        valid = (s >= 0) & (z >= 0) & np.isfinite(w) & (w <= self.max_weight)
+        w = np.clip(np.nan_to_num(w, nan=1), 1, self.max_weight).astype('int64') - 1
+
+        result = np.full(len(s), np.nan)
+        result[valid] = self.rates[s[valid], z[valid], w[valid]]
+        return result
+
+    def lookup(self, services, zones, weights):
+        """Vectorized rate lookup for arrays of service, zone and billable weight"""
+        return self.lookup_codes(self.service_codes(services), self.zone_codes(zones), weights)
+
+
+def default_rate_table(max_weight=150):
+    """
+    Published rate table matching the base rates used by the sample generators
+    Useful for demos; real audits should load the carrier's published tables
+    """
+    base_rate = {'GROUND': 15, 'NEXT_DAY_AIR': 85, '2ND_DAY_AIR': 45, '3_DAY_SELECT': 25}
+    per_lb = {'GROUND': 0.9, 'NEXT_DAY_AIR': 2.5, '2ND_DAY_AIR': 1.8, '3_DAY_SELECT': 1.2}
+    zones = np.arange(2, 9)
+    weights = np.arange(1, max_weight + 1)
+
+    services = list(base_rate)
+    base = np.array([base_rate[s] for s in services])[:, None, None]
+    slope = np.array([per_lb[s] for s in services])[:, None, None]
+    zone_factor = (1 + 0.1 * (zones - 2))[None, :, None]
+    rates = np.round((base + slope * weights[None, None, :]) * zone_factor, 2)
+    return RateTable(services, zones, rates)
+
+
+# ========================================
+# DISCOUNTS / INCENTIVES
+# ========================================
+
+# Incentive lines as they appear on carrier invoices
+DISCOUNT_TYPES = ['Earned Discount', 'Performance Pricing', 'Incentive Credit']
+
+
+class DiscountSchedule:
+    """
+    Percentage incentives off the published transportation charge
+    Rows: Service, Discount (e.g. 'Earned Discount'), Percent, optional Zone
+    A row without a zone applies to every zone for that service
+    """
+
+    def __init__(self, frame):
+        frame = frame.copy()
+        if 'Zone' not in frame.columns:
+            frame['Zone'] = np.nan
+        self.frame = frame[['Service', 'Discount', 'Zone', 'Percent']]
+        self.names = list(pd.unique(self.frame['Discount']))
+
+    @classmethod
+    def from_csv(cls, filepath):
+        """Load a discount schedule CSV"""
+        return cls(pd.read_csv(filepath))
+
+    @classmethod
+    def flat(cls, services, percents):
+        """Same incentive percentages for every service, e.g. {'Earned Discount': 20.4}"""
+        rows = [{'Service': s, 'Discount': name, 'Percent': pct}
+                for s in services for name, pct in percents.items()]
+        return cls(pd.DataFrame(rows))
+
+    def compile(self, table):
+        """Lay the schedule out as a [discount, service, zone] fraction array for a rate table"""
+        pct = np.zeros((len(self.names), len(table.services), len(table.zones)))
+        d = pd.Categorical(self.frame['Discount'], categories=self.names).codes
+        s = pd.Categorical(self.frame['Service'].astype(str), categories=table.services).codes
+        z = table.zone_codes(self.frame['Zone'])
+        fraction = self.frame['Percent'].to_numpy(dtype='float64') / 100
+        known = s >= 0
+
+        # Service-wide rows first, zone-specific rows override them
+        wide = known & self.frame['Zone'].isna().to_numpy()
+        pct[d[wide], s[wide], :] = fraction[wide][:, None]
+        zoned = known & (z >= 0)
+        pct[d[zoned], s[zoned], z[zoned]] = fraction[zoned]
+        return pct
+
+
+# ========================================
+# RE-RATING
+# ========================================
+
+class RatingEngine:
+    """
+    Re-prices shipments against published/contract tables and incentives
+    Expected net = contract rate where the contract table has one,
+    otherwise published rate less every incentive percentage
+    """
+
+    def __init__(self, published, discounts=None, contract=None):
+        self.published = published
+        self.contract = contract
+        self.discounts = discounts
+        self.discount_names = discounts.names if discounts is not None else []
+        self.discount_pct = (discounts.compile(published) if discounts is not None
+                             else np.zeros((0, len(published.services), len(published.zones))))
+
+    def rerate(self, df, weight=None, service_col='Service_Type', zone_col='Zone',
+               divisor=DOMESTIC_DIM_DIVISOR):
+        """
+        Expected charges for every row of df
+        weight defaults to the correct billable weight from actual weight and dimensions
+        """
+        if weight is None:
+            weight = billable_weight(df['Actual_Weight'], df['Length'], df['Width'],
+                                     df['Height'], divisor)
+        weight = np.ceil(np.asarray(weight, dtype='float64'))
+
+        s = self.published.service_codes(df[service_col])
+        z = self.published.zone_codes(df[zone_col])
+        published = self.published.lookup_codes(s, z, weight)
+
+        result = pd.DataFrame({'Rated_Weight': weight, 'Expected_Published': published},
+                              index=df.index)
+
+        rated = (s >= 0) & (z >= 0)
+        total_discount = np.zeros(len(df))
+        for i, name in enumerate(self.discount_names):
+            pct = np.zeros(len(df))
+            pct[rated] = self.discount_pct[i, s[rated], z[rated]]
+            amount = np.round(published * pct, 2)
+            result[f"Expected_{name.replace(' ', '_')}"] = -amount
+            total_discount += np.nan_to_num(amount)
+        net = published - total_discount
+
+        if self.contract is not None:
+            contract = self.contract.lookup(df[service_col], df[zone_col], weight)
+            net = np.where(np.isnan(contract), net, contract)
+
+        result['Expected_Net'] = np.round(net, 2)
+        return result
+
+    def expected_net(self, df, weight=None, **kwargs):
+        """Expected net transportation charge as an array"""
+        return self.rerate(df, weight=weight, **kwargs)['Expected_Net'].to_numpy()
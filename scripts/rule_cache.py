@@ -0,0 +1,254 @@
+"""
+Rule Result Cache
+Memoizes each audit rule's findings per (invoice content hash, rule id,
+rule key), where the rule key hashes the rule's version and parameters.
+Findings are stored compactly (packed row bitmasks plus billed/expected/
+recovery arrays) with per-rule totals, so a re-audit after one rule change
+re-evaluates only that rule and re-aggregates everything else from cache
+"""
+
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import FINDING_COLUMNS, empty_findings
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.parcelaudit', 'rule_cache.db')
+
+
+# ========================================
+# KEYS
+# ========================================
+
+def content_hash(df):
+    """
+    Hash of an invoice's normalized content: columns in name order, values
+    only (row labels and column order do not matter)
+    """
+    digest = hashlib.sha1()
+    digest.update(str(len(df)).encode())
+    for col in sorted(df.columns, key=str):
+        digest.update(str(col).encode() + b'\x1f')
+        digest.update(pd.util.hash_pandas_object(df[col], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def resource_key(resource):
+    """
+    Stable identity of a rule resource (table object, DataFrame, file path or
+    plain value). Objects that cannot be pickled must provide cache_key();
+    anything else raises TypeError, since an identity that changes between
+    runs would defeat the cache (and a recycled id() could falsely hit it)
+    """
+    if resource is None or isinstance(resource, (bool, int, float)):
+        return resource
+    if isinstance(resource, str):
+        if os.path.isfile(resource):
+            stat = os.stat(resource)
+            return f'{os.path.abspath(resource)}:{stat.st_size}:{stat.st_mtime_ns}'
+        return resource
+    if isinstance(resource, pd.DataFrame):
+        return content_hash(resource)
+    if hasattr(resource, 'cache_key'):
+        return resource.cache_key()
+    try:
+        return hashlib.sha1(pickle.dumps(resource, protocol=4)).hexdigest()
+    except Exception as e:
+        raise TypeError(f"{type(resource).__name__} has no stable rule cache key "
+                        f"(not picklable: {e}); give it a cache_key() method") from e
+
+
+def rule_key(version, **params):
+    """Hash of a rule's version and parameters (resources reduced with resource_key)"""
+    payload = {'version': version, **{k: resource_key(v) for k, v in params.items()}}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+# ========================================
+# COMPACT FINDINGS ENCODING
+# ========================================
+
+def encode_findings(findings, index):
+    """
+    (groups, payload) for a findings frame over a source frame with this index
+    One group per (Rule, Error_Type): a packed bitmask of flagged rows (plus
+    repeat counts when a row is flagged more than once) and amount arrays in
+    row order. Returns None when findings refer to rows outside the index
+    """
+    index = pd.Index(index)
+    groups, arrays = [], {}
+    if findings is None or findings.empty:
+        return groups, b''
+
+    for i, ((rule, error_type), group) in enumerate(findings.groupby(['Rule', 'Error_Type'],
+                                                                      sort=False)):
+        positions = index.get_indexer(group.index)
+        if (positions < 0).any():
+            return None
+        order = np.argsort(positions, kind='stable')
+        positions = positions[order]
+        counts = np.bincount(positions, minlength=len(index))
+        repeated = bool((counts > 1).any())
+
+        arrays[f'g{i}_mask'] = np.packbits(counts > 0)
+        if repeated:
+            arrays[f'g{i}_repeats'] = counts[counts > 0].astype('int32')
+        for col in ['Billed_Amount', 'Expected_Amount', 'Recovery_Amount']:
+            arrays[f'g{i}_{col}'] = group[col].to_numpy(dtype='float64')[order]
+        groups.append({'rule': rule, 'error_type': error_type, 'count': len(group),
+                       'recovery': float(group['Recovery_Amount'].sum()), 'repeated': repeated})
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return groups, buffer.getvalue()
+
+
+def decode_findings(groups, payload, df):
+    """Rebuild the findings frame encoded for df"""
+    if not groups:
+        return empty_findings()
+    arrays = np.load(io.BytesIO(payload))
+    tracking = (df['Tracking_Number'].to_numpy() if 'Tracking_Number' in df.columns
+                else np.full(len(df), None, dtype=object))
+
+    frames = []
+    for i, group in enumerate(groups):
+        positions = np.flatnonzero(np.unpackbits(arrays[f'g{i}_mask'], count=len(df)))
+        if group['repeated']:
+            positions = np.repeat(positions, arrays[f'g{i}_repeats'])
+        frames.append(pd.DataFrame({
+            'Tracking_Number': tracking[positions],
+            'Rule': group['rule'],
+            'Error_Type': group['error_type'],
+            'Billed_Amount': arrays[f'g{i}_Billed_Amount'],
+            'Expected_Amount': arrays[f'g{i}_Expected_Amount'],
+            'Recovery_Amount': arrays[f'g{i}_Recovery_Amount'],
+        }, index=df.index[positions], columns=FINDING_COLUMNS))
+    return pd.concat(frames)
+
+
+# ========================================
+# CACHE
+# ========================================
+
+class RuleCache:
+    """
+    SQLite store of rule results per invoice content hash
+    A result is reused only when its stored rule key equals the current one;
+    a run record per invoice lists the rule keys of the last full evaluation
+    and the heuristic estimates it reported alongside the findings
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rule_results (
+                content_hash TEXT NOT NULL,
+                rule_id TEXT NOT NULL,
+                rule_key TEXT NOT NULL,
+                groups TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (content_hash, rule_id)
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                content_hash TEXT PRIMARY KEY,
+                rule_keys TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS run_estimates (
+                content_hash TEXT PRIMARY KEY,
+                estimates TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content, rule_id, key, df):
+        """Cached findings frame for df, or None when missing or stale"""
+        row = self.conn.execute(
+            "SELECT groups, payload FROM rule_results "
+            "WHERE content_hash = ? AND rule_id = ? AND rule_key = ?",
+            (content, rule_id, key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode_findings(json.loads(row[0]), row[1], df)
+
+    def put(self, content, rule_id, key, findings, index):
+        encoded = encode_findings(findings, index)
+        if encoded is None:
+            return
+        groups, payload = encoded
+        self.conn.execute("INSERT OR REPLACE INTO rule_results VALUES (?, ?, ?, ?, ?)",
+                          (content, rule_id, key, json.dumps(groups), sqlite3.Binary(payload)))
+        self.conn.commit()
+
+    def record_run(self, content, rule_keys, estimates=()):
+        """Rule keys of a full evaluation, plus its estimate summaries (type, count, savings)"""
+        self.conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?)",
+                          (content, json.dumps(rule_keys, sort_keys=True)))
+        self.conn.execute("INSERT OR REPLACE INTO run_estimates VALUES (?, ?)", (content, json.dumps(
+            [(e['type'], int(e['count']), float(e['potential_savings'])) for e in estimates])))
+        self.conn.commit()
+
+    def run_current(self, content, rule_keys):
+        """True if the last run of this invoice used exactly these rule keys"""
+        row = self.conn.execute("SELECT rule_keys FROM runs WHERE content_hash = ?",
+                                (content,)).fetchone()
+        return row is not None and json.loads(row[0]) == rule_keys
+
+    def totals(self, content, rule_keys):
+        """
+        Per-rule totals of an invoice's cached results under the current rule
+        keys (no invoice data needed); results of rules run with other keys,
+        or that no longer run, are left out
+        """
+        rows = self.conn.execute("SELECT rule_id, rule_key, groups FROM rule_results "
+                                 "WHERE content_hash = ?", (content,)).fetchall()
+        groups = [g for rule_id, key, stored in rows if rule_keys.get(rule_id) == key
+                  for g in json.loads(stored)]
+        return pd.DataFrame([(g['rule'], g['error_type'], g['count'], g['recovery']) for g in groups],
+                            columns=['Rule', 'Error_Type', 'Count', 'Recovery'])
+
+    def estimates(self, content):
+        """Heuristic estimates recorded by an invoice's last run (type, count, savings)"""
+        row = self.conn.execute("SELECT estimates FROM run_estimates WHERE content_hash = ?",
+                                (content,)).fetchone()
+        return pd.DataFrame(json.loads(row[0]) if row else [],
+                            columns=['Estimate', 'Count', 'Savings'])
+
+    # ----------------------------------------
+    # File -> content hash memo (skips parsing unchanged files)
+    # ----------------------------------------
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, content_hash FROM files WHERE path = ?",
+                                (os.path.abspath(path),)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        return None
+
+    def remember_file(self, path, content):
+        stat = os.stat(path)
+        self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                          (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, content))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,147 @@
+"""
+Sample-Based Recovery Estimate
+Fast preview for the free invoice check: streams the invoice once keeping a
+fixed-size random sample per stratum (service type x zone x weight band),
+runs the audit rules on the sample only and extrapolates recoverable dollars
+per error type with stratified confidence intervals
+"""
+
+import numpy as np
+import pandas as pd
+
+from layouts import load_invoice_chunks
+
+# Weight bands (lbs) used for stratification
+WEIGHT_BANDS = [0, 1, 5, 10, 20, 50, 70, 150, np.inf]
+STRATUM_COLUMNS = ['Service_Type', 'Zone']
+
+DEFAULT_PER_STRATUM = 200
+DEFAULT_CHUNKSIZE = 100000
+Z_95 = 1.96
+
+
+def stratum_keys(df):
+    """One string key per row: service | zone | weight band"""
+    parts = [df[c].astype(str) if c in df.columns else pd.Series('', index=df.index)
+             for c in STRATUM_COLUMNS]
+    weight_col = next((c for c in ['Billed_Weight', 'Actual_Weight'] if c in df.columns), None)
+    if weight_col:
+        weight = pd.to_numeric(df[weight_col], errors='coerce').to_numpy(dtype='float64')
+        band = np.searchsorted(WEIGHT_BANDS, weight, side='right')
+        parts.append(pd.Series(band, index=df.index).astype(str))
+    key = parts[0]
+    for part in parts[1:]:
+        key = key + '|' + part
+    return key
+
+
+# ========================================
+# STREAMING STRATIFIED RESERVOIR
+# ========================================
+
+class StratifiedReservoir:
+    """
+    Uniform sample of up to per_stratum rows from every stratum of a stream
+    Bottom-k random keys: each row draws a key and each stratum keeps its k
+    smallest, which is a uniform reservoir sample that can be updated chunk
+    by chunk (and merged across files)
+    """
+
+    def __init__(self, per_stratum=DEFAULT_PER_STRATUM, seed=42):
+        self.per_stratum = per_stratum
+        self.rng = np.random.default_rng(seed)
+        self.sample = None
+        self.counts = pd.Series(dtype='int64')
+
+    def add(self, chunk):
+        chunk = chunk.copy()
+        chunk['_stratum'] = stratum_keys(chunk).to_numpy()
+        chunk['_key'] = self.rng.random(len(chunk))
+        self.counts = self.counts.add(chunk['_stratum'].value_counts(), fill_value=0).astype('int64')
+
+        pool = chunk if self.sample is None else pd.concat([self.sample, chunk], ignore_index=True)
+        pool = pool.sort_values(['_stratum', '_key'], kind='stable')
+        self.sample = pool[pool.groupby('_stratum').cumcount() < self.per_stratum]
+        return self
+
+    def merge(self, other):
+        """Combine with a reservoir built over a disjoint stream"""
+        if other.sample is not None:
+            self.counts = self.counts.add(other.counts, fill_value=0).astype('int64')
+            pool = other.sample if self.sample is None else pd.concat([self.sample, other.sample],
+                                                                      ignore_index=True)
+            pool = pool.sort_values(['_stratum', '_key'], kind='stable')
+            self.sample = pool[pool.groupby('_stratum').cumcount() < self.per_stratum]
+        return self
+
+    @property
+    def rows_seen(self):
+        return int(self.counts.sum())
+
+
+def sample_file(path, per_stratum=DEFAULT_PER_STRATUM, chunksize=DEFAULT_CHUNKSIZE, seed=42):
+    """Stream an invoice file (plain, compressed or archived) into a StratifiedReservoir"""
+    reservoir = StratifiedReservoir(per_stratum, seed)
+    for chunk in load_invoice_chunks(path, chunksize=chunksize):
+        reservoir.add(chunk)
+    return reservoir
+
+
+# ========================================
+# EXTRAPOLATION
+# ========================================
+
+def extrapolate(findings, sample, counts, z=Z_95):
+    """
+    Stratified estimate of total recovery per error type
+    findings: findings frame indexed by sample row; sample: reservoir sample
+    with a '_stratum' column; counts: rows seen per stratum
+    Returns Error_Type, Sample_Findings, Estimated_Recovery, CI_Low, CI_High
+    """
+    strata = sample['_stratum'].to_numpy()
+    n_h = pd.Series(strata).value_counts()
+    N_h = counts.reindex(n_h.index).to_numpy(dtype='float64')
+    n = n_h.to_numpy(dtype='float64')
+    codes = pd.Index(n_h.index).get_indexer(strata)
+
+    rows = []
+    for error_type, group in findings.groupby('Error_Type', sort=False):
+        # Per-row recovery for this error type (0 for rows without a finding)
+        y = np.zeros(len(sample))
+        per_row = group.groupby(level=0)['Recovery_Amount'].sum()
+        y[sample.index.get_indexer(per_row.index)] = per_row.to_numpy()
+
+        sums = np.bincount(codes, weights=y, minlength=len(n))
+        squares = np.bincount(codes, weights=y * y, minlength=len(n))
+        mean = sums / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.where(n > 1, (squares - n * mean ** 2) / (n - 1), 0.0)
+        total = float((N_h * mean).sum())
+        # Finite population correction: fully sampled strata contribute no variance
+        variance = float((N_h ** 2 * (1 - n / N_h) * np.maximum(var, 0) / n).sum())
+        margin = z * np.sqrt(variance)
+        rows.append({
+            'Error_Type': error_type,
+            'Sample_Findings': len(group),
+            'Estimated_Recovery': round(total, 2),
+            'CI_Low': round(max(total - margin, 0.0), 2),
+            'CI_High': round(total + margin, 2),
+        })
+
+    columns = ['Error_Type', 'Sample_Findings', 'Estimated_Recovery', 'CI_Low', 'CI_High']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def estimate_recovery(analyzer, reservoir, z=Z_95):
+    """
+    Run the analyzer's rules on the reservoir sample and extrapolate
+    Only findings-based rules are extrapolated; the estimate-only rules
+    (duplicates, late deliveries) need the whole file
+    """
+    sample = reservoir.sample.reset_index(drop=True)
+    analyzer.df = sample.drop(columns=['_stratum', '_key'])
+    date_columns = [c for c in analyzer.df.columns if 'date' in c.lower()]
+    for col in date_columns:
+        analyzer.df[col] = pd.to_datetime(analyzer.df[col], errors='coerce')
+    analyzer.identify_overcharges()
+    return extrapolate(analyzer.findings, sample, reservoir.counts, z)
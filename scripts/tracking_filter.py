@@ -0,0 +1,276 @@
+"""
+Tracking Number Bloom Filter
+Persistent, memory-mapped Bloom filters of every tracking number ever billed,
+one per account, used to pre-screen new invoices for cross-invoice duplicate
+billing. A filter answers "definitely never billed" or "probably billed";
+only the probable hits go to the exact history for confirmation. Each
+account also keeps the invoices it has absorbed, so recording an invoice
+twice adds nothing and an invoice's own entries are never reported against it
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from history_store import _safe, shipment_keys, UNKNOWN_ACCOUNT
+from audit_findings import make_findings
+
+# Layout:
+#   <root>/account=<account>/layer-<n>.bloom   bit array (memory-mapped)
+#   <root>/account=<account>/layer-<n>.json    bits, hashes, capacity, count
+#   <root>/account=<account>/invoices.npy      sorted invoice hashes already added
+#   <root>/_added.txt                           one line per add() that added anything
+#
+# A full layer is never resized; a new, larger layer is started instead, and
+# probes check every layer of the account. Layer i gets the error rate
+# p * (1 - r) * r^i (p = the filter's error rate, r = TIGHTENING_RATIO), so the
+# account's compound false-positive rate 1 - prod(1 - p_i) stays below p
+# however many layers it grows.
+#
+# Sizing: bits per tracking number = -ln(p_i) / ln(2)^2
+#   p = 5%   ->  9.6 bits in layer 0, +0.46 bits per later layer
+#   p = 20%  ->  6.7 bits in layer 0, +0.46 bits per later layer
+# At the 20% default, 100M tracking numbers on one account fill ~110 MB of
+# layers (~145 MB allocated) and 1.2B spread over accounts of ~1M fill ~1 GB.
+# The total is above a few hundred MB on purpose: layers are memory-mapped
+# and probed per account, so an audit pages in only the accounts on its
+# invoice, and every probable hit is confirmed exactly against the history
+# index, so a looser screen costs binary searches, never false findings.
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.2
+GROWTH_FACTOR = 2
+TIGHTENING_RATIO = 0.8
+
+# Two independent 64-bit hashes; probe i is h1 + i * h2 (double hashing)
+HASH_KEY_1 = 'parcelaudit-blm1'
+HASH_KEY_2 = 'parcelaudit-blm2'
+
+
+def _hashes(values):
+    values = np.asarray(values, dtype=object)
+    h1 = pd.util.hash_array(values, hash_key=HASH_KEY_1, categorize=False)
+    h2 = pd.util.hash_array(values, hash_key=HASH_KEY_2, categorize=False) | np.uint64(1)
+    return h1, h2
+
+
+def _bit_positions(h1, h2, bits, hashes):
+    """(n, hashes) array of bit positions in a filter of the given size"""
+    steps = np.arange(hashes, dtype='uint64')
+    with np.errstate(over='ignore'):
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(bits)
+
+
+class BloomLayer:
+    """One fixed-size Bloom filter backed by a memory-mapped file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '.json') as f:
+            self.meta = json.load(f)
+        self.bits = np.memmap(path + '.bloom', dtype='uint8', mode='r+')
+
+    @classmethod
+    def create(cls, path, capacity, error_rate):
+        bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        bits = (bits + 7) // 8 * 8
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+        meta = {'bits': bits, 'hashes': hashes, 'capacity': capacity,
+                'error_rate': error_rate, 'count': 0}
+        np.zeros(bits // 8, dtype='uint8').tofile(path + '.bloom')
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+        return cls(path)
+
+    @property
+    def full(self):
+        return self.meta['count'] >= self.meta['capacity']
+
+    def add(self, h1, h2):
+        positions = _bit_positions(h1, h2, self.meta['bits'], self.meta['hashes']).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype('uint8')))
+        self.bits.flush()
+        self.meta['count'] += len(h1)
+        with open(self.path + '.json', 'w') as f:
+            json.dump(self.meta, f)
+
+    def contains(self, h1, h2):
+        positions = _bit_positions(h1, h2, self.meta['bits'], self.meta['hashes'])
+        set_bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype('uint8')) & 1
+        return set_bits.all(axis=1)
+
+    def estimated_error_rate(self):
+        m, k, n = self.meta['bits'], self.meta['hashes'], self.meta['count']
+        return (1 - math.exp(-k * n / m)) ** k
+
+
+class TrackingFilter:
+    """Per-account scalable Bloom filters of billed tracking numbers"""
+
+    def __init__(self, root, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 account_col='Account_Number'):
+        self.root = root
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.account_col = account_col
+        self._layers = {}
+        self._invoices = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _account_dir(self, account):
+        return os.path.join(self.root, f'account={_safe(account)}')
+
+    @property
+    def state_path(self):
+        """File that changes whenever the filter does (keys cached cross-invoice results)"""
+        return os.path.join(self.root, '_added.txt')
+
+    def layers(self, account):
+        """Open layers of an account, oldest first (cached)"""
+        if account not in self._layers:
+            directory = self._account_dir(account)
+            names = sorted(n[:-len('.json')] for n in os.listdir(directory)
+                           if n.endswith('.json')) if os.path.isdir(directory) else []
+            self._layers[account] = [BloomLayer(os.path.join(directory, n)) for n in names]
+        return self._layers[account]
+
+    def invoices(self, account):
+        """Sorted hashes of the invoices already added for an account (cached)"""
+        if account not in self._invoices:
+            path = os.path.join(self._account_dir(account), 'invoices.npy')
+            self._invoices[account] = (np.load(path) if os.path.exists(path)
+                                       else np.empty(0, dtype='uint64'))
+        return self._invoices[account]
+
+    def _groups(self, df):
+        accounts = (df[self.account_col].astype(str) if self.account_col in df.columns
+                    else pd.Series(UNKNOWN_ACCOUNT, index=df.index))
+        tracking = df['Tracking_Number'].astype(str).str.strip().to_numpy(dtype=object)
+        for account, rows in pd.Series(np.arange(len(df))).groupby(accounts.to_numpy()):
+            yield account, rows.to_numpy(), tracking[rows.to_numpy()]
+
+    def _contains(self, account, h1, h2):
+        hit = np.zeros(len(h1), dtype=bool)
+        for layer in self.layers(account):
+            hit |= layer.contains(h1, h2)
+        return hit
+
+    def add(self, df):
+        """
+        Record the tracking numbers of billed shipments, skipping invoices
+        already added and numbers the account's layers already hold
+        """
+        _, invoice_hash = shipment_keys(df)
+        added = 0
+        for account, rows, tracking in self._groups(df):
+            known = self.invoices(account)
+            new = ~np.isin(invoice_hash[rows], known)
+            if not new.any():
+                continue
+            h1, h2 = _hashes(pd.unique(tracking[new]))
+            present = self._contains(account, h1, h2)
+            h1, h2 = h1[~present], h2[~present]
+            layers = self.layers(account)
+            start = 0
+            while start < len(h1):
+                if not layers or layers[-1].full:
+                    directory = self._account_dir(account)
+                    os.makedirs(directory, exist_ok=True)
+                    capacity = self.capacity * GROWTH_FACTOR ** len(layers)
+                    error_rate = (self.error_rate * (1 - TIGHTENING_RATIO)
+                                  * TIGHTENING_RATIO ** len(layers))
+                    layers.append(BloomLayer.create(
+                        os.path.join(directory, f'layer-{len(layers) + 1:05d}'),
+                        capacity, error_rate))
+                layer = layers[-1]
+                take = min(len(h1) - start, layer.meta['capacity'] - layer.meta['count'])
+                layer.add(h1[start:start + take], h2[start:start + take])
+                start += take
+
+            directory = self._account_dir(account)
+            os.makedirs(directory, exist_ok=True)
+            self._invoices[account] = np.union1d(known, invoice_hash[rows][new])
+            np.save(os.path.join(directory, 'invoices.npy'), self._invoices[account])
+            added += int(new.sum())
+        if added:
+            with open(self.state_path, 'a') as f:
+                f.write(f'{added}\n')
+        return self
+
+    def might_contain(self, df):
+        """
+        Per row: False = never billed before on this account,
+        True = probably billed before (confirm against the exact history)
+        """
+        result = np.zeros(len(df), dtype=bool)
+        for account, rows, tracking in self._groups(df):
+            if self.layers(account):
+                result[rows] = self._contains(account, *_hashes(tracking))
+        return result
+
+    def invoice_added(self, df):
+        """Per row: True if the row's invoice was already added for its account"""
+        _, invoice_hash = shipment_keys(df)
+        result = np.zeros(len(df), dtype=bool)
+        for account, rows, _ in self._groups(df):
+            result[rows] = np.isin(invoice_hash[rows], self.invoices(account))
+        return result
+
+    def estimated_error_rate(self, account):
+        """Compound false-positive rate of an account's layers at their current fill"""
+        clear = 1.0
+        for layer in self.layers(account):
+            clear *= 1 - layer.estimated_error_rate()
+        return 1 - clear
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(dirpath, name))
+                   for dirpath, _, names in os.walk(self.root) for name in names
+                   if name.endswith('.bloom'))
+
+
+# ========================================
+# CROSS-INVOICE DUPLICATE RULE
+# ========================================
+
+def history_confirm(store):
+    """
+    Exact confirmation against a history_store.HistoryStore: a binary search
+    of the account's sorted tracking index, excluding entries from the same invoice
+    """
+    def confirm(account, tracking_hash, invoice_hash):
+        return store.billed_elsewhere(account, tracking_hash, invoice_hash)
+    return confirm
+
+
+def audit_cross_invoice_duplicates(df, tracking_filter, confirm=None, charge_col='Net_Charge'):
+    """
+    Shipments billed again after appearing on an earlier invoice
+    The Bloom filter screens every row; confirm(account, tracking_hashes,
+    invoice_hashes) -> bool array (see history_confirm) checks only the
+    probable hits. Without it, probable hits are reported at no recovery
+    ('Probable' rule), leaving out rows whose invoice was itself already added
+    to the filter, which the filter cannot tell apart from its own entries
+    Returns a findings frame (error type 'duplicate_charge')
+    """
+    mask = tracking_filter.might_contain(df)
+    billed = (pd.to_numeric(df[charge_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+              if charge_col in df.columns else np.zeros(len(df)))
+    if confirm is None:
+        mask &= ~tracking_filter.invoice_added(df)
+        return make_findings(df, mask, 'Duplicate Charge (Prior Invoice, Probable)',
+                             'duplicate_charge', billed, billed)
+
+    if mask.any():
+        # Keys of the whole frame: an invoice without numbers is keyed by its full content
+        tracking_hash, invoice_hash = (keys[mask] for keys in shipment_keys(df))
+        candidates = df[mask]
+        confirmed = np.zeros(len(candidates), dtype=bool)
+        for account, rows, _ in tracking_filter._groups(candidates):
+            confirmed[rows] = confirm(account, tracking_hash[rows], invoice_hash[rows])
+        mask[np.flatnonzero(mask)] = confirmed
+    return make_findings(df, mask, 'Duplicate Charge (Prior Invoice)', 'duplicate_charge', billed, 0)
@@ -0,0 +1,106 @@
+"""
+Transit Time Audit
+Late deliveries from the ship and delivery dates: business days in transit
+(weekends and carrier holidays excluded) against the service's delivery
+commitment, or the invoice's own Time_In_Transit where it carries one.
+Only money-back guaranteed services are flagged; the refund is the net charge
+"""
+
+import numpy as np
+import pandas as pd
+
+from audit_findings import make_findings, combine_findings
+from kernels import business_days
+
+# Guaranteed services -> committed business days in transit
+SERVICE_COMMITMENTS = {
+    # FedEx (service names as invoiced)
+    'FedEx First Overnight': 1,
+    'FedEx Priority Overnight': 1,
+    'FedEx Standard Overnight': 1,
+    'FedEx 2Day A.M.': 2,
+    'FedEx 2Day': 2,
+    'FedEx Express Saver': 3,
+    # UPS service codes and analyzer service names
+    '14': 1, '01': 1, '13': 1,
+    '59': 2, '02': 2,
+    '12': 3,
+    'NEXT_DAY_AIR': 1,
+    '2ND_DAY_AIR': 2,
+    '3_DAY_SELECT': 3,
+}
+
+SHIP_DATE_COLUMNS = ['Ship_Date', 'Pickup_Date']
+DELIVERY_DATE_COLUMN = 'Delivery_Date'
+
+
+def carrier_holidays(years):
+    """
+    Days (int64 since 1970-01-01) the carriers do not deliver: New Year's Day,
+    Memorial Day, Independence Day, Labor Day, Thanksgiving and Christmas,
+    moved to the Friday/Monday when they fall on a weekend
+    """
+    dates = []
+    for year in years:
+        fixed = [pd.Timestamp(year, 1, 1), pd.Timestamp(year, 7, 4), pd.Timestamp(year, 12, 25)]
+        for day in fixed:
+            if day.weekday() == 5:
+                day -= pd.Timedelta(days=1)
+            elif day.weekday() == 6:
+                day += pd.Timedelta(days=1)
+            dates.append(day)
+        may_31, september_1, november_1 = (pd.Timestamp(year, 5, 31), pd.Timestamp(year, 9, 1),
+                                           pd.Timestamp(year, 11, 1))
+        dates.append(may_31 - pd.Timedelta(days=may_31.weekday()))                          # last Monday
+        dates.append(september_1 + pd.Timedelta(days=-september_1.weekday() % 7))           # first Monday
+        dates.append(november_1 + pd.Timedelta(days=(3 - november_1.weekday()) % 7 + 21))   # 4th Thursday
+    return np.array(dates, dtype='datetime64[D]').astype('int64')
+
+
+def transit_fields(df):
+    """(ship date column, delivery date column) or None"""
+    ship = next((c for c in SHIP_DATE_COLUMNS if c in df.columns), None)
+    if ship is None or DELIVERY_DATE_COLUMN not in df.columns or 'Service_Type' not in df.columns:
+        return None
+    return ship, DELIVERY_DATE_COLUMN
+
+
+def commitments(df):
+    """Committed business days per shipment (NaN = not guaranteed)"""
+    services = df['Service_Type'].astype(str).str.strip()
+    committed = services.map(SERVICE_COMMITMENTS).to_numpy(dtype='float64')
+    if 'Time_In_Transit' in df.columns:
+        stated = pd.to_numeric(df['Time_In_Transit'], errors='coerce').to_numpy(dtype='float64')
+        committed = np.where(~np.isnan(committed) & (stated > 0), stated, committed)
+    return committed
+
+
+def audit_transit_times(df, holidays=None):
+    """
+    Flag guaranteed shipments delivered after their commitment
+    Returns a findings frame (error type 'late_delivery', recovery = net charge)
+    """
+    fields = transit_fields(df)
+    if fields is None:
+        return combine_findings([])
+    ship = pd.to_datetime(df[fields[0]], errors='coerce')
+    delivered = pd.to_datetime(df[fields[1]], errors='coerce')
+    committed = commitments(df)
+    valid = (ship.notna() & delivered.notna()).to_numpy() & ~np.isnan(committed)
+    if not valid.any():
+        return combine_findings([])
+
+    ship_days = ship.to_numpy('datetime64[D]').astype('int64')
+    delivery_days = delivered.to_numpy('datetime64[D]').astype('int64')
+    if holidays is None:
+        years = range(ship[valid].dt.year.min(), delivered[valid].dt.year.max() + 1)
+        holidays = carrier_holidays(years)
+
+    transit = np.zeros(len(df), dtype='int64')
+    transit[valid] = business_days(ship_days[valid], delivery_days[valid], holidays)
+    late = valid & (transit > committed)
+
+    billed = pd.to_numeric(df['Net_Charge'], errors='coerce').fillna(0).to_numpy(dtype='float64') \
+        if 'Net_Charge' in df.columns else np.zeros(len(df))
+    return make_findings(df, late & (billed > 0), 'Service Guarantee Missed', 'late_delivery',
+                         billed, 0)
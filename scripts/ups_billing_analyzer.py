@@ -6,22 +6,116 @@ Identifies overcharges, patterns, and anomalies in shipping costs
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
+import itertools
 import warnings
-warnings.filterwarnings('ignore')
+
+from layouts import load_invoice
+from carriers import normalize, charge_amounts
+from audit_findings import make_findings, combine_findings, summarize_findings
+from rerating import billable_weight
+from fuel_audit import audit_fuel_surcharge
+from address_normalize import address_fields, ORIGINAL_ADDRESS_FIELD_SETS, NORMALIZATION_VERSION
+from address_classification import audit_residential_surcharge
+from address_correction import audit_address_correction
+from adjustments import stream_reconciliation, adjustment_findings, invoice_chunks
+from manifest_reconciliation import (read_manifest, join_manifest, manifest_mismatches,
+                                     manifest_billable_weight, manifest_address_frame,
+                                     audit_manifest_residential, residential_flags)
+from recovery_ranking import RecoveryRanking
+from dimensional_accessorials import audit_dimensional_accessorials
+from peak_surcharges import audit_peak_surcharges
+from transit_audit import audit_transit_times, transit_fields
+from tracking_filter import audit_cross_invoice_duplicates, history_confirm
+from dashboard import compute_dashboard_aggregates, draw_dashboard, render_dashboard
+from rule_cache import content_hash, rule_key, resource_key
+from ups_csv_structure_reference import identify_dim_weight_errors
+
+# Bump a rule's version whenever its logic changes; cached results of older versions are
+# re-evaluated on the next run
+RULE_VERSIONS = {
+    'dim_weight': 1,
+    'dim_weight_calc': 1,
+    'wrong_rate': 1,
+    'duplicates': 1,
+    'cross_invoice': 1,
+    'address_correction': 2,
+    'residential': 2,
+    'residential_classified': 2,
+    'fuel': 2,
+    'adjustments': 1,
+    'late_delivery': 1,
+    'late_delivery_reported': 1,
+    'accessorials': 2,
+    'peak': 2,
+    # Heuristic estimates (no per-shipment findings; reported apart from recoveries)
+    'estimates': 1,
+}
 
 class UPSBillingAnalyzer:
     """
     Analyzes UPS billing data to identify overcharges and patterns
     """
     
-    def __init__(self, filepath=None):
-        """Initialize the analyzer with optional CSV file path"""
+    # Billed weight above this multiple of the dimensional weight is flagged (no manifest)
+    DIM_WEIGHT_FACTOR = 1.5
+    # Billed dimensional weight this many percent off L x W x H / 139 is flagged
+    DIM_ERROR_PCT = 10
+    
+    def __init__(self, filepath=None, rate_engine=None, fuel_rates=None, address_classifier=None,
+                 address_memo=None, manifest=None, tracking_filter=None, history_store=None,
+                 accessorial_thresholds=None, peak_rates=None, rule_cache=None, lane_baselines=None,
+                 originals=None):
+        """
+        Initialize the analyzer with optional CSV file path
+        rate_engine: optional rerating.RatingEngine used to price recoveries exactly
+        fuel_rates: optional fuel_audit.FuelRateTable of published weekly fuel percentages
+        address_classifier: optional address_classification.AddressClassifier
+        address_memo: optional address_correction.NormalizationMemo shared across runs
+        manifest: optional shipping manifest (CSV/Parquet path or DataFrame) used as ground truth
+        tracking_filter: optional tracking_filter.TrackingFilter of previously billed shipments
+        history_store: optional history_store.HistoryStore confirming tracking_filter hits
+        accessorial_thresholds: optional dimensional_accessorials.AccessorialThresholds
+            (published defaults when omitted)
+        peak_rates: optional peak_surcharges.PeakSurchargeTable of dated peak windows (the peak
+            rule only runs with one; carriers' seasons vary too much for a default window)
+        rule_cache: optional rule_cache.RuleCache; rules whose key is unchanged reuse cached findings
+        lane_baselines: optional lane_baselines.LaneBaselines; charges are scored against their lane
+        originals: optional earlier invoice files holding the original shipments that this
+            invoice's adjustment records rebill
+        """
         self.df = None
         self.summary_stats = {}
         self.overcharges = []
+        self.findings = None
+        self.estimates = []
+        self.ranking = None
+        self.shipments = None
+        self.surcharges = None
+        # Billed dollars per canonical charge code the rules gate on ({code: array})
+        self.billed = {}
+        self.rate_engine = rate_engine
+        self.fuel_rates = fuel_rates
+        self.address_classifier = address_classifier
+        self.address_memo = address_memo
+        self.manifest = manifest
+        self.manifest_report = None
+        self.tracking_filter = tracking_filter
+        self.history_store = history_store
+        self.accessorial_thresholds = accessorial_thresholds
+        self.peak_rates = peak_rates
+        self.rule_cache = rule_cache
+        self.lane_baselines = lane_baselines
+        self.originals = list(originals or [])
+        self.anomalies = None
+        self.content_hash = None
+        self._rule_keys = None
+        # Findings per memoized rule id from the last run, and results computed elsewhere
+        # (parallel_audit workers) that identify_overcharges should use instead, with
+        # the billed amounts the workers gated on and their findings' ranking
+        self.rule_results = {}
+        self.precomputed = None
+        self.precomputed_billed = None
+        self.precomputed_ranking = None
         
         # Common UPS charge codes and their descriptions
         self.charge_codes = {
@@ -154,24 +248,22 @@ class UPSBillingAnalyzer:
         
         return df
     
-    def load_data(self, filepath):
-        """Load UPS billing data from CSV file"""
+    def load_data(self, filepath, sample_on_error=True):
+        """
+        Load billing data from a CSV file (.gz/.bz2/.zst/.zip accepted, any known layout)
+        sample_on_error=False raises load errors instead of falling back to generated
+        sample data (never audit made-up data outside the demo)
+        """
         try:
-            # Try to read with different encodings
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                try:
-                    self.df = pd.read_csv(filepath, encoding=encoding, low_memory=False)
-                    print(f"Successfully loaded data with {encoding} encoding")
-                    print(f"Shape: {self.df.shape}")
-                    break
-                except:
-                    continue
-            
-            if self.df is None:
-                raise ValueError("Could not read file with any encoding")
+            # Layout detected from the header; decompresses while parsing
+            self.df = load_invoice(filepath)
+            print(f"Successfully loaded {filepath} ({self.df.attrs.get('layout', 'unknown layout')})")
+            print(f"Shape: {self.df.shape}")
                 
             # Convert date columns
-            date_columns = [col for col in self.df.columns if 'date' in col.lower()]
+            date_columns = [col for col in self.df.columns
+                            if isinstance(col, str) and 'date' in col.lower()
+                            and not pd.api.types.is_datetime64_any_dtype(self.df[col])]
             for col in date_columns:
                 try:
                     self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
@@ -179,43 +271,219 @@ class UPSBillingAnalyzer:
                     pass
                     
         except Exception as e:
+            if not sample_on_error:
+                raise
             print(f"Error loading file: {e}")
             print("Generating sample data instead...")
             self.df = self.generate_sample_data()
     
-    def identify_overcharges(self):
-        """Identify potential overcharges and billing errors"""
+    def rule_keys(self):
+        """Cache key per memoized rule: its version plus every parameter and resource it reads"""
+        dim_weight = rule_key(RULE_VERSIONS['dim_weight'], factor=self.DIM_WEIGHT_FACTOR,
+                              rate_engine=self.rate_engine, manifest=self.manifest)
+        return {
+            'dim_weight': dim_weight,
+            # Rows flagged by dim_weight are left out, so its key is a parameter
+            'dim_weight_calc': rule_key(RULE_VERSIONS['dim_weight_calc'],
+                                        error_pct=self.DIM_ERROR_PCT, manifest=self.manifest,
+                                        dim_weight=dim_weight),
+            'wrong_rate': rule_key(RULE_VERSIONS['wrong_rate'], rate_engine=self.rate_engine),
+            'duplicates': rule_key(RULE_VERSIONS['duplicates']),
+            # Keyed by the history's state: every recorded invoice changes the answer
+            'cross_invoice': rule_key(
+                RULE_VERSIONS['cross_invoice'],
+                tracking_filter=(self.tracking_filter.state_path
+                                 if self.tracking_filter is not None else None),
+                history=self.history_store.state_path if self.history_store is not None else None),
+            'address_correction': rule_key(RULE_VERSIONS['address_correction'],
+                                           normalization=NORMALIZATION_VERSION,
+                                           manifest=self.manifest),
+            'residential': rule_key(RULE_VERSIONS['residential'], manifest=self.manifest),
+            'residential_classified': rule_key(RULE_VERSIONS['residential_classified'],
+                                               manifest=self.manifest,
+                                               classifier=self.address_classifier),
+            'fuel': rule_key(RULE_VERSIONS['fuel'], fuel_rates=self.fuel_rates),
+            'adjustments': rule_key(RULE_VERSIONS['adjustments'],
+                                    originals='|'.join(resource_key(p) for p in self.originals)),
+            'late_delivery': rule_key(RULE_VERSIONS['late_delivery']),
+            'late_delivery_reported': rule_key(RULE_VERSIONS['late_delivery_reported']),
+            'accessorials': rule_key(RULE_VERSIONS['accessorials'],
+                                     thresholds=self.accessorial_thresholds),
+            'peak': rule_key(RULE_VERSIONS['peak'], peak_rates=self.peak_rates),
+            'estimates': rule_key(RULE_VERSIONS['estimates'], manifest=self.manifest,
+                                  classifier=self.address_classifier),
+        }
+    
+    def _memo(self, rule_id, compute):
+        """Findings of one rule: precomputed, from the rule cache when its key is unchanged, or computed"""
+        if self.precomputed is not None and rule_id in self.precomputed:
+            result = self.precomputed[rule_id]
+        elif self.rule_cache is None:
+            result = compute()
+        else:
+            key = self._rule_keys[rule_id]
+            result = self.rule_cache.get(self.content_hash, rule_id, key, self.df)
+            if result is None:
+                result = compute()
+                self.rule_cache.put(self.content_hash, rule_id, key, result, self.df.index)
+        self.rule_results[rule_id] = result
+        return result
+    
+    def identify_overcharges(self, file_rules=True):
+        """
+        Identify potential overcharges and billing errors
+        file_rules=False skips the rules that compare rows across the whole file
+        (duplicates, adjustments, cross-invoice history, late-delivery totals), for
+        evaluating the row-local rules on one slice of an invoice
+        """
         overcharges = []
         
         if self.df is None:
             print("No data loaded. Please load data first.")
             return
         
-        # 1. Check for dimensional weight errors
-        if 'Dimensional_Weight' in self.df.columns and 'Billed_Weight' in self.df.columns:
-            dim_errors = self.df[self.df['Billed_Weight'] > self.df['Dimensional_Weight'] * 1.5]
-            if not dim_errors.empty:
-                overcharges.append({
-                    'type': 'Dimensional Weight Error',
-                    'count': len(dim_errors),
-                    'potential_savings': (dim_errors['Billed_Weight'] - dim_errors['Dimensional_Weight']).sum() * 2.5,
-                    'affected_shipments': dim_errors['Tracking_Number'].tolist()[:5]  # Show first 5
-                })
+        findings = []
+        # Heuristic estimates have no per-shipment findings; they are kept (and cached) apart
+        estimates = []
+        self.rule_results = {}
+        if self.rule_cache is not None:
+            self.content_hash = content_hash(self.df)
+            self._rule_keys = self.rule_keys()
+        
+        # Canonical shipment and surcharge tables shared by the carrier-neutral rules.
+        # When workers evaluated the row-local rules they also hand over the billed
+        # amounts; the file-level rules left for this process never read the tables
+        if self.precomputed_billed is not None:
+            self.shipments = self.surcharges = None
+            billed = self.precomputed_billed
+        else:
+            self.shipments, self.surcharges = normalize(self.df)
+            billed = charge_amounts(self.surcharges, self.df.index,
+                                    ['address_correction', 'residential', 'fuel'])
+        self.billed = billed
         
-        # 2. Check for duplicate charges
-        if 'Tracking_Number' in self.df.columns:
-            duplicates = self.df[self.df.duplicated(['Tracking_Number'], keep=False)]
-            if not duplicates.empty:
-                overcharges.append({
-                    'type': 'Duplicate Charges',
-                    'count': len(duplicates) // 2,
-                    'potential_savings': duplicates.groupby('Tracking_Number')['Net_Charge'].sum().sum() / 2,
-                    'affected_shipments': duplicates['Tracking_Number'].unique()[:5].tolist()
-                })
+        # Our own manifest is ground truth for weight, dimensions, address and residential
+        manifest = None
+        if self.manifest is not None and 'Tracking_Number' in self.df.columns:
+            manifest = join_manifest(self.df, read_manifest(self.manifest))
+            self.manifest_report = manifest_mismatches(self.df, manifest, self.surcharges)
+        
+        # 1. Check for dimensional weight errors
+        def dim_weight_rule():
+            if 'Dimensional_Weight' not in self.df.columns or 'Billed_Weight' not in self.df.columns:
+                return None
+            dim_mask = (self.df['Billed_Weight']
+                        > self.df['Dimensional_Weight'] * self.DIM_WEIGHT_FACTOR).to_numpy()
+            shipped_weight = (manifest_billable_weight(manifest) if manifest is not None
+                              else np.full(len(self.df), np.nan))
+            shipped = ~np.isnan(shipped_weight)
+            dim_mask = np.where(shipped, self.df['Billed_Weight'].to_numpy() > shipped_weight, dim_mask)
+            if not dim_mask.any():
+                return None
+            # Placeholder pricing: $2.50 per overbilled pound
+            correct_weight = np.where(shipped, shipped_weight, self.df['Dimensional_Weight'])
+            billed = (self.df['Billed_Weight'].to_numpy() - correct_weight) * 2.5
+            expected = np.zeros(len(self.df))
+            
+            if self.rate_engine is not None:
+                # Exact recovery: price at the billed weight vs the correct billable weight
+                if {'Length', 'Width', 'Height'}.issubset(self.df.columns):
+                    correct_weight = billable_weight(self.df['Actual_Weight'], self.df['Length'],
+                                                     self.df['Width'], self.df['Height'])
+                else:
+                    correct_weight = np.ceil(np.fmax(self.df['Actual_Weight'],
+                                                     self.df['Dimensional_Weight']))
+                correct_weight = np.where(shipped, shipped_weight, correct_weight)
+                billed_net = self.rate_engine.expected_net(self.df, weight=self.df['Billed_Weight'])
+                correct_net = self.rate_engine.expected_net(self.df, weight=correct_weight)
+                rated = ~np.isnan(billed_net) & ~np.isnan(correct_net)
+                billed = np.where(rated, billed_net, billed)
+                expected = np.where(rated, correct_net, expected)
+                # Re-rating shows when the billed weight was actually correct
+                dim_mask &= ~rated | (billed > expected)
+            
+            return make_findings(self.df, dim_mask, 'Dimensional Weight Error', 'dim_weight',
+                                 billed, expected)
+        
+        dim_findings = self._memo('dim_weight', dim_weight_rule)
+        findings.append(dim_findings)
+        overcharges.extend(summarize_findings(dim_findings))
+        
+        # 1c. Check the billed dimensional weight against the package's own dimensions
+        dim_columns = ['Length', 'Width', 'Height', 'Dimensional_Weight',
+                       'Actual_Weight', 'Billed_Weight']
+        def dim_weight_calc_rule():
+            checked = self.df[dim_columns].apply(pd.to_numeric, errors='coerce')
+            flagged = identify_dim_weight_errors(checked, manifest, error_pct=self.DIM_ERROR_PCT)
+            calculated = checked['Calculated_Dim_Weight']
+            # Overbilled pounds: billed weight above the greater of actual and correct dim weight
+            overbilled = checked['Billed_Weight'] - np.fmax(checked['Actual_Weight'], calculated)
+            calc_mask = (checked.index.isin(flagged.index)
+                         & (checked['Dimensional_Weight'] > calculated) & (overbilled > 0)).to_numpy()
+            # Shipments already priced by rule 1 are not counted twice
+            calc_mask &= ~checked.index.isin(dim_findings.index)
+            # Placeholder pricing: $2.50 per overbilled pound, as in rule 1
+            return make_findings(self.df, calc_mask, 'Dimensional Weight Miscalculated',
+                                 'dim_weight', overbilled.fillna(0).to_numpy() * 2.5, 0)
+        
+        if set(dim_columns).issubset(self.df.columns):
+            calc_findings = self._memo('dim_weight_calc', dim_weight_calc_rule)
+            findings.append(calc_findings)
+            overcharges.extend(summarize_findings(calc_findings))
+        
+        # 1b. Check base transportation charges against the contract rate tables
+        def wrong_rate_rule():
+            weight = self.df['Billed_Weight'] if 'Billed_Weight' in self.df.columns else None
+            expected = self.rate_engine.expected_net(self.df, weight=weight)
+            billed = self.df['Discounted_Charge'].to_numpy(dtype='float64')
+            rate_mask = ~np.isnan(expected) & (billed - expected > 0.01)
+            return make_findings(self.df, rate_mask, 'Incorrect Rate Applied', 'wrong_rate',
+                                 billed, expected)
+        
+        if self.rate_engine is not None and 'Discounted_Charge' in self.df.columns:
+            rate_findings = self._memo('wrong_rate', wrong_rate_rule)
+            findings.append(rate_findings)
+            overcharges.extend(summarize_findings(rate_findings))
+        
+        # 2. Check for duplicate charges (every billing after a tracking number's first)
+        def duplicates_rule():
+            net = (pd.to_numeric(self.df['Net_Charge'], errors='coerce').fillna(0).to_numpy()
+                   if 'Net_Charge' in self.df.columns else np.zeros(len(self.df)))
+            return make_findings(self.df, self.df.duplicated(['Tracking_Number']).to_numpy(),
+                                 'Duplicate Charges', 'duplicate_charge', net, 0)
+        
+        if file_rules and 'Tracking_Number' in self.df.columns:
+            dup_findings = self._memo('duplicates', duplicates_rule)
+            findings.append(dup_findings)
+            overcharges.extend(summarize_findings(dup_findings))
+        
+        # 2b. Check for shipments already billed on an earlier invoice
+        if file_rules and self.tracking_filter is not None and 'Tracking_Number' in self.df.columns:
+            confirm = history_confirm(self.history_store) if self.history_store is not None else None
+            prior_findings = self._memo('cross_invoice', lambda: audit_cross_invoice_duplicates(
+                self.df, self.tracking_filter, confirm))
+            findings.append(prior_findings)
+            overcharges.extend(summarize_findings(prior_findings))
         
         # 3. Check for invalid address correction fees
-        if 'Address_Correction_Fee' in self.df.columns:
-            invalid_addr = self.df[self.df['Address_Correction_Fee'] > 0]
+        original_addresses = ('address_correction' in billed
+                              and address_fields(self.df, ORIGINAL_ADDRESS_FIELD_SETS) is not None)
+        shipped_addresses = (manifest_address_frame(self.df, manifest)
+                             if 'address_correction' in billed
+                             and not original_addresses and manifest is not None else None)
+        if original_addresses:
+            addr_findings = self._memo('address_correction', lambda: audit_address_correction(
+                self.df, self.address_memo, surcharges=self.surcharges))
+            findings.append(addr_findings)
+            overcharges.extend(summarize_findings(addr_findings))
+        elif shipped_addresses is not None:
+            # Compare the corrected address with the address we shipped to
+            addr_findings = self._memo('address_correction', lambda: audit_address_correction(
+                shipped_addresses, self.address_memo, surcharges=self.surcharges))
+            findings.append(addr_findings)
+            overcharges.extend(summarize_findings(addr_findings))
+        elif 'address_correction' in billed:
+            invalid_addr = self.df[billed['address_correction'] > 0]
             if not invalid_addr.empty:
                 # Assume 30% are invalid
                 est_invalid = int(len(invalid_addr) * 0.3)
@@ -225,21 +493,41 @@ class UPSBillingAnalyzer:
                     'potential_savings': est_invalid * 18.00,
                     'affected_shipments': invalid_addr['Tracking_Number'].tolist()[:5]
                 })
+                estimates.append(overcharges[-1])
         
         # 4. Check for late deliveries (eligible for refunds)
-        if 'On_Time_Delivery' in self.df.columns:
-            late_deliveries = self.df[self.df['On_Time_Delivery'] == 0]
-            if not late_deliveries.empty:
-                overcharges.append({
-                    'type': 'Late Delivery Refunds',
-                    'count': len(late_deliveries),
-                    'potential_savings': late_deliveries['Net_Charge'].sum(),
-                    'affected_shipments': late_deliveries['Tracking_Number'].tolist()[:5]
-                })
+        if transit_fields(self.df) is not None:
+            # Business days in transit against the service commitment
+            late_findings = self._memo('late_delivery', lambda: audit_transit_times(self.df))
+            findings.append(late_findings)
+            overcharges.extend(summarize_findings(late_findings))
+        elif file_rules and 'On_Time_Delivery' in self.df.columns:
+            # No delivery dates: trust the carrier's own on-time flag
+            def reported_late_rule():
+                net = (pd.to_numeric(self.df['Net_Charge'], errors='coerce').fillna(0).to_numpy()
+                       if 'Net_Charge' in self.df.columns else np.zeros(len(self.df)))
+                return make_findings(self.df, (self.df['On_Time_Delivery'] == 0).to_numpy(),
+                                     'Late Delivery Refunds', 'late_delivery', net, 0)
+            late_findings = self._memo('late_delivery_reported', reported_late_rule)
+            findings.append(late_findings)
+            overcharges.extend(summarize_findings(late_findings))
         
         # 5. Check for residential surcharges on commercial addresses
-        if 'Residential_Surcharge' in self.df.columns:
-            res_charges = self.df[self.df['Residential_Surcharge'] > 0]
+        unverified = self.df
+        if 'residential' in billed and manifest is not None:
+            res_findings = self._memo('residential', lambda: audit_manifest_residential(
+                self.df, manifest, surcharges=self.surcharges))
+            findings.append(res_findings)
+            overcharges.extend(summarize_findings(res_findings))
+            unverified = self.df[residential_flags(manifest['Manifest_Residential'].to_numpy()) < 0]
+        if ('residential' in billed and self.address_classifier is not None
+                and address_fields(self.df) is not None):
+            res_findings = self._memo('residential_classified', lambda: audit_residential_surcharge(
+                unverified, self.address_classifier, surcharges=self.surcharges))
+            findings.append(res_findings)
+            overcharges.extend(summarize_findings(res_findings))
+        elif 'residential' in billed and manifest is None:
+            res_charges = self.df[billed['residential'] > 0]
             if not res_charges.empty:
                 # Assume 20% are actually commercial
                 est_commercial = int(len(res_charges) * 0.2)
@@ -249,8 +537,57 @@ class UPSBillingAnalyzer:
                     'potential_savings': est_commercial * 5.20,
                     'affected_shipments': res_charges['Tracking_Number'].tolist()[:5]
                 })
+                estimates.append(overcharges[-1])
+        
+        # 6. Check fuel surcharges against the published weekly fuel percentage
+        if self.fuel_rates is not None and 'fuel' in billed:
+            fuel_findings = self._memo('fuel', lambda: audit_fuel_surcharge(
+                self.df, self.fuel_rates, surcharges=self.surcharges))
+            findings.append(fuel_findings)
+            overcharges.extend(summarize_findings(fuel_findings))
+        
+        # 7. Check post-ship adjustments against the original shipment
+        if (file_rules and 'Rebill_Indicator' in self.df.columns
+                and 'Tracking_Number' in self.df.columns):
+            def reconcile():
+                # Originals billed on earlier invoices are indexed first; this invoice's
+                # own originals win on repeats
+                originals = itertools.chain(invoice_chunks(self.originals), [self.df])
+                return combine_findings([adjustment_findings(r)
+                                         for r in stream_reconciliation(originals, [self.df])])
+            adj_findings = self._memo('adjustments', reconcile)
+            findings.append(adj_findings)
+            overcharges.extend(summarize_findings(adj_findings))
+        
+        # 8. Check dimensional accessorials against the package's own dimensions
+        acc_findings = self._memo('accessorials', lambda: audit_dimensional_accessorials(
+            self.df, self.accessorial_thresholds, surcharges=self.surcharges))
+        findings.append(acc_findings)
+        overcharges.extend(summarize_findings(acc_findings))
+        
+        # 9. Check peak surcharges against the published peak windows
+        if self.peak_rates is not None:
+            peak_findings = self._memo('peak', lambda: audit_peak_surcharges(
+                self.df, self.peak_rates, surcharges=self.surcharges))
+            findings.append(peak_findings)
+            overcharges.extend(summarize_findings(peak_findings))
+        
+        # 10. Score charges against their lane's history (for review, not counted as savings)
+        if file_rules and self.lane_baselines is not None:
+            self.anomalies = self.lane_baselines.score(self.df)
         
         self.overcharges = overcharges
+        self.estimates = estimates
+        self.findings = combine_findings(findings)
+        if self.rule_cache is not None:
+            self.rule_cache.record_run(self.content_hash, self._rule_keys, estimates)
+        if self.precomputed_ranking is not None:
+            # The workers ranked their rules' findings; only this process's rules are added
+            own = [f for rule_id, f in self.rule_results.items() if rule_id not in self.precomputed]
+            self.ranking = RecoveryRanking().merge(self.precomputed_ranking).add(
+                combine_findings(own), self.df)
+        else:
+            self.ranking = RecoveryRanking().add(self.findings, self.df)
         return overcharges
     
     def generate_summary_statistics(self):
@@ -284,76 +621,29 @@ class UPSBillingAnalyzer:
         self.summary_stats = summary
         return summary
     
-    def visualize_data(self):
-        """Create visualizations of billing patterns"""
-        if self.df is None:
+    def visualize_data(self, output=None, aggregates=None):
+        """
+        Create visualizations of billing patterns
+        output: write the dashboard to this file (.png/.svg) headlessly instead of showing it
+        aggregates: precomputed/merged dashboard.compute_dashboard_aggregates result
+        """
+        if self.df is None and aggregates is None:
             print("No data loaded.")
             return
         
-        fig, axes = plt.subplots(2, 3, figsize=(15, 10))
-        fig.suptitle('UPS Billing Analysis Dashboard', fontsize=16, fontweight='bold')
+        if aggregates is None:
+            aggregates = compute_dashboard_aggregates(self.df)
         
-        # 1. Charges over time
-        if 'Invoice_Date' in self.df.columns and 'Net_Charge' in self.df.columns:
-            daily_charges = self.df.groupby(pd.Grouper(key='Invoice_Date', freq='D'))['Net_Charge'].sum()
-            axes[0, 0].plot(daily_charges.index, daily_charges.values)
-            axes[0, 0].set_title('Daily Shipping Charges')
-            axes[0, 0].set_xlabel('Date')
-            axes[0, 0].set_ylabel('Total Charges ($)')
-            axes[0, 0].tick_params(axis='x', rotation=45)
+        if output is not None:
+            render_dashboard(aggregates, output)
+            print(f"Dashboard written to {output}")
+            return output
         
-        # 2. Service type distribution
-        if 'Service_Type' in self.df.columns:
-            service_counts = self.df['Service_Type'].value_counts()
-            axes[0, 1].bar(service_counts.index, service_counts.values)
-            axes[0, 1].set_title('Shipments by Service Type')
-            axes[0, 1].set_xlabel('Service Type')
-            axes[0, 1].set_ylabel('Count')
-            axes[0, 1].tick_params(axis='x', rotation=45)
-        
-        # 3. Weight distribution
-        if 'Actual_Weight' in self.df.columns:
-            axes[0, 2].hist(self.df['Actual_Weight'], bins=30, edgecolor='black')
-            axes[0, 2].set_title('Weight Distribution')
-            axes[0, 2].set_xlabel('Weight (lbs)')
-            axes[0, 2].set_ylabel('Frequency')
-        
-        # 4. Zone distribution
-        if 'Zone' in self.df.columns:
-            zone_counts = self.df['Zone'].value_counts().sort_index()
-            axes[1, 0].bar(zone_counts.index.astype(str), zone_counts.values)
-            axes[1, 0].set_title('Shipments by Zone')
-            axes[1, 0].set_xlabel('Zone')
-            axes[1, 0].set_ylabel('Count')
-        
-        # 5. Surcharge breakdown
-        surcharge_cols = ['Residential_Surcharge', 'Address_Correction_Fee', 
-                         'Large_Package_Surcharge', 'Additional_Handling', 
-                         'Fuel_Surcharge', 'Peak_Surcharge']
-        surcharge_totals = []
-        surcharge_labels = []
-        for col in surcharge_cols:
-            if col in self.df.columns:
-                total = self.df[col].sum()
-                if total > 0:
-                    surcharge_totals.append(total)
-                    surcharge_labels.append(col.replace('_', ' '))
-        
-        if surcharge_totals:
-            axes[1, 1].pie(surcharge_totals, labels=surcharge_labels, autopct='%1.1f%%')
-            axes[1, 1].set_title('Surcharge Distribution')
-        
-        # 6. Actual vs Dimensional Weight
-        if 'Actual_Weight' in self.df.columns and 'Dimensional_Weight' in self.df.columns:
-            sample = self.df.sample(min(100, len(self.df)))
-            axes[1, 2].scatter(sample['Actual_Weight'], sample['Dimensional_Weight'], alpha=0.5)
-            axes[1, 2].plot([0, 150], [0, 150], 'r--', label='Equal weights')
-            axes[1, 2].set_title('Actual vs Dimensional Weight')
-            axes[1, 2].set_xlabel('Actual Weight (lbs)')
-            axes[1, 2].set_ylabel('Dimensional Weight (lbs)')
-            axes[1, 2].legend()
-        
-        plt.tight_layout()
+        # Plotting libraries only load when a dashboard is actually drawn
+        import matplotlib.pyplot as plt
+        
+        fig = plt.figure(figsize=(15, 10))
+        draw_dashboard(fig, aggregates)
         plt.show()
     
     def export_audit_report(self, filename='ups_audit_report.xlsx'):
@@ -412,6 +702,8 @@ class UPSBillingAnalyzer:
 # Example usage
 def main():
     """Main function to demonstrate the analyzer"""
+    warnings.filterwarnings('ignore')
+    
     print("UPS Billing Analysis Tool")
     print("="*60)
     
@@ -7,6 +7,9 @@ and provides specific examples of common overcharges
 import pandas as pd
 import numpy as np
 
+from fuel_audit import service_group
+from peak_surcharges import default_peak_table
+
 # ========================================
 # UPS CSV COLUMN STRUCTURE (Key Fields)
 # ========================================
@@ -206,22 +209,31 @@ def calculate_dimensional_weight(length, width, height, divisor=139):
     """
     return (length * width * height) / divisor
 
-def identify_dim_weight_errors(df):
-    """Identify dimensional weight calculation errors"""
+def identify_dim_weight_errors(df, manifest=None, error_pct=10):
+    """
+    Identify dimensional weight calculation errors
+    manifest: optional frame from manifest_reconciliation.join_manifest; where our
+    manifest has dimensions they replace the carrier's as the correct measurement
+    error_pct: billed vs calculated dim weight difference (%) flagged as an error
+    """
     
-    # Calculate what dim weight should be
-    df['Calculated_Dim_Weight'] = df.apply(
-        lambda row: calculate_dimensional_weight(
-            row['Length'], row['Width'], row['Height']
-        ), axis=1
-    )
+    # Calculate what dim weight should be (whole columns at once)
+    length, width, height = df['Length'], df['Width'], df['Height']
+    if manifest is not None:
+        shipped = manifest[['Manifest_Length', 'Manifest_Width', 'Manifest_Height']].apply(
+            pd.to_numeric, errors='coerce')
+        known = shipped.notna().all(axis=1)
+        length = length.where(~known, shipped['Manifest_Length'])
+        width = width.where(~known, shipped['Manifest_Width'])
+        height = height.where(~known, shipped['Manifest_Height'])
+    df['Calculated_Dim_Weight'] = calculate_dimensional_weight(length, width, height)
     
     # Find discrepancies
     df['Dim_Weight_Error'] = abs(df['Dimensional_Weight'] - df['Calculated_Dim_Weight'])
     df['Dim_Weight_Error_Pct'] = (df['Dim_Weight_Error'] / df['Calculated_Dim_Weight']) * 100
     
-    # Flag significant errors (>10% difference)
-    df['Potential_Overcharge'] = df['Dim_Weight_Error_Pct'] > 10
+    # Flag significant errors (>10% difference by default)
+    df['Potential_Overcharge'] = df['Dim_Weight_Error_Pct'] > error_pct
     
     return df[df['Potential_Overcharge']]
 
@@ -268,62 +280,63 @@ UPS_SURCHARGE_CODES = {
 # QUICK AUDIT CHECKLIST
 # ========================================
 
-def quick_audit_checklist(csv_file_path):
+def quick_audit_checklist(csv_file_path, peak_table=None):
     """
-    Quick checklist for auditing UPS billing CSV
+    Quick checklist for auditing a billing CSV (plain, .gz/.bz2/.zst or .zip)
+    The layout (UPS 250-column headerless, FedEx export, ...) is detected and
+    mapped to the canonical column names
     Returns potential issues to investigate
     """
+    # Imported here: the layout registry is built from UPS_KEY_COLUMNS above
+    from layouts import load_invoice
     
     issues_found = []
-    
-    # Load the CSV (assuming 250 columns, no headers)
-    df = pd.read_csv(csv_file_path, header=None)
-    
-    # Map columns (you'll need to adjust based on your specific format)
-    # This is a simplified example
+    df = load_invoice(csv_file_path)
+    if 'layout' not in df.attrs:
+        # Read as-is: only checks whose canonical columns happen to be present run
+        issues_found.append("Unrecognized invoice layout: columns not mapped, "
+                            "checks needing missing columns were skipped")
     
     # 1. Check for duplicates
-    tracking_col = 11  # Adjust to your tracking number column
-    duplicates = df[df.duplicated(subset=[tracking_col], keep=False)]
-    if not duplicates.empty:
-        issues_found.append(f"Found {len(duplicates)} duplicate tracking numbers")
+    if 'Tracking_Number' in df.columns:
+        duplicates = df[df.duplicated(subset=['Tracking_Number'], keep=False)]
+        if not duplicates.empty:
+            issues_found.append(f"Found {len(duplicates)} duplicate tracking numbers")
     
     # 2. Check dimensional weight vs actual weight
-    actual_weight_col = 48
-    dim_weight_col = 58
-    billed_weight_col = 47
-    
-    # Find cases where billed weight > both actual and dim weight
-    overcharged_weight = df[
-        (df[billed_weight_col] > df[actual_weight_col]) & 
-        (df[billed_weight_col] > df[dim_weight_col] * 1.1)
-    ]
-    if not overcharged_weight.empty:
-        issues_found.append(f"Found {len(overcharged_weight)} potential weight overcharges")
+    if {'Billed_Weight', 'Actual_Weight', 'Dimensional_Weight'}.issubset(df.columns):
+        # Find cases where billed weight > both actual and dim weight
+        overcharged_weight = df[
+            (df['Billed_Weight'] > df['Actual_Weight']) & 
+            (df['Billed_Weight'] > df['Dimensional_Weight'] * 1.1)
+        ]
+        if not overcharged_weight.empty:
+            issues_found.append(f"Found {len(overcharged_weight)} potential weight overcharges")
     
     # 3. Check for address corrections
-    addr_correction_col = 88
-    addr_corrections = df[df[addr_correction_col] > 0]
-    if not addr_corrections.empty:
-        issues_found.append(f"Found {len(addr_corrections)} address correction charges to verify")
+    if 'Address_Correction_Fee' in df.columns:
+        addr_corrections = df[df['Address_Correction_Fee'] > 0]
+        if not addr_corrections.empty:
+            issues_found.append(f"Found {len(addr_corrections)} address correction charges to verify")
     
     # 4. Check for late deliveries (compare guaranteed vs actual)
-    service_col = 19
     guaranteed_services = ['01', '02', '13', '14']  # Next Day, 2-Day, etc.
-    premium_shipments = df[df[service_col].isin(guaranteed_services)]
+    if 'Service_Type' in df.columns:
+        premium_shipments = df[df['Service_Type'].isin(guaranteed_services)]
     
     # Would need to compare dates here
     # This is simplified - you'd calculate actual vs promised delivery
     
     # 5. Check for off-season peak charges
-    peak_charge_col = 87
-    invoice_date_col = 4
-    
-    # Convert date and check if peak charges outside Nov-Jan
-    df['invoice_month'] = pd.to_datetime(df[invoice_date_col], format='%Y%m%d').dt.month
-    invalid_peak = df[(df[peak_charge_col] > 0) & ~df['invoice_month'].isin([11, 12, 1])]
-    if not invalid_peak.empty:
-        issues_found.append(f"Found {len(invalid_peak)} peak charges outside peak season")
+    if {'Peak_Surcharge', 'Service_Type', 'Carrier', 'Invoice_Date'}.issubset(df.columns):
+        # Match each ship date to the published peak windows (Nov 15 - Jan 15 by default)
+        peak_table = peak_table or default_peak_table()
+        groups = service_group(df['Service_Type'].astype(str).str.zfill(2))
+        in_window, _ = peak_table.lookup(df['Carrier'], 'Peak_Surcharge', groups,
+                                         df['Invoice_Date'])
+        invalid_peak = df[(df['Peak_Surcharge'] > 0).to_numpy() & ~in_window]
+        if not invalid_peak.empty:
+            issues_found.append(f"Found {len(invalid_peak)} peak charges outside peak season")
     
     return issues_found
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts are flat modules that import each other as siblings
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
@@ -0,0 +1,32 @@
+"""Import-time regression test: starting the CLI must not load pandas/NumPy/plotting"""
+
+import subprocess
+import sys
+
+from parcelaudit import HEAVY_MODULES, SCRIPTS_DIR
+
+CHECK = """
+import sys
+import parcelaudit
+try:
+    parcelaudit.main(['--help'])
+except SystemExit:
+    pass
+print('LOADED:' + ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def _loaded(code):
+    out = subprocess.run([sys.executable, '-c', code], cwd=SCRIPTS_DIR,
+                         capture_output=True, text=True, check=True).stdout
+    line = next(l for l in out.splitlines() if l.startswith('LOADED:'))
+    return [m for m in line[len('LOADED:'):].split(',') if m]
+
+
+def test_help_loads_no_heavy_modules():
+    assert _loaded(CHECK.format(heavy=HEAVY_MODULES)) == []
+
+
+def test_subcommand_help_loads_no_heavy_modules():
+    code = CHECK.format(heavy=HEAVY_MODULES).replace("['--help']", "['audit', '--help']")
+    assert _loaded(code) == []
@@ -0,0 +1,78 @@
+"""Each kernel's loop, run as plain Python, must match its NumPy fallback"""
+
+import numpy as np
+import pytest
+
+import kernels
+
+ROWS = 2000
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(11)
+
+
+def _sides(rng):
+    sides = rng.uniform(1, 120, (3, ROWS))
+    # NaN in every position, including all three sides of some packages
+    sides[:, rng.random(ROWS) < 0.05] = np.nan
+    for i in range(3):
+        sides[i, rng.random(ROWS) < 0.05] = np.nan
+    # Ties and whole inches exercise the compare-swaps and the rounding
+    sides[:, :20] = 24.0
+    sides[1, 20:40] = sides[0, 20:40]
+    return sides
+
+
+def test_measurements_loop_matches_numpy(rng):
+    sides = _sides(rng)
+    weight = rng.uniform(0.1, 150, ROWS)
+    weight[rng.random(ROWS) < 0.05] = np.nan
+    expected = kernels.measurements.fallback(sides[0], sides[1], sides[2], weight)
+    looped = kernels.measurements.loop(sides[0], sides[1], sides[2], weight)
+    np.testing.assert_array_equal(looped, expected)
+
+
+def test_thresholds_met_loop_matches_numpy(rng):
+    sides = _sides(rng)
+    measured = kernels.measurements.fallback(sides[0], sides[1], sides[2],
+                                             rng.uniform(0.1, 150, ROWS))
+    limits = np.tile(np.array([48.0, 30.0, 105.0, 50.0]), (ROWS, 1))
+    limits[rng.random(ROWS) < 0.3, 2] = np.nan
+    limits[rng.random(ROWS) < 0.05] = np.nan
+    expected = kernels.thresholds_met.fallback(measured, limits)
+    looped = kernels.thresholds_met.loop(measured, limits)
+    np.testing.assert_array_equal(looped, expected)
+    assert np.isnan(expected).any() and (expected == 0).any() and (expected == 1).any()
+
+
+def test_business_days_loop_matches_numpy(rng):
+    ship = rng.integers(19000, 21000, ROWS)
+    # Same-day, forward and backwards ranges (delivery before ship)
+    delivered = ship + rng.integers(-10, 15, ROWS)
+    holidays = np.arange(19000, 21000, 45)
+    start, end = ship + 1, delivered + 1
+    weekday_holidays = holidays[(holidays + 3) % 7 < 5]
+    expected = kernels._business_days.fallback(start, end, weekday_holidays)
+    looped = kernels._business_days.loop(start, end, weekday_holidays)
+    np.testing.assert_array_equal(looped, expected)
+    assert (expected < 0).any() and (expected == 0).any()
+
+
+def test_business_days_matches_busday_count(rng):
+    ship = rng.integers(19000, 21000, ROWS)
+    delivered = ship + rng.integers(-10, 15, ROWS)
+    holidays = np.arange(19000, 21000, 45)
+    counted = kernels.business_days(ship, delivered, holidays, jit=False)
+    expected = np.busday_count((ship + 1).astype('datetime64[D]'),
+                               (delivered + 1).astype('datetime64[D]'),
+                               holidays=holidays.astype('datetime64[D]'))
+    np.testing.assert_array_equal(counted, expected)
+
+
+def test_self_check_skips_without_numba(monkeypatch):
+    monkeypatch.setattr(kernels, '_numba', False)
+    for result in kernels.self_check(rows=1000):
+        assert result['jit'] is None
+        assert result['equal'] is None
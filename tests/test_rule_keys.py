@@ -0,0 +1,58 @@
+"""Rule cache keys must be identical in every process, or re-audits never hit the cache"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from parcelaudit import SCRIPTS_DIR
+
+KEYS = """
+import json
+from address_classification import AddressCache, AddressClassifier
+from fuel_audit import FuelRateTable
+from history_store import HistoryStore
+from peak_surcharges import PeakSurchargeTable
+from rerating import RateTable, RatingEngine
+from tracking_filter import TrackingFilter
+from ups_billing_analyzer import UPSBillingAnalyzer
+
+root = {root!r}
+analyzer = UPSBillingAnalyzer(
+    rate_engine=RatingEngine(RateTable.from_csv(root + '/rates.csv')),
+    fuel_rates=FuelRateTable.from_csv(root + '/fuel.csv'),
+    peak_rates=PeakSurchargeTable.from_csv(root + '/peak.csv'),
+    address_classifier=AddressClassifier(AddressCache(root + '/address_cache.db')),
+    manifest=root + '/manifest.csv',
+    tracking_filter=TrackingFilter(root + '/history/tracking_filter'),
+    history_store=HistoryStore(root + '/history/shipments'))
+print('KEYS:' + json.dumps(analyzer.rule_keys(), sort_keys=True))
+"""
+
+
+def _keys(root, seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    out = subprocess.run([sys.executable, '-c', KEYS.format(root=str(root))], cwd=SCRIPTS_DIR,
+                         env=env, capture_output=True, text=True, check=True).stdout
+    line = next(l for l in out.splitlines() if l.startswith('KEYS:'))
+    return json.loads(line[len('KEYS:'):])
+
+
+def test_rule_keys_match_across_processes(tmp_path):
+    pd.DataFrame({'Service': ['GROUND'] * 2, 'Zone': [2, 3], 'Weight': [1, 1],
+                  'Rate': [9.5, 10.25]}).to_csv(tmp_path / 'rates.csv', index=False)
+    pd.DataFrame({'Carrier': ['UPS', 'UPS'], 'Service_Group': ['ground', 'air'],
+                  'Effective_Date': ['2024-01-01'] * 2,
+                  'Percent': [14.5, 17.0]}).to_csv(tmp_path / 'fuel.csv', index=False)
+    pd.DataFrame({'Carrier': ['UPS', 'FEDEX'], 'Charge': ['peak', 'peak'],
+                  'Service_Group': ['ground', 'ground'], 'Start': ['2024-10-27'] * 2,
+                  'End': ['2025-01-18'] * 2,
+                  'Amount': [0.4, 0.45]}).to_csv(tmp_path / 'peak.csv', index=False)
+    pd.DataFrame({'Tracking_Number': ['1Z1', '1Z2'],
+                  'Weight': [2.0, 3.5]}).to_csv(tmp_path / 'manifest.csv', index=False)
+
+    first, second = _keys(tmp_path, 1), _keys(tmp_path, 2)
+    assert first == second
+    assert set(first) >= {'residential_classified', 'estimates', 'cross_invoice', 'peak'}